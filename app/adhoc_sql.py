@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Read-only re-execution of the SQL an agent run generated
+
+/run-details returns the query that retrieved a run's data, but only the
+agent's preview of its rows (at most 10). Getting the full result used to
+take another agent run. POST /runs/<thread_id>/<run_id>/execute-sql (and
+FabricDataAgentClient.rerun_sql) run the extracted query directly against
+the warehouse instead. The query text comes from an agent, so it is only
+run when:
+
+- it is a single SELECT (or WITH ... SELECT) statement, and
+- outside string literals, quoted identifiers and comments, it contains no
+  keyword that writes, executes code or reaches outside the warehouse
+  (INSERT, UPDATE, MERGE, SELECT ... INTO, EXEC, OPENROWSET, ...).
+
+The leading SELECT is capped with TOP (max_rows + 1), so the warehouse stops
+at the cap and the extra row tells a complete result from a truncated one;
+fetching is capped at max_rows (and the usual byte budget) either way.
+
+Results are cached by a hash of the normalized statement (comments dropped,
+whitespace collapsed, case folded outside literals), so the same query from
+different runs or with different formatting runs once per EXECUTE_SQL_CACHE_TTL.
+
+Settings (environment variables): EXECUTE_SQL_MAX_ROWS,
+EXECUTE_SQL_CACHE_TTL, EXECUTE_SQL_CACHE_SIZE.
+"""
+
+import os
+import re
+import time
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+MAX_ROWS = int(os.getenv('EXECUTE_SQL_MAX_ROWS', '10000'))
+CACHE_TTL = float(os.getenv('EXECUTE_SQL_CACHE_TTL', '300'))
+CACHE_SIZE = int(os.getenv('EXECUTE_SQL_CACHE_SIZE', '32'))
+
+# Comments, string literals, quoted identifiers, words, and any other character
+TOKEN = re.compile(
+    r"--[^\n]*|/\*.*?\*/"
+    r"|N?'(?:[^']|'')*'|\[(?:[^\]]|\]\])*\]|\"(?:[^\"]|\"\")*\""
+    r"|[A-Za-z_@#][\w@#$]*|\d+(?:\.\d+)?|\S",
+    re.DOTALL
+)
+
+WORD = re.compile(r"^[A-Za-z_@#][\w@#$]*$")
+NUMBER = re.compile(r"^\d+(?:\.\d+)?$")
+
+FORBIDDEN = {
+    'insert', 'update', 'delete', 'merge', 'truncate', 'drop', 'alter', 'create',
+    'into', 'exec', 'execute', 'sp_executesql', 'grant', 'revoke', 'deny',
+    'openrowset', 'openquery', 'opendatasource', 'bulk', 'dbcc', 'backup', 'restore',
+    'shutdown', 'kill', 'waitfor', 'use', 'declare', 'set', 'begin', 'commit', 'rollback'
+}
+
+# SQL_COPT_SS_ACCESS_TOKEN: pre-connect attribute for an Azure AD access token
+SQL_COPT_SS_ACCESS_TOKEN = 1256
+
+
+class UnsafeSqlError(ValueError):
+    """Raised for SQL that is not a single read-only SELECT statement."""
+
+
+def _tokens(sql):
+    """(token, start, end) for each token of sql, without comments."""
+    return [(match.group(), match.start(), match.end())
+            for match in TOKEN.finditer(sql)
+            if not match.group().startswith(('--', '/*'))]
+
+
+def _is_word(token):
+    return WORD.match(token) is not None
+
+
+def normalize(sql, literals=True):
+    """
+    Statement text with comments dropped, whitespace collapsed and words casefolded, for hashing.
+    With literals=False, string and number literals are replaced by ?.
+    """
+    tokens = []
+    for token, _, _ in _tokens(sql):
+        if not literals and (token.startswith(("'", "N'")) or NUMBER.match(token)):
+            tokens.append('?')
+        else:
+            tokens.append(token.casefold() if _is_word(token) else token)
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    return ' '.join(tokens)
+
+
+def sql_hash(sql):
+    """Cache key of a statement: SHA-256 of its normalized text."""
+    return hashlib.sha256(normalize(sql).encode('utf-8')).hexdigest()
+
+
+def fingerprint(sql):
+    """Key of a query whatever values it filters on: a hash of its normalized text without literals."""
+    return hashlib.sha256(normalize(sql, literals=False).encode('utf-8')).hexdigest()[:16]
+
+
+def check_read_only(sql):
+    """
+    Validate that sql is a single read-only SELECT statement.
+
+    Returns:
+        str: The statement without trailing semicolons
+
+    Raises:
+        UnsafeSqlError: For empty, multi-statement or non-SELECT SQL
+    """
+    tokens = _tokens(sql or '')
+    while tokens and tokens[-1][0] == ';':
+        tokens.pop()
+    if not tokens:
+        raise UnsafeSqlError("No SQL to execute")
+    if any(token == ';' for token, _, _ in tokens):
+        raise UnsafeSqlError("Only a single statement can be executed")
+    first = tokens[0][0].casefold()
+    if first not in ('select', 'with'):
+        raise UnsafeSqlError(f"Only SELECT statements can be executed, not {tokens[0][0].upper()}")
+    for token, _, _ in tokens:
+        word = token.casefold()
+        if _is_word(token) and (word in FORBIDDEN or word.startswith(('sp_', 'xp_'))):
+            raise UnsafeSqlError(f"SQL containing {token.upper()} cannot be executed")
+    return sql[:tokens[-1][2]].strip()
+
+
+def with_row_cap(sql, limit):
+    """
+    sql with TOP (limit) added to its leading SELECT, unless it has a TOP already.
+    WITH statements and OFFSET/FETCH paging (which cannot be combined with TOP)
+    are returned unchanged; fetching is capped instead.
+    """
+    tokens = _tokens(sql)
+    if not tokens or tokens[0][0].casefold() != 'select':
+        return sql
+    if any(token.casefold() == 'offset' for token, _, _ in tokens):
+        return sql
+    position = 1
+    if len(tokens) > 1 and tokens[1][0].casefold() in ('distinct', 'all'):
+        position = 2
+    if len(tokens) > position and tokens[position][0].casefold() == 'top':
+        return sql
+    insert_at = tokens[position - 1][2]
+    return f"{sql[:insert_at]} TOP ({int(limit)}){sql[insert_at:]}"
+
+
+def access_token_attrs(access_token):
+    """pyodbc attrs_before that log in with an Azure AD access token (UTF-16-LE, length-prefixed)."""
+    token_bytes = access_token.encode('utf-16-le')
+    return {SQL_COPT_SS_ACCESS_TOKEN: struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)}
+
+
+def connection_string(server, database, driver='ODBC Driver 18 for SQL Server', port=1433,
+                      encrypt=True, trust_server_certificate=False):
+    """ODBC connection string for a warehouse, without authentication."""
+    return (
+        f"Driver={{{driver}}};"
+        f"Server={server},{port};"
+        f"Database={database};"
+        f"Encrypt={'yes' if encrypt else 'no'};"
+        f"TrustServerCertificate={'yes' if trust_server_certificate else 'no'};"
+    )
+
+
+def select_query(sql_queries, data_retrieval_query=None, query_index=None):
+    """
+    The query to re-execute: the 1-based query_index of sql_queries, else the data retrieval query,
+    else the last query. None if there is none.
+    """
+    if query_index is not None:
+        index = int(query_index)
+        if index < 1 or index > len(sql_queries):
+            raise ValueError(f"query_index must be between 1 and {len(sql_queries)}")
+        return sql_queries[index - 1]
+    if data_retrieval_query:
+        return data_retrieval_query
+    return sql_queries[-1] if sql_queries else None
+
+
+class ResultCache:
+    """Least-recently-used results of re-executed SQL, each kept for ttl seconds."""
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached result for key, or None if there is none or it expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
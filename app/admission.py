@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Admission control for agent runs and warehouse queries
+
+Each lane has a concurrency limit and a bounded FIFO wait queue. A request
+that finds its lane full waits in the queue; one that cannot get a slot
+within the lane's queue deadline (or finds the queue full) is rejected with
+AdmissionRejected, which the Flask app turns into a 503 with Retry-After.
+
+Lanes:
+    interactive  /ask and /run-details
+    batch        /ask and /run-details sent with X-Request-Priority: batch
+    query        /execute-query
+
+Limits come from environment variables, e.g. ADMISSION_INTERACTIVE_CONCURRENCY,
+ADMISSION_INTERACTIVE_QUEUE and ADMISSION_INTERACTIVE_TIMEOUT (seconds).
+"""
+
+import os
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import telemetry
+
+# (concurrency, queue size, queue deadline in seconds) per lane
+DEFAULT_LIMITS = {
+    'interactive': (8, 32, 30.0),
+    'batch': (2, 100, 300.0),
+    'query': (16, 64, 10.0),
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted to its lane in time."""
+
+    def __init__(self, lane, reason, retry_after):
+        super().__init__(f"Server busy: {lane} lane {reason.replace('_', ' ')}, retry after {retry_after}s")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lane:
+    """Concurrency limiter with a bounded FIFO wait queue."""
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._service_time = None
+        self._last_wait = 0.0
+
+    def acquire(self):
+        """
+        Take a slot, waiting in the queue if the lane is full.
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            AdmissionRejected: If the queue is full or the deadline passed
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if self.in_flight < self.max_concurrent and not self._waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                self._publish()
+                return 0.0
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise self._rejection('queue_full', 0.0)
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+            self._publish()
+
+        waiter.wait(self.queue_timeout)
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            # release() hands the slot over by setting the event under the lock
+            if waiter.is_set():
+                self.admitted += 1
+                self._last_wait = waited
+                self._publish()
+                return waited
+            self._waiters.remove(waiter)
+            self.rejected += 1
+            self._publish()
+            raise self._rejection('deadline_exceeded', waited)
+
+    def release(self, held_for):
+        """Give a slot back, handing it to the oldest waiter if there is one."""
+        with self._lock:
+            if self._service_time is None:
+                self._service_time = held_for
+            else:
+                self._service_time = 0.8 * self._service_time + 0.2 * held_for
+            if self._waiters:
+                self._waiters.popleft().set()
+            else:
+                self.in_flight -= 1
+            self._publish()
+
+    def retry_after(self):
+        """Seconds a rejected client should wait: time to drain the current queue, at least 1."""
+        service_time = self._service_time if self._service_time is not None else self.queue_timeout
+        rounds = (len(self._waiters) + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(rounds * service_time))
+
+    def snapshot(self):
+        """Current state of the lane."""
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout_seconds': self.queue_timeout,
+                'in_flight': self.in_flight,
+                'queue_depth': len(self._waiters),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'last_wait_seconds': round(self._last_wait, 3),
+                'avg_service_seconds': round(self._service_time, 3) if self._service_time is not None else None,
+                'retry_after_seconds': self.retry_after()
+            }
+
+    def _rejection(self, reason, waited):
+        telemetry.record_admission(self.name, reason, waited)
+        return AdmissionRejected(self.name, reason, self.retry_after())
+
+    def _publish(self):
+        telemetry.set_admission_state(self.name, self.in_flight, len(self._waiters))
+
+
+class AdmissionController:
+    """The set of lanes in front of Fabric runs and warehouse queries."""
+
+    def __init__(self, limits=None):
+        self.lanes = {}
+        for name, (concurrency, queue, timeout) in (limits or DEFAULT_LIMITS).items():
+            prefix = f"ADMISSION_{name.upper()}_"
+            self.lanes[name] = Lane(
+                name,
+                int(os.getenv(prefix + 'CONCURRENCY', concurrency)),
+                int(os.getenv(prefix + 'QUEUE', queue)),
+                float(os.getenv(prefix + 'TIMEOUT', timeout))
+            )
+
+    @contextmanager
+    def slot(self, lane_name):
+        """Hold a slot in a lane for the duration of the block (records an admission_wait stage)."""
+        lane = self.lanes[lane_name]
+        waited = lane.acquire()
+        telemetry.observe_stage("admission_wait", waited)
+        telemetry.record_admission(lane_name, 'admitted', waited)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            lane.release(time.perf_counter() - start)
+
+    def run(self, lane_name, func, *args, **kwargs):
+        """Call func(*args, **kwargs) while holding a slot in a lane."""
+        with self.slot(lane_name):
+            return func(*args, **kwargs)
+
+    def snapshot(self):
+        """State of every lane."""
+        return {name: lane.snapshot() for name, lane in self.lanes.items()}
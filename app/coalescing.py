@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing of identical in-flight requests
+
+When a dashboard loads, several users often ask the same stateless question
+or run the same query alias within seconds. SingleFlight lets the first
+caller for a key do the work while concurrent callers with the same key wait
+for and share its result (or its exception). Nothing is cached: once the
+leader finishes, the next caller starts a fresh call.
+
+A waiting caller whose cancel_token fires (e.g. its client disconnected)
+stops waiting and is detached from the call, so waiters() counts only the
+callers still interested; the leader's own token can then cancel the shared
+work once it reaches zero.
+"""
+
+import re
+import time
+import threading
+
+# Seconds between cancellation checks of a waiting caller
+WAIT_CHECK_INTERVAL = 0.25
+
+
+def normalize_question(question):
+    """Key for a question: case-insensitive, with whitespace collapsed."""
+    return re.sub(r'\s+', ' ', question).strip().lower()
+
+
+class _Call:
+    """An in-flight call and the waiters attached to it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class WaitCancelledError(Exception):
+    """Raised to a caller that stopped waiting for another caller's in-flight call."""
+
+    def __init__(self, reason, elapsed):
+        super().__init__(f"Stopped waiting for a shared call ({reason})")
+        self.reason = reason
+        self.elapsed = elapsed
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, cancel_token=None):
+        """
+        Run func() once for all concurrent callers with the same key.
+
+        Args:
+            key: Hashable key identifying identical work
+            func (callable): Zero-argument function doing the work
+            cancel_token (CancellationToken, optional): Stops this caller waiting
+                for another caller's call when cancelled
+
+        Returns:
+            tuple: (result, shared) where shared is True if this caller joined
+            another caller's in-flight call
+
+        Raises:
+            WaitCancelledError: If cancel_token fired while waiting for another caller's call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            started = time.monotonic()
+            try:
+                while not call.done.wait(WAIT_CHECK_INTERVAL if cancel_token is not None else None):
+                    if cancel_token.cancelled:
+                        raise WaitCancelledError(cancel_token.reason, time.monotonic() - started)
+            finally:
+                with self._lock:
+                    call.waiters -= 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def waiters(self, key):
+        """Number of callers still waiting for the in-flight call for key, besides its leader."""
+        with self._lock:
+            call = self._calls.get(key)
+            return call.waiters if call is not None else 0
+
+    def in_flight(self):
+        """Number of distinct keys currently being worked on."""
+        with self._lock:
+            return len(self._calls)
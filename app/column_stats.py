@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Per-column profiles of result sets
+
+The grid's filters and charts need each column's distinct values, range and
+null count. Instead of the browser scanning the whole data_table, profile()
+builds them server-side with pandas: for every column its type, null count,
+cardinality, min/max, the TOP_K most frequent values and, for numbers and
+dates, a histogram of HISTOGRAM_BINS equal-width bins.
+
+Columns of strings (e.g. the markdown tables /run-details parses) are
+profiled as numbers or dates when every non-null value parses as one.
+
+StatsCache keeps profiles keyed by the result they were computed from, so a
+snapshot or a coalesced result is profiled once however often it is served.
+
+Settings (environment variables): COLUMN_STATS_TOP_K, COLUMN_STATS_BINS,
+COLUMN_STATS_CACHE_SIZE.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+TOP_K = int(os.getenv('COLUMN_STATS_TOP_K', '10'))
+HISTOGRAM_BINS = int(os.getenv('COLUMN_STATS_BINS', '10'))
+CACHE_SIZE = int(os.getenv('COLUMN_STATS_CACHE_SIZE', '128'))
+
+
+def _to_json(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _infer(series):
+    """series converted to numbers or dates when all its non-null values parse, and its type name."""
+    if pd.api.types.is_bool_dtype(series):
+        return series, 'boolean'
+    if pd.api.types.is_numeric_dtype(series):
+        return series, 'number'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, 'datetime'
+
+    values = series.dropna()
+    if values.empty:
+        return series, 'empty'
+    if values.map(lambda value: isinstance(value, str)).all():
+        text = values.str.strip()
+        numbers = pd.to_numeric(text.str.replace(',', '', regex=False), errors='coerce')
+        if numbers.notna().all():
+            return numbers, 'number'
+        dates = pd.to_datetime(text, errors='coerce', format='ISO8601')
+        if dates.notna().all():
+            return dates, 'datetime'
+        return series, 'string'
+    if values.map(lambda value: hasattr(value, 'isoformat')).all():
+        dates = pd.to_datetime(values, errors='coerce')
+        if dates.notna().all():
+            return dates, 'datetime'
+    return series, 'string'
+
+
+def _histogram(values, kind):
+    if values.empty:
+        return None
+    if kind == 'datetime':
+        # Bin seconds since the earliest value, whatever the resolution and time zone
+        start = values.min()
+        seconds = ((values - start) / pd.Timedelta(seconds=1)).to_numpy(dtype='float64')
+        counts, edges = np.histogram(seconds, bins=HISTOGRAM_BINS)
+        edges = [(start + pd.Timedelta(seconds=float(edge))).isoformat() for edge in edges]
+    else:
+        counts, edges = np.histogram(values.astype('float64').to_numpy(), bins=HISTOGRAM_BINS)
+        edges = [float(edge) for edge in edges]
+    return {'edges': edges, 'counts': [int(count) for count in counts]}
+
+
+def profile_column(series):
+    """Type, null count, cardinality, min/max, top values and (numbers, dates) histogram of one column."""
+    converted, kind = _infer(series)
+    values = converted.dropna()
+    stats = {
+        'type': kind,
+        'count': int(len(values)),
+        'null_count': int(len(series) - len(values)),
+        'distinct': int(values.nunique()),
+        'min': None,
+        'max': None
+    }
+    if values.empty:
+        stats['top_values'] = []
+        return stats
+
+    if kind in ('number', 'datetime', 'boolean'):
+        stats['min'], stats['max'] = _to_json(values.min()), _to_json(values.max())
+    else:
+        text = values.astype(str)
+        stats['min'], stats['max'] = text.min(), text.max()
+
+    # Top values are reported as they appear in the result, not as converted
+    top = series.dropna().value_counts().head(TOP_K)
+    stats['top_values'] = [{'value': _to_json(value), 'count': int(count)} for value, count in top.items()]
+
+    if kind in ('number', 'datetime'):
+        stats['histogram'] = _histogram(values, kind)
+    return stats
+
+
+def profile(rows, columns=None):
+    """
+    Profile every column of a result.
+
+    Args:
+        rows (list): The data_table (list of dicts)
+        columns (list, optional): Column order; defaults to the keys of the rows
+
+    Returns:
+        dict: Column name to its profile
+    """
+    frame = pd.DataFrame.from_records(rows, columns=columns) if rows else pd.DataFrame(columns=columns or [])
+    stats = {}
+    for column in frame.columns:
+        series = frame[column]
+        if isinstance(series, pd.DataFrame):
+            # Duplicate column names; profile the first
+            series = series.iloc[:, 0]
+        try:
+            stats[str(column)] = profile_column(series)
+        except (TypeError, ValueError) as e:
+            # e.g. unhashable or incomparable values; the other columns are still profiled
+            stats[str(column)] = {'type': 'unsupported', 'error': str(e)}
+    return stats
+
+
+class StatsCache:
+    """Least-recently-used cache of result profiles, keyed by the result they describe."""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, rows, columns=None):
+        """
+        The profile of a result, computed on first use.
+
+        Args:
+            key: Hashable key that changes whenever the result does (e.g. including its timestamp)
+            rows (list): The result's data_table
+            columns (list, optional): The result's columns
+        """
+        with self._lock:
+            stats = self._entries.get(key)
+            if stats is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return stats
+            self.misses += 1
+        stats = profile(rows, columns)
+        with self._lock:
+            self._entries[key] = stats
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return stats
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Pooled warehouse connections with reusable cursors
+
+Opening a warehouse connection costs a token request and a TLS/login round
+trip, so /execute-query used to spend more time connecting than querying.
+ConnectionPool keeps idle connections for reuse and, on each connection, one
+cursor per statement text: pyodbc keeps the last statement a cursor prepared,
+so executing the same parameterized statement on the same cursor reuses the
+prepared statement instead of preparing it again.
+
+The pool never blocks; admission control already bounds how many queries run
+at once. Connections are closed when more than SQL_POOL_SIZE are idle, after
+SQL_POOL_MAX_IDLE seconds unused, and SQL_POOL_MAX_LIFETIME seconds after
+they were opened (before the Azure AD token they logged in with expires).
+A connection whose query fails with a connection-level error is discarded.
+
+Settings (environment variables): SQL_POOL_SIZE, SQL_POOL_MAX_IDLE,
+SQL_POOL_MAX_LIFETIME, SQL_POOL_CURSORS.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+POOL_SIZE = int(os.getenv('SQL_POOL_SIZE', '8'))
+MAX_IDLE = float(os.getenv('SQL_POOL_MAX_IDLE', '600'))
+MAX_LIFETIME = float(os.getenv('SQL_POOL_MAX_LIFETIME', '3000'))
+# Cached cursors (prepared statements) per connection
+MAX_CURSORS = int(os.getenv('SQL_POOL_CURSORS', '16'))
+
+
+def is_connection_error(error):
+    """True for pyodbc errors that leave the connection unusable."""
+    module = type(error).__module__ or ''
+    return module.startswith('pyodbc') and type(error).__name__ in ('OperationalError', 'InterfaceError')
+
+
+class PooledConnection:
+    """A warehouse connection and its cursors, keyed by statement text."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.cursors = OrderedDict()
+
+    def cursor(self, statement):
+        """The cursor that last executed statement, or a new one."""
+        cursor = self.cursors.pop(statement, None)
+        if cursor is None:
+            cursor = self.connection.cursor()
+        # Most recently used last; the oldest cursor is closed when over the limit
+        self.cursors[statement] = cursor
+        while len(self.cursors) > MAX_CURSORS:
+            _, oldest = self.cursors.popitem(last=False)
+            _close_quietly(oldest)
+        return cursor
+
+    def discard_cursor(self, statement):
+        cursor = self.cursors.pop(statement, None)
+        if cursor is not None:
+            _close_quietly(cursor)
+
+    def expired(self, now, max_idle, max_lifetime):
+        return now - self.created_at >= max_lifetime or now - self.last_used >= max_idle
+
+    def close(self):
+        for cursor in self.cursors.values():
+            _close_quietly(cursor)
+        self.cursors.clear()
+        _close_quietly(self.connection)
+
+
+def _close_quietly(resource):
+    try:
+        resource.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """
+    Pool of warehouse connections.
+
+    Args:
+        connect (callable): Opens a new connection
+    """
+
+    def __init__(self, connect, max_size=POOL_SIZE, max_idle=MAX_IDLE, max_lifetime=MAX_LIFETIME):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._idle = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.discarded = 0
+        self.prepared_reuses = 0
+        self.in_use = 0
+
+    def acquire(self):
+        """An idle connection that is still fresh, or a newly opened one."""
+        now = time.monotonic()
+        stale = []
+        pooled = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop()
+                if candidate.expired(now, self.max_idle, self.max_lifetime):
+                    stale.append(candidate)
+                else:
+                    pooled = candidate
+                    self.reused += 1
+                    break
+            self.in_use += 1
+        for candidate in stale:
+            candidate.close()
+
+        if pooled is None:
+            try:
+                pooled = PooledConnection(self.connect())
+            except BaseException:
+                with self._lock:
+                    self.in_use -= 1
+                raise
+            with self._lock:
+                self.opened += 1
+        return pooled
+
+    def release(self, pooled, discard=False):
+        """Return a connection to the pool, or close it if discarded or the pool is full."""
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            self.in_use -= 1
+            keep = not discard and len(self._idle) < self.max_size
+            if keep:
+                self._idle.append(pooled)
+            elif discard:
+                self.discarded += 1
+        if not keep:
+            pooled.close()
+
+    @contextmanager
+    def cursor(self, statement):
+        """
+        Hold a pooled connection and its cursor for statement for the duration of the block.
+
+        A connection-level error discards the connection; any other error
+        discards only the cursor, whose state is unknown after a failure.
+        """
+        pooled = self.acquire()
+        discard = False
+        try:
+            if statement in pooled.cursors:
+                with self._lock:
+                    self.prepared_reuses += 1
+            yield pooled.cursor(statement)
+        except BaseException as e:
+            discard = is_connection_error(e) or not isinstance(e, Exception)
+            if not discard:
+                pooled.discard_cursor(statement)
+            raise
+        finally:
+            self.release(pooled, discard=discard)
+
+    def clear(self):
+        """Close all idle connections, e.g. after the credential changed."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            pooled.close()
+
+    def snapshot(self):
+        """Pool size and reuse counts."""
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'max_size': self.max_size,
+                'opened': self.opened,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'prepared_statement_reuses': self.prepared_reuses
+            }
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Derived query aliases: in-process transforms over another alias's result
+
+Several reports in query_config.json run the same joins and differ only in
+how the rows are grouped, filtered or ordered. A derived alias declares the
+alias it is computed from and a list of transforms instead of a query:
+
+    "top_converting_lead_sources": {
+        "derived_from": "converted_opportunities",
+        "transforms": [
+            {"group_by": ["crm_contact_lead_source"], "aggregates": {"count": "count(*)"}},
+            {"sort": ["count DESC"]},
+            {"top": 10}
+        ]
+    }
+
+Transforms run in order: "filter" (a list of {"column", "op", "value"}
+conditions, all of which must hold), "group_by" with "aggregates" (count(*),
+count/sum/min/max/avg(column)), "sort" ("column" or "column DESC") and
+"top" (first N rows). They follow SQL Server semantics under its default
+case-insensitive collation, so a derived alias returns what the equivalent
+T-SQL would: strings compare case-insensitively and ignoring trailing
+spaces, NULLs sort first and never satisfy a comparison, aggregates skip
+NULLs and AVG of integers is truncated to an integer.
+
+The base alias is run (or served from its snapshot) once and every derived
+alias is computed from that result. DerivedCache keeps each derived result
+until the base snapshot it was computed from is replaced, so the transforms
+also run once per refresh.
+
+A base result cut off at its row or byte budget (query_limits.py) is missing
+rows, so groups, sorts and tops over it would be silently wrong; only
+filters are applied to it (the result stays flagged as truncated), and any
+other transform raises TruncatedBaseError.
+"""
+
+import re
+import threading
+
+# Longest derived_from chain followed before giving up (catches cycles)
+MAX_DEPTH = 5
+
+AGGREGATE = re.compile(r'^\s*(count|sum|min|max|avg)\s*\(\s*(\*|[A-Za-z_][A-Za-z0-9_]*)\s*\)\s*$', re.IGNORECASE)
+FILTER_OPS = ('=', '!=', '<', '<=', '>', '>=', 'in', 'is_null', 'not_null')
+
+
+class TruncatedBaseError(RuntimeError):
+    """Raised when a derived alias needs every row of a base result that was truncated."""
+
+
+def is_null(value):
+    # NaN and NaT are the only values not equal to themselves
+    return value is None or value != value
+
+
+def _comparable(value):
+    # SQL Server's default collation is case-insensitive and ignores trailing spaces
+    if isinstance(value, str):
+        return value.rstrip().casefold()
+    return value
+
+
+def _sort_key(value):
+    # NULLs sort before every value
+    if is_null(value):
+        return (0, '')
+    return (1, _comparable(value))
+
+
+def parse_sort(entries):
+    """(column, descending) pairs for "column" / "column ASC" / "column DESC" entries."""
+    sort = []
+    for entry in entries:
+        column, _, direction = str(entry).strip().partition(' ')
+        direction = direction.strip().upper() or 'ASC'
+        if direction not in ('ASC', 'DESC'):
+            raise ValueError(f"Invalid sort direction in '{entry}'")
+        sort.append((column, direction == 'DESC'))
+    return sort
+
+
+def sort_rows(rows, sort):
+    """Rows sorted by (column, descending) pairs; ties keep their current order."""
+    rows = list(rows)
+    for column, descending in reversed(sort):
+        rows.sort(key=lambda row: _sort_key(row.get(column)), reverse=descending)
+    return rows
+
+
+def _matches(row, condition):
+    column = condition.get('column')
+    op = condition.get('op', '=')
+    value = row.get(column)
+    if op == 'is_null':
+        return is_null(value)
+    if op == 'not_null':
+        return not is_null(value)
+    # A comparison with NULL is unknown, which a WHERE clause treats as false
+    if is_null(value):
+        return False
+    if op == 'in':
+        return _comparable(value) in {_comparable(item) for item in condition.get('value', []) if not is_null(item)}
+    target = condition.get('value')
+    if is_null(target):
+        return False
+    left, right = _comparable(value), _comparable(target)
+    if op == '=':
+        return left == right
+    if op == '!=':
+        return left != right
+    if op == '<':
+        return left < right
+    if op == '<=':
+        return left <= right
+    if op == '>':
+        return left > right
+    return left >= right
+
+
+def filter_rows(rows, conditions):
+    """Rows for which every condition holds."""
+    for condition in conditions:
+        if condition.get('op', '=') not in FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator '{condition.get('op')}'. Supported: {list(FILTER_OPS)}")
+        if not condition.get('column'):
+            raise ValueError("Every filter condition needs a column")
+    return [row for row in rows if all(_matches(row, condition) for condition in conditions)]
+
+
+def _aggregate(function, column, rows):
+    if column == '*':
+        if function != 'count':
+            raise ValueError(f"{function.upper()}(*) is not supported")
+        return len(rows)
+    values = [row.get(column) for row in rows if not is_null(row.get(column))]
+    if function == 'count':
+        return len(values)
+    if not values:
+        return None
+    if function == 'sum':
+        return sum(values)
+    if function == 'min':
+        return min(values, key=_comparable)
+    if function == 'max':
+        return max(values, key=_comparable)
+    total = sum(values)
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        # AVG of an integer column is an integer in T-SQL, truncated toward zero
+        return int(total / len(values))
+    return total / len(values)
+
+
+def group_rows(rows, group_by, aggregates):
+    """
+    One row per distinct group_by combination, with the group_by columns and one column per aggregate.
+
+    Groups are formed case-insensitively; each group keeps the values of its first row.
+    """
+    parsed = {}
+    for name, expression in aggregates.items():
+        match = AGGREGATE.match(str(expression))
+        if match is None:
+            raise ValueError(f"Invalid aggregate '{expression}'. Use count(*) or count/sum/min/max/avg(column)")
+        parsed[name] = (match.group(1).lower(), match.group(2))
+
+    groups = {}
+    for row in rows:
+        key = tuple(_sort_key(row.get(column)) for column in group_by)
+        groups.setdefault(key, []).append(row)
+
+    result = []
+    for members in groups.values():
+        grouped = {column: members[0].get(column) for column in group_by}
+        for name, (function, column) in parsed.items():
+            grouped[name] = _aggregate(function, column, members)
+        result.append(grouped)
+    return result
+
+
+def apply(rows, columns, transforms):
+    """
+    Run a derived alias's transforms over its base rows.
+
+    Returns:
+        tuple: (rows, columns)
+
+    Raises:
+        ValueError: For unknown transforms or invalid transform settings
+    """
+    for transform in transforms:
+        if 'filter' in transform:
+            rows = filter_rows(rows, transform['filter'])
+        elif 'group_by' in transform:
+            group_by = transform['group_by']
+            aggregates = transform.get('aggregates', {})
+            rows = group_rows(rows, group_by, aggregates)
+            columns = list(group_by) + list(aggregates)
+        elif 'sort' in transform:
+            rows = sort_rows(rows, parse_sort(transform['sort']))
+        elif 'top' in transform:
+            rows = rows[:int(transform['top'])]
+        else:
+            raise ValueError(f"Unsupported transform {transform}. Use filter, group_by, sort or top")
+    return rows, columns
+
+
+def chain(query_alias, lookup):
+    """
+    The aliases a derived alias is computed from, starting with query_alias and ending with the alias that has a query.
+
+    Args:
+        query_alias (str): The requested alias
+        lookup (callable): Returns the query_config.json entry of an alias
+
+    Returns:
+        list: (alias, query_info) pairs; a single pair for an alias with its own query
+    """
+    aliases = [(query_alias, lookup(query_alias))]
+    while aliases[-1][1].get('derived_from'):
+        base_alias = aliases[-1][1]['derived_from']
+        if len(aliases) > MAX_DEPTH or base_alias in (alias for alias, _ in aliases):
+            raise ValueError(f"Derived alias '{query_alias}' has a derived_from cycle or a chain longer than {MAX_DEPTH}")
+        aliases.append((base_alias, lookup(base_alias)))
+    return aliases
+
+
+def derive(query_alias, query_info, base_result):
+    """
+    A derived alias's /execute-query result computed from its base alias's result.
+
+    Raises:
+        TruncatedBaseError: If the base result was truncated and a transform other than filter needs all its rows
+    """
+    transforms = query_info.get('transforms', [])
+    if base_result.get('truncated') and any(set(transform) != {'filter'} for transform in transforms):
+        raise TruncatedBaseError(
+            f"Cannot compute '{query_alias}': its base alias '{base_result['query_alias']}' was truncated "
+            f"at the {base_result.get('truncated_by')} limit; raise the base alias's limits"
+        )
+    rows, columns = apply(base_result['data_table'], base_result['columns'], transforms)
+    return dict(
+        base_result,
+        query_alias=query_alias,
+        query_name=query_info.get('name', ''),
+        query_description=query_info.get('description', ''),
+        derived_from=base_result.get('derived_from') or base_result['query_alias'],
+        data_table=rows,
+        row_count=len(rows),
+        columns=columns
+    )
+
+
+class DerivedCache:
+    """Derived results, each kept until the base snapshot it was computed from is replaced."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, base_result, compute):
+        """
+        The derived result for key computed from base_result, reusing it while base_result is unchanged.
+
+        Args:
+            key: Hashable key of the derived alias and its parameters
+            base_result (dict): The base alias's snapshot
+            compute (callable): Computes the derived result from base_result
+        """
+        version = (base_result.get('snapshot_at'), base_result.get('timestamp'))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        result = compute()
+        with self._lock:
+            self._entries[key] = (version, result)
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -19,11 +19,21 @@ Usage:
 import time
 import uuid
 import json
-import os, requests
+import os
 import warnings
 from typing import Optional
 from azure.identity import InteractiveBrowserCredential
 from openai import OpenAI
+import telemetry
+import recording
+import resilience
+import run_control
+import thread_cleanup
+import thread_rollover
+import run_steps
+import query_limits
+import adhoc_sql
+from run_control import CancellationToken
 
 # Suppress OpenAI Assistants API deprecation warnings
 # (Fabric Data Agents don't support the newer Responses API yet)
@@ -33,6 +43,12 @@ warnings.filterwarnings(
     message=r".*Assistants API is deprecated.*"
 )
 
+# Optional: pyodbc is only needed to re-execute a run's SQL (rerun_sql)
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
 # Optional: Load from .env file if available
 try:
     from dotenv import load_dotenv
@@ -41,6 +57,10 @@ except ImportError:
     pass
 
 
+# A run produces a handful of messages; one page always covers them
+RUN_MESSAGES_LIMIT = 100
+
+
 class FabricDataAgentClient:
     """
     Client for calling Microsoft Fabric Data Agents from external applications.
@@ -52,17 +72,19 @@ class FabricDataAgentClient:
     - Proper cleanup of resources
     """
     
-    def __init__(self, tenant_id: str, data_agent_url: str):
+    def __init__(self, tenant_id: str, data_agent_url: str, credential=None):
         """
         Initialize the Fabric Data Agent client.
         
         Args:
             tenant_id (str): Your Azure tenant ID
             data_agent_url (str): The published URL of your Fabric Data Agent
+            credential (optional): Any object with a get_token() method. If None,
+                interactive browser authentication is used
         """
         self.tenant_id = tenant_id
         self.data_agent_url = data_agent_url
-        self.credential = None
+        self.credential = credential
         self.token = None
         
         # Validate inputs
@@ -75,6 +97,18 @@ class FabricDataAgentClient:
         print(f"Tenant ID: {tenant_id}")
         print(f"Data Agent URL: {data_agent_url}")
         
+        # Export spans over OTLP when OTEL_EXPORTER_OTLP_ENDPOINT is set
+        telemetry.configure_tracing(os.getenv("OTEL_SERVICE_NAME", "fabric-data-agent-client"))
+        
+        # Deletes threads in the background and reaps stale unnamed threads
+        self._thread_cleaner = thread_cleanup.create(self._get_openai_client)
+        
+        # Results of re-executed run SQL, by normalized statement
+        self._sql_results = adhoc_sql.ResultCache()
+        
+        # Long named threads continue on a new thread under the same name
+        self._thread_rollover = thread_rollover.ThreadRollover() if thread_rollover.ENABLED else None
+        
         self._authenticate()
     
     def _authenticate(self):
@@ -83,14 +117,16 @@ class FabricDataAgentClient:
         """
         try:
             print("\n🔐 Starting authentication...")
-            print("A browser window will open for you to sign in to your Microsoft account.")
             
-            # Create credential for interactive authentication
-            self.credential = InteractiveBrowserCredential(
-                tenant_id=self.tenant_id,
-                # Optional: specify redirect_uri if needed
-                # redirect_uri="http://localhost:8400"
-            )
+            if self.credential is None:
+                print("A browser window will open for you to sign in to your Microsoft account.")
+                
+                # Create credential for interactive authentication
+                self.credential = InteractiveBrowserCredential(
+                    tenant_id=self.tenant_id,
+                    # Optional: specify redirect_uri if needed
+                    # redirect_uri="http://localhost:8400"
+                )
             
             # Get initial token
             self._refresh_token()
@@ -138,23 +174,38 @@ class FabricDataAgentClient:
                 "Authorization": f"Bearer {self.token.token}",
                 "Accept": "application/json",
                 "Content-Type": "application/json",
-                "ActivityId": str(uuid.uuid4())
-            }
+                "ActivityId": telemetry.current_activity_id()
+            },
+            http_client=recording.http_client(),
+            max_retries=0  # retries are handled by resilience.call()
         )
 
-    def _get_existing_or_create_new_thread(self, data_agent_url: str, thread_name = None) -> dict:
+    def _get_existing_or_create_new_thread(self, data_agent_url: str, thread_name = None, rollover: bool = True) -> dict:
         """
         Get an existing thread or Create a new thread for the target Fabric Data Agent.
 
+        A named thread resolves to the name's current thread; once that thread is full
+        (see thread_rollover.py) a new one is created under the same name and seeded
+        with the last questions and answers.
+
         Args:
             data_agent_url (str): The URL of the Fabric Data Agent
             thread_name (str, optional): Name for the new or existing thread. If None, a random name is generated.
+            rollover (bool): Resolve thread_name through the rollover mapping; False looks up the tag as given
 
         Returns:
             list: A list containing the ID and name of the created thread or existing thread
         """
-        if thread_name == None: # if None, generate a random thread name to create a new thread
+        unnamed = thread_name == None
+        rollover = rollover and not unnamed
+        if unnamed: # if None, generate a random thread name to create a new thread
             thread_name = f'external-client-thread-{uuid.uuid4()}'
+        elif rollover and self._thread_rollover is not None: # the name's current thread, rolled over when full
+            return self._thread_rollover.resolve(
+                thread_name,
+                lambda tag: self._get_existing_or_create_new_thread(data_agent_url, thread_name=tag, rollover=False),
+                self._get_openai_client
+            )
         else:
             thread_name = thread_name # use provided thread name to attempt to get existing thread, if not create new thread
         
@@ -169,24 +220,124 @@ class FabricDataAgentClient:
             "Authorization": f"Bearer {self.token.token}",
             "Accept": "application/json",
             "Content-Type": "application/json",
-            "ActivityId": str(uuid.uuid4())
+            "ActivityId": telemetry.current_activity_id()
         }
 
-        response = requests.get(get_new_thread_url, headers=headers)
-        response.raise_for_status()
-        thread = response.json()
+        def lookup():
+            response = recording.get(get_new_thread_url, headers=headers)
+            response.raise_for_status()
+            return response.json()
+
+        thread = resilience.call('thread_lookup', lookup)
         thread["name"] = thread_name #adding thread name to returned object
 
+        if unnamed: # let the reaper delete it if it is never cleaned up
+            self._thread_cleaner.track(thread['id'])
+
         return thread
 
-    def ask(self, question: str, timeout: int = 120, thread_name = None) -> str:
+    def _record_exchange(self, thread_name, thread: dict, question: str, answer: str):
+        """Count a question answered on a named thread towards its rollover limits."""
+        if thread_name is None or self._thread_rollover is None:
+            return
+        try:
+            self._thread_rollover.record(thread_name, thread.get("tag", thread_name), question, answer)
+        except Exception as e:
+            print(f"⚠️ Could not record exchange on thread '{thread_name}': {e}")
+
+    @staticmethod
+    def _extract_responses(messages) -> list:
+        """The text of each assistant message in a page of messages."""
+        responses = []
+        for msg in messages.data:
+            if msg.role == "assistant":
+                try:
+                    content = msg.content[0]
+                    # Handle different content types safely
+                    if hasattr(content, 'text'):
+                        text_content = getattr(content, 'text', None)
+                        if text_content is not None and hasattr(text_content, 'value'):
+                            responses.append(text_content.value)
+                        elif text_content is not None:
+                            responses.append(str(text_content))
+                        else:
+                            responses.append(str(content))
+                    else:
+                        responses.append(str(content))
+                except (IndexError, AttributeError):
+                    responses.append(str(msg.content))
+        return responses
+
+    def _wait_for_run(self, client: OpenAI, thread_id: str, run, timeout: Optional[int] = None,
+                      cancel_token: Optional[CancellationToken] = None):
+        """
+        Poll a run until it leaves the queued/in_progress states.
+        
+        The run is cancelled on Fabric when the timeout expires, when cancel_token
+        is cancelled, or on KeyboardInterrupt.
+        
+        Args:
+            client (OpenAI): Client used to retrieve the run
+            thread_id (str): ID of the thread the run belongs to
+            run: The run returned by runs.create
+            timeout (int, optional): Maximum time to wait in seconds. None waits indefinitely
+            cancel_token (CancellationToken, optional): Token that cancels the run when cancelled
+            
+        Returns:
+            The last retrieved run
+            
+        Raises:
+            RunCancelledError: If the run was cancelled on timeout or through cancel_token
+        """
+        try:
+            return run_control.poll_run(
+                client, thread_id, run,
+                timeout=timeout,
+                cancel_token=cancel_token,
+                on_status=lambda current: print(f"⏳ Status: {current.status}")
+            )
+        except run_control.RunCancelledError as e:
+            if e.reason == 'timeout':
+                print(f"⏰ Request timed out after {timeout} seconds, run cancelled")
+            else:
+                print(f"⏹️ Run cancelled ({e.reason})")
+            raise
+        except KeyboardInterrupt:
+            print("\n⏹️ Run cancelled by user")
+            raise
+
+    def _list_run_messages(self, client: OpenAI, thread_id: str, run_id: str, after: Optional[str] = None,
+                           order: str = "asc"):
+        """
+        List only the messages created by one run, however long the thread is.
+        
+        Args:
+            client (OpenAI): Client used to list the messages
+            thread_id (str): ID of the thread
+            run_id (str): ID of the run whose messages are returned
+            after (str, optional): Message ID to start after (the question's message) when order is "asc"
+            order (str): "asc" or "desc"
+            
+        Returns:
+            The page of messages created by the run
+        """
+        params = {"thread_id": thread_id, "run_id": run_id, "order": order, "limit": RUN_MESSAGES_LIMIT}
+        if after is not None:
+            params["after"] = after
+        return resilience.call('messages.list', client.beta.threads.messages.list, **params)
+
+    @telemetry.instrument("client.ask")
+    @recording.recorded("client.ask")
+    def ask(self, question: str, timeout: int = 120, thread_name = None,
+            cancel_token: Optional[CancellationToken] = None) -> str:
         """
         Ask a question to the Fabric Data Agent.
         
         Args:
             question (str): The question to ask
-            timeout (int): Maximum time to wait for response in seconds
+            timeout (int): Maximum time to wait for response in seconds; the run is cancelled after it
             thread_name (str, optional): The name of the thread to use
+            cancel_token (CancellationToken, optional): Cancel the run from another thread with cancel_token.cancel()
 
         Returns:
             str: The response from the data agent
@@ -200,68 +351,50 @@ class FabricDataAgentClient:
             client = self._get_openai_client()
             
             # Create assistant without specifying model or instructions
-            assistant = client.beta.assistants.create(model="not used")
+            with telemetry.stage("assistant_create"):
+                assistant = resilience.call('assistants.create', client.beta.assistants.create, model="not used")
             
             # Create thread and send message
-            thread = self._get_existing_or_create_new_thread(
-                data_agent_url=self.data_agent_url, 
-                thread_name=thread_name
-                )
+            with telemetry.stage("thread_lookup"):
+                thread = self._get_existing_or_create_new_thread(
+                    data_agent_url=self.data_agent_url, 
+                    thread_name=thread_name
+                    )
 
-            client.beta.threads.messages.create(
-                thread_id=thread['id'],
-                role="user",
-                content=question
-            )
+            with telemetry.stage("messages_create"):
+                user_message = resilience.call(
+                    'messages.create',
+                    client.beta.threads.messages.create,
+                    thread_id=thread['id'],
+                    role="user",
+                    content=question,
+                    idempotent=False
+                )
             
             # Start the run
-            run = client.beta.threads.runs.create(
-                thread_id=thread['id'],
-                assistant_id=assistant.id
-            )
-            
-            # Monitor the run with timeout
-            start_time = time.time()
-            while run.status in ["queued", "in_progress"]:
-                if time.time() - start_time > timeout:
-                    print(f"⏰ Request timed out after {timeout} seconds")
-                    break
-                
-                print(f"⏳ Status: {run.status}")
-                time.sleep(2)
-                
-                run = client.beta.threads.runs.retrieve(
+            with telemetry.stage("runs_create"):
+                run = resilience.call(
+                    'runs.create',
+                    client.beta.threads.runs.create,
                     thread_id=thread['id'],
-                    run_id=run.id
+                    assistant_id=assistant.id,
+                    idempotent=False
                 )
             
+            # Monitor the run with timeout
+            run = self._wait_for_run(client, thread['id'], run, timeout=timeout, cancel_token=cancel_token)
+            
             print(f"✅ Final status: {run.status}")
             
             # Get the response messages
-            messages = client.beta.threads.messages.list(
-                thread_id=thread['id'],
-                order="asc"
-            )
+            with telemetry.stage("messages_list"):
+                messages = self._list_run_messages(client, thread['id'], run.id, after=user_message.id)
 
             # Extract assistant responses
-            responses = []
-            for msg in messages.data:
-                if msg.role == "assistant":
-                    try:
-                        content = msg.content[0]
-                        # Handle different content types safely
-                        if hasattr(content, 'text'):
-                            text_content = getattr(content, 'text', None)
-                            if text_content is not None and hasattr(text_content, 'value'):
-                                responses.append(text_content.value)
-                            elif text_content is not None:
-                                responses.append(str(text_content))
-                            else:
-                                responses.append(str(content))
-                        else:
-                            responses.append(str(content))
-                    except (IndexError, AttributeError):
-                        responses.append(str(msg.content))
+            with telemetry.stage("extraction"):
+                responses = self._extract_responses(messages)
+            
+            self._record_exchange(thread_name, thread, question, "\n".join(responses))
             
             # Clean up resources
             #try:
@@ -279,12 +412,18 @@ class FabricDataAgentClient:
             print(f"❌ Error calling data agent: {e}")
             return f"Error: {e}"
     
-    def get_run_details(self, question: str, thread_name=None) -> dict:
+    @telemetry.instrument("client.get_run_details")
+    @recording.recorded("client.get_run_details")
+    def get_run_details(self, question: str, thread_name=None, timeout: Optional[int] = None,
+                        cancel_token: Optional[CancellationToken] = None) -> dict:
         """
         Ask a question and return detailed run information including steps.
         
         Args:
             question (str): The question to ask
+            thread_name (str, optional): The name of the thread to use
+            timeout (int, optional): Maximum time to wait in seconds; the run is cancelled after it. None waits indefinitely
+            cancel_token (CancellationToken, optional): Cancel the run from another thread with cancel_token.cancel()
             
         Returns:
             dict: Detailed response including run steps, metadata, and SQL queries if lakehouse data source
@@ -295,100 +434,61 @@ class FabricDataAgentClient:
             client = self._get_openai_client()
             
             # Create assistant and thread without specifying model or instructions
-            assistant = client.beta.assistants.create(model="not used")
-            thread = self._get_existing_or_create_new_thread(
-                data_agent_url=self.data_agent_url,
-                thread_name=thread_name
-                )
+            with telemetry.stage("assistant_create"):
+                assistant = resilience.call('assistants.create', client.beta.assistants.create, model="not used")
+            with telemetry.stage("thread_lookup"):
+                thread = self._get_existing_or_create_new_thread(
+                    data_agent_url=self.data_agent_url,
+                    thread_name=thread_name
+                    )
             
-            client.beta.threads.messages.create(
-                thread_id=thread['id'],
-                role="user",
-                content=question
-            )
+            with telemetry.stage("messages_create"):
+                user_message = resilience.call(
+                    'messages.create',
+                    client.beta.threads.messages.create,
+                    thread_id=thread['id'],
+                    role="user",
+                    content=question,
+                    idempotent=False
+                )
             
             # Start and monitor run
-            run = client.beta.threads.runs.create(
-                thread_id=thread['id'],
-                assistant_id=assistant.id
-            )
+            with telemetry.stage("runs_create"):
+                run = resilience.call(
+                    'runs.create',
+                    client.beta.threads.runs.create,
+                    thread_id=thread['id'],
+                    assistant_id=assistant.id,
+                    idempotent=False
+                )
             
-            while run.status in ["queued", "in_progress"]:
-                print(f"⏳ Status: {run.status}")
-                time.sleep(2)
-                run = client.beta.threads.runs.retrieve(thread_id=thread['id'], run_id=run.id)
+            run = self._wait_for_run(client, thread['id'], run, timeout=timeout, cancel_token=cancel_token)
             
             # Get detailed run steps
-            steps = client.beta.threads.runs.steps.list(
-                thread_id=thread['id'],
-                run_id=run.id
-            )
+            with telemetry.stage("steps_list"):
+                steps = run_steps.list_steps(client, thread['id'], run.id)
             
             # Get messages
-            messages = client.beta.threads.messages.list(
-                thread_id=thread['id'],
-                order="asc"
-            )
-            
-            # Extract SQL queries and data from steps if lakehouse data source is detected
-            sql_analysis = self._extract_sql_queries_with_data(steps)
-            
-            # Also try the old regex method as backup
-            if not sql_analysis["queries"]:
-                regex_queries = self._extract_sql_queries(steps)
-                if regex_queries:
-                    sql_analysis["queries"] = regex_queries
-                    sql_analysis["data_retrieval_query"] = regex_queries[0] if regex_queries else None
-            
-            # Also extract data from the final assistant message
-            messages_data = messages.model_dump()
-            assistant_messages = [msg for msg in messages_data.get('data', []) if msg.get('role') == 'assistant']
-            if assistant_messages:
-                latest_message = assistant_messages[-1]
-                content = latest_message.get('content', [])
-                if content and len(content) > 0:
-                    # Extract text content
-                    text_content = ""
-                    if isinstance(content[0], dict):
-                        if 'text' in content[0]:
-                            if isinstance(content[0]['text'], dict) and 'value' in content[0]['text']:
-                                text_content = content[0]['text']['value']
-                            else:
-                                text_content = str(content[0]['text'])
-                    else:
-                        text_content = str(content[0])
-                    
-                    # Extract structured data from the assistant's text response
-                    if text_content:
-                        text_data_preview = self._extract_data_from_text_response(text_content)
-                        if text_data_preview:
-                            # Add the text-based data preview
-                            if sql_analysis["queries"]:
-                                # If we have queries but no data previews, or empty previews, use the text-based one
-                                if not sql_analysis["data_previews"] or not any(sql_analysis["data_previews"]):
-                                    sql_analysis["data_previews"] = [text_data_preview]
-                                else:
-                                    # Add to existing previews
-                                    sql_analysis["data_previews"].append(text_data_preview)
-                                
-                                # If we don't have a specific data retrieval query identified, use the first query
-                                if not sql_analysis["data_retrieval_query"] and sql_analysis["queries"]:
-                                    sql_analysis["data_retrieval_query"] = sql_analysis["queries"][0]
-                                    sql_analysis["data_retrieval_query_index"] = 1
+            with telemetry.stage("messages_list"):
+                messages = self._list_run_messages(client, thread['id'], run.id, after=user_message.id)
             
-            # Clean up
-            try:
-                client.beta.threads.delete(thread_id=thread['id'])
-            except Exception as cleanup_error:
-                print(f"⚠️ Warning: Thread cleanup failed: {cleanup_error}")
+            with telemetry.stage("extraction"):
+                sql_analysis = self._analyze_run(steps, messages)
+
+            # Clean up single-use threads in the background, off the request path
+            if thread_name is None:
+                self._thread_cleaner.schedule_delete(thread['id'])
+            else:
+                self._record_exchange(thread_name, thread, question, "\n".join(self._extract_responses(messages)))
             
-            result = {
-                "question": question,
-                "run_status": run.status,
-                "run_steps": steps.model_dump(),
-                "messages": messages.model_dump(),
-                "timestamp": time.time()
-            }
+            with telemetry.stage("serialization"):
+                result = {
+                    "question": question,
+                    "run_status": run.status,
+                    "run_steps": steps.model_dump(),
+                    "messages": messages.model_dump(),
+                    "timestamp": time.time()
+                }
             
             # Add SQL analysis if found
             if sql_analysis["queries"]:
@@ -427,14 +527,19 @@ class FabricDataAgentClient:
             print(f"❌ Error getting run details: {e}")
             return {"error": str(e)}
 
-    def get_raw_run_response(self, question: str, timeout: int = 120, thread_name = None) -> dict:
+    @telemetry.instrument("client.get_raw_run_response")
+    @recording.recorded("client.get_raw_run_response")
+    def get_raw_run_response(self, question: str, timeout: int = 120, thread_name = None,
+                             cancel_token: Optional[CancellationToken] = None) -> dict:
         """
         Ask a question and return the complete raw response including all run details.
         This is useful when you need to parse or analyze the full response structure.
         
         Args:
             question (str): The question to ask
-            timeout (int): Maximum time to wait for response in seconds
+            timeout (int): Maximum time to wait for response in seconds; the run is cancelled after it
+            thread_name (str, optional): The name of the thread to use
+            cancel_token (CancellationToken, optional): Cancel the run from another thread with cancel_token.cancel()
             
         Returns:
             dict: Complete raw response with run steps, messages, and metadata
@@ -448,73 +553,68 @@ class FabricDataAgentClient:
             client = self._get_openai_client()
             
             # Create assistant and thread
-            assistant = client.beta.assistants.create(model="not used")
+            with telemetry.stage("assistant_create"):
+                assistant = resilience.call('assistants.create', client.beta.assistants.create, model="not used")
 
-            thread = self._get_existing_or_create_new_thread(
-                data_agent_url=self.data_agent_url,
-                thread_name=thread_name
-                )
+            with telemetry.stage("thread_lookup"):
+                thread = self._get_existing_or_create_new_thread(
+                    data_agent_url=self.data_agent_url,
+                    thread_name=thread_name
+                    )
 
             print(f"🧵 Existing or created thread: {thread}")
 
             # Send the question
-            client.beta.threads.messages.create(
-                thread_id=thread['id'],
-                role="user",
-                content=question
-            )
+            with telemetry.stage("messages_create"):
+                resilience.call(
+                    'messages.create',
+                    client.beta.threads.messages.create,
+                    thread_id=thread['id'],
+                    role="user",
+                    content=question,
+                    idempotent=False
+                )
             
             # Start the run
-            run = client.beta.threads.runs.create(
-                thread_id=thread['id'],
-                assistant_id=assistant.id
-            )
-            
-            # Monitor the run with timeout
-            start_time = time.time()
-            while run.status in ["queued", "in_progress"]:
-                if time.time() - start_time > timeout:
-                    print(f"⏰ Request timed out after {timeout} seconds")
-                    break
-                
-                print(f"⏳ Status: {run.status}")
-                time.sleep(2)
-                
-                run = client.beta.threads.runs.retrieve(
+            with telemetry.stage("runs_create"):
+                run = resilience.call(
+                    'runs.create',
+                    client.beta.threads.runs.create,
                     thread_id=thread['id'],
-                    run_id=run.id
+                    assistant_id=assistant.id,
+                    idempotent=False
                 )
             
+            # Monitor the run with timeout
+            run = self._wait_for_run(client, thread['id'], run, timeout=timeout, cancel_token=cancel_token)
+            
             print(f"✅ Final status: {run.status}")
             
             # Get all run details
-            steps = client.beta.threads.runs.steps.list(
-                thread_id=thread['id'],
-                run_id=run.id
-            )
+            with telemetry.stage("steps_list"):
+                steps = run_steps.list_steps(client, thread['id'], run.id)
             
-            messages = client.beta.threads.messages.list(
-                thread_id=thread['id'],
-                order="desc"
-            )
+            with telemetry.stage("messages_list"):
+                messages = self._list_run_messages(client, thread['id'], run.id, order="desc")
             
-            # Clean up resources
-            try:
-                client.beta.threads.delete(thread_id=thread['id'])
-            except Exception as cleanup_error:
-                print(f"⚠️ Cleanup warning: {cleanup_error}")
+            # Clean up single-use threads in the background, off the request path
+            if thread_name is None:
+                self._thread_cleaner.schedule_delete(thread['id'])
+            else:
+                self._record_exchange(thread_name, thread, question, "\n".join(self._extract_responses(messages)))
             
             # Return complete raw response
-            return {
-                "question": question,
-                "run": run.model_dump(),
-                "steps": steps.model_dump(),
-                "messages": messages.model_dump(),
-                "timestamp": time.time(),
-                "timeout": timeout,
-                "success": run.status == "completed",
-                "thread": thread
-            }
+            with telemetry.stage("serialization"):
+                return {
+                    "question": question,
+                    "run": run.model_dump(),
+                    "steps": steps.model_dump(),
+                    "messages": messages.model_dump(),
+                    "timestamp": time.time(),
+                    "timeout": timeout,
+                    "success": run.status == "completed",
+                    "thread": thread
+                }
             
         except Exception as e:
             print(f"❌ Error getting raw response: {e}")
@@ -525,6 +625,145 @@ class FabricDataAgentClient:
                 "success": False
             }
 
+    @telemetry.instrument("client.rerun_sql")
+    def rerun_sql(self, run_details: dict, server: str, database: str, max_rows: int = adhoc_sql.MAX_ROWS,
+                  query_index: Optional[int] = None, driver: str = "ODBC Driver 18 for SQL Server",
+                  fresh: bool = False) -> dict:
+        """
+        Re-execute the SQL of a get_run_details() result directly against the warehouse,
+        to get every row instead of the agent's preview. Only a single SELECT is run (see adhoc_sql.py).
+        
+        Args:
+            run_details (dict): A get_run_details() result
+            server (str): The warehouse's SQL endpoint
+            database (str): The warehouse (or lakehouse) name
+            max_rows (int): Rows to return at most; a longer result is flagged as truncated
+            query_index (int, optional): 1-based index into sql_queries; defaults to the data retrieval query
+            driver (str): ODBC driver name
+            fresh (bool): Run the query even if the same SQL was run within EXECUTE_SQL_CACHE_TTL
+            
+        Returns:
+            dict: sql, sql_hash, columns, data_table (list of dicts), row_count, truncated, cached
+        """
+        try:
+            if pyodbc is None:
+                raise ImportError("rerun_sql requires the pyodbc package")
+            sql = adhoc_sql.select_query(
+                run_details.get("sql_queries") or [], run_details.get("data_retrieval_query"), query_index
+            )
+            if sql is None:
+                raise ValueError("The run has no SQL query to execute")
+            sql = adhoc_sql.check_read_only(sql)
+
+            key = (adhoc_sql.sql_hash(sql), max_rows)
+            result = None if fresh else self._sql_results.get(key)
+            if result is not None:
+                return dict(result, cached=True)
+
+            with telemetry.stage("token"):
+                access_token = self.credential.get_token("https://database.windows.net/.default").token
+            with telemetry.stage("connect"):
+                connection = resilience.call(
+                    'sql.connect', pyodbc.connect,
+                    adhoc_sql.connection_string(server, database, driver),
+                    attrs_before=adhoc_sql.access_token_attrs(access_token)
+                )
+            try:
+                cursor = connection.cursor()
+                with query_limits.StatementWatch(cursor, query_limits.QUERY_TIMEOUT) as watch:
+                    try:
+                        # One row past the cap tells a complete result from a truncated one
+                        with telemetry.stage("execute"):
+                            cursor.execute(adhoc_sql.with_row_cap(sql, max_rows + 1))
+                        with telemetry.stage("fetch"):
+                            columns = [column[0] for column in cursor.description]
+                            rows, truncated_by = query_limits.fetch_rows(cursor, max_rows, query_limits.MAX_BYTES)
+                    except Exception as e:
+                        cancelled = watch.cancelled_error(e)
+                        if cancelled is not None:
+                            raise cancelled from e
+                        raise
+            finally:
+                connection.close()
+
+            result = {
+                "sql": sql,
+                "sql_hash": key[0],
+                "columns": columns,
+                "data_table": [dict(zip(columns, row)) for row in rows],
+                "row_count": len(rows),
+                "truncated": truncated_by is not None,
+                "truncated_by": truncated_by,
+                "timestamp": time.time(),
+                "success": True
+            }
+            self._sql_results.put(key, result)
+            print(f"🗃️ Re-executed SQL returned {len(rows)} rows{' (truncated)' if truncated_by else ''}")
+            return dict(result, cached=False)
+
+        except Exception as e:
+            print(f"❌ Error re-executing SQL: {e}")
+            return {"error": str(e), "success": False}
+
+    def _analyze_run(self, steps, messages) -> dict:
+        """
+        Extract SQL queries and data previews from the run steps and the final assistant message.
+        
+        Args:
+            steps: The run steps from the OpenAI API
+            messages: The thread messages from the OpenAI API
+            
+        Returns:
+            dict: Contains queries, data previews, and which query retrieved data
+        """
+        # Extract SQL queries and data from steps if lakehouse data source is detected
+        sql_analysis = self._extract_sql_queries_with_data(steps)
+        
+        # Also try the old regex method as backup
+        if not sql_analysis["queries"]:
+            regex_queries = self._extract_sql_queries(steps)
+            if regex_queries:
+                sql_analysis["queries"] = regex_queries
+                sql_analysis["data_retrieval_query"] = regex_queries[0] if regex_queries else None
+        
+        # Also extract data from the final assistant message
+        messages_data = messages.model_dump()
+        assistant_messages = [msg for msg in messages_data.get('data', []) if msg.get('role') == 'assistant']
+        if assistant_messages:
+            latest_message = assistant_messages[-1]
+            content = latest_message.get('content', [])
+            if content and len(content) > 0:
+                # Extract text content
+                text_content = ""
+                if isinstance(content[0], dict):
+                    if 'text' in content[0]:
+                        if isinstance(content[0]['text'], dict) and 'value' in content[0]['text']:
+                            text_content = content[0]['text']['value']
+                        else:
+                            text_content = str(content[0]['text'])
+                else:
+                    text_content = str(content[0])
+                
+                # Extract structured data from the assistant's text response
+                if text_content:
+                    text_data_preview = self._extract_data_from_text_response(text_content)
+                    if text_data_preview:
+                        # Add the text-based data preview
+                        if sql_analysis["queries"]:
+                            # If we have queries but no data previews, or empty previews, use the text-based one
+                            if not sql_analysis["data_previews"] or not any(sql_analysis["data_previews"]):
+                                sql_analysis["data_previews"] = [text_data_preview]
+                            else:
+                                # Add to existing previews
+                                sql_analysis["data_previews"].append(text_data_preview)
+                            
+                            # If we don't have a specific data retrieval query identified, use the first query
+                            if not sql_analysis["data_retrieval_query"] and sql_analysis["queries"]:
+                                sql_analysis["data_retrieval_query"] = sql_analysis["queries"][0]
+                                sql_analysis["data_retrieval_query_index"] = 1
+        
+        return sql_analysis
+
     def _extract_sql_queries_with_data(self, steps) -> dict:
         """
         Extract SQL queries from run steps using direct JSON parsing and output analysis.
@@ -1109,10 +1348,17 @@ def main(
         return
     
     try:
+        # Use a fixed bearer token (e.g. against mock_fabric_server.py) instead of browser sign-in
+        credential = None
+        if os.getenv("FABRIC_STATIC_TOKEN"):
+            from mock_fabric_server import StaticTokenCredential
+            credential = StaticTokenCredential(os.getenv("FABRIC_STATIC_TOKEN"))
+        
         # Initialize the client (this will trigger authentication)
         client = FabricDataAgentClient(
             tenant_id=TENANT_ID,
-            data_agent_url=DATA_AGENT_URL
+            data_agent_url=DATA_AGENT_URL,
+            credential=credential
         )
         
         print("\n" + "="*60)
@@ -9,16 +9,46 @@ Provides an input form where users can ask questions and see responses.
 import os
 import json
 import time
+import atexit
 import uuid
-from flask import Flask, render_template, request, jsonify, session
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, render_template, request, jsonify, session, g, Response
 from flask_cors import CORS
 from azure.identity import DeviceCodeCredential
 from openai import OpenAI
 import secrets
 import warnings
-import requests
 import pandas as pd
 import pyodbc
+import telemetry
+import recording
+import coalescing
+import admission
+import resilience
+import run_control
+import thread_cleanup
+import run_steps
+import snapshots
+import query_params
+import connection_pool
+import incremental
+import query_limits
+import derived
+import column_stats
+import question_router
+import adhoc_sql
+import query_catalog
+import thread_pool
+import thread_rollover
+
+# WebSocket progress streaming (GET /ws) needs the optional flask-sock package
+try:
+    from flask_sock import Sock, ConnectionClosed
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
 
 # Suppress OpenAI deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning, message=r".*Assistants API is deprecated.*")
@@ -27,7 +57,56 @@ app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)
 
 # Enable CORS for all routes - allows React frontend to communicate with Flask backend
-CORS(app, resources={r"/*": {"origins": "*"}})
+# Timing headers are exposed so the frontend can read per-request breakdowns
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['Server-Timing', 'X-Activity-Id'])
+
+# Per-request stage timings in the Server-Timing header; spans are exported over
+# OTLP when OTEL_EXPORTER_OTLP_ENDPOINT is set
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+telemetry.configure_tracing(os.getenv('OTEL_SERVICE_NAME', 'fabric-data-agent-flask'))
+
+# Concurrent identical stateless /run-details questions and /execute-query
+# aliases attach to one in-flight agent run or query instead of starting their own
+COALESCING_ENABLED = os.getenv('COALESCE_REQUESTS', 'true').lower() in ('1', 'true', 'yes')
+run_details_flight = coalescing.SingleFlight()
+query_flight = coalescing.SingleFlight()
+
+# Concurrency limits with bounded wait queues in front of Fabric runs and
+# warehouse queries (see admission.py for the ADMISSION_* settings)
+admission_controller = admission.AdmissionController()
+
+# POST /execute-queries runs up to this many of a request's aliases at once
+# (the query admission lane still bounds warehouse load across requests)
+BATCH_QUERY_CONCURRENCY = int(os.getenv('BATCH_QUERY_CONCURRENCY', '4'))
+BATCH_QUERY_MAX_ALIASES = int(os.getenv('BATCH_QUERY_MAX_ALIASES', '20'))
+
+# A run produces a handful of messages; one page always covers them
+RUN_MESSAGES_LIMIT = 100
+
+# Seconds between step listings of a streamed run that is in progress (also listed on status changes)
+PROGRESS_STEPS_INTERVAL = float(os.getenv('PROGRESS_STEPS_INTERVAL', '6'))
+
+if WEBSOCKETS_AVAILABLE:
+    sock = Sock(app)
+
+# Steps of finished runs, served again by GET /runs/<thread_id>/<run_id>
+steps_cache = run_steps.StepsCache()
+
+# Column profiles of results, computed once per result (see column_stats.py)
+column_stats_cache = column_stats.StatsCache()
+
+# Unnamed threads are deleted in the background once answered; stale ones are reaped
+thread_cleaner = thread_cleanup.create(lambda: get_openai_client(get_config()[1]))
+
+# Unnamed threads are created ahead of time in the background (see thread_pool.py);
+# not while recording or replaying, where every lookup belongs to a question's session
+spare_threads = None
+if thread_pool.ENABLED and recording.mode() == 'off':
+    spare_threads = thread_pool.SpareThreadPool(lambda: lookup_thread(get_config()[1]), thread_cleaner.schedule_delete)
+    atexit.register(spare_threads.drain)
+
+# Long named threads continue on a new thread under the same name (see thread_rollover.py)
+thread_rollovers = thread_rollover.ThreadRollover() if thread_rollover.ENABLED else None
 
 # Global variables
 credential = None
@@ -35,6 +114,14 @@ token = None
 auth_in_progress = False
 device_code_info = None
 
+# A fixed bearer token replaces device code authentication, e.g. when running
+# against mock_fabric_server.py for load tests
+if os.getenv('FABRIC_STATIC_TOKEN'):
+    from mock_fabric_server import StaticTokenCredential
+    credential = StaticTokenCredential(os.getenv('FABRIC_STATIC_TOKEN'))
+    token = credential.get_token("https://api.fabric.microsoft.com/.default")
+    print("Using static bearer token from FABRIC_STATIC_TOKEN")
+
 def get_config():
     """Get configuration from environment variables."""
     TENANT_ID = os.getenv("TENANT_ID")
@@ -75,13 +162,59 @@ def get_openai_client(data_agent_url):
             "Authorization": f"Bearer {current_token.token}",
             "Accept": "application/json",
             "Content-Type": "application/json",
-            "ActivityId": str(uuid.uuid4())
-        }
+            "ActivityId": telemetry.current_activity_id()
+        },
+        http_client=recording.http_client(),
+        # Retries are handled by resilience.call() so they are not stacked
+        max_retries=0
     )
 
 def get_or_create_thread(data_agent_url, thread_name=None):
-    """Get an existing thread or create a new thread."""
-    if thread_name is None:
+    """
+    Get an existing thread or create a new thread; a new unnamed thread comes from the spare pool when one is ready.
+    A named thread resolves to the name's current thread, which is replaced by a seeded new one once it is full.
+    """
+    if thread_name is None and spare_threads is not None:
+        thread = spare_threads.take()
+        if thread is not None:
+            return thread
+    if thread_name is None or thread_rollovers is None:
+        return lookup_thread(data_agent_url, thread_name)
+
+    return thread_rollovers.resolve(
+        thread_name,
+        lambda tag: lookup_thread(data_agent_url, tag),
+        lambda: get_openai_client(data_agent_url)
+    )
+
+def record_exchange(thread_name, thread, question, answer):
+    """Count a question answered on a named thread towards its rollover limits."""
+    if thread_name is None or thread_rollovers is None:
+        return
+    try:
+        thread_rollovers.record(thread_name, thread.get("tag", thread_name), question, answer)
+    except Exception as e:
+        print(f"Warning: could not record exchange on thread '{thread_name}': {e}")
+
+def assistant_reply(messages):
+    """The text of the assistant messages in a page of run messages, joined by newlines."""
+    responses = []
+    for msg in messages.data:
+        if msg.role == "assistant":
+            try:
+                content = msg.content[0]
+                if hasattr(content, 'text'):
+                    text_content = getattr(content, 'text', None)
+                    if text_content is not None and hasattr(text_content, 'value'):
+                        responses.append(text_content.value)
+            except (IndexError, AttributeError):
+                pass
+    return "\n".join(responses)
+
+def lookup_thread(data_agent_url, thread_name=None):
+    """Get the thread tagged thread_name, creating it if needed; None creates a new unnamed thread."""
+    unnamed = thread_name is None
+    if unnamed:
         thread_name = f'external-client-thread-{uuid.uuid4()}'
 
     if "aiskills" in data_agent_url:
@@ -96,14 +229,21 @@ def get_or_create_thread(data_agent_url, thread_name=None):
         "Authorization": f"Bearer {current_token.token}",
         "Accept": "application/json",
         "Content-Type": "application/json",
-        "ActivityId": str(uuid.uuid4())
+        "ActivityId": telemetry.current_activity_id()
     }
 
-    response = requests.get(get_thread_url, headers=headers)
-    response.raise_for_status()
-    thread = response.json()
+    def lookup():
+        response = recording.get(get_thread_url, headers=headers)
+        response.raise_for_status()
+        return response.json()
+
+    thread = resilience.call('thread_lookup', lookup)
     thread["name"] = thread_name
 
+    # Single-use threads are deleted after the request; the reaper catches any that are not
+    if unnamed:
+        thread_cleaner.track(thread['id'])
+
     return thread
 
 def load_query_config():
@@ -117,13 +257,23 @@ def load_query_config():
     except json.JSONDecodeError:
         raise ValueError(f"Invalid JSON in query configuration file at {config_path}")
 
+# Serializes read-modify-write updates of query_config.json
+query_config_lock = threading.Lock()
+
+def save_query_config(config):
+    """Replace query_config.json atomically, so a concurrent load never sees a partial file."""
+    config_path = os.path.join(os.path.dirname(__file__), 'query_config.json')
+    temporary_path = f"{config_path}.tmp"
+    with open(temporary_path, 'w') as f:
+        json.dump(config, f, indent=2)
+        f.write('\n')
+    os.replace(temporary_path, config_path)
+
 def get_database_connection():
     """
     Create and return a pyodbc connection to Azure SQL database.
     Uses the same Azure AD token as the Fabric Data Agent authentication.
     """
-    import struct
-
     config = load_query_config()
     db_config = config.get('database', {})
 
@@ -139,79 +289,271 @@ def get_database_connection():
 
     # Get Azure AD token using the same credential as Fabric Data Agent
     # Request token for database scope instead of Fabric API scope
-    current_token = credential.get_token("https://database.windows.net/.default")
+    with telemetry.stage("token"):
+        current_token = credential.get_token("https://database.windows.net/.default")
     access_token = current_token.token
 
     # Connection string without authentication info
-    conn_str = (
-        f"Driver={{{driver}}};"
-        f"Server={server},{port};"
-        f"Database={database};"
-        f"Encrypt={'yes' if encrypt else 'no'};"
-        f"TrustServerCertificate={'yes' if trust_cert else 'no'};"
-    )
-
-    # SQL_COPT_SS_ACCESS_TOKEN constant for setting Azure AD token
-    SQL_COPT_SS_ACCESS_TOKEN = 1256
+    conn_str = adhoc_sql.connection_string(server, database, driver, port, encrypt, trust_cert)
 
-    # Properly encode the token for SQL Server
-    # The token must be in UTF-16-LE format with a specific structure
-    token_bytes = access_token.encode('utf-16-le')
-    token_struct = struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
-
-    # Create connection with pre-connect attribute for token
-    conn = pyodbc.connect(conn_str, attrs_before={SQL_COPT_SS_ACCESS_TOKEN: token_struct})
+    # Create connection with pre-connect attribute for token. Pooled connections are
+    # reused for many queries, so autocommit keeps each SELECT on a fresh snapshot
+    # instead of one long implicit transaction.
+    with telemetry.stage("connect"):
+        conn = resilience.call('sql.connect', pyodbc.connect, conn_str, autocommit=True,
+                               attrs_before=adhoc_sql.access_token_attrs(access_token))
 
     return conn
 
-def execute_query_by_alias(query_alias):
-    """
-    Execute a SQL query by its alias from query_config.json.
-    Returns the results formatted as a list of dictionaries.
-    """
-    config = load_query_config()
-    queries = config.get('queries', {})
+# Warehouse connections are pooled; each keeps a cursor (prepared statement) per alias
+sql_pool = connection_pool.ConnectionPool(get_database_connection)
+
+def get_query_info(query_alias):
+    """Look up an alias in query_config.json."""
+    queries = load_query_config().get('queries', {})
 
     if query_alias not in queries:
         available_aliases = list(queries.keys())
         raise ValueError(f"Query alias '{query_alias}' not found. Available aliases: {available_aliases}")
 
     query_info = queries[query_alias]
-    query = query_info.get('query')
-
-    if not query:
+    if not query_info.get('query') and not query_info.get('derived_from'):
         raise ValueError(f"No query found for alias '{query_alias}'")
+    return query_info
 
-    conn = get_database_connection()
-
+def metrics_alias(query_alias):
+    """The alias label for metrics: the alias if it is configured, else "unknown", so requests cannot add labels."""
     try:
-        # Use pandas to read SQL with pyodbc connection
-        df = pd.read_sql(query, conn)
+        configured = query_alias in load_query_config().get('queries', {})
+    except ValueError:
+        configured = False
+    return query_alias if configured else 'unknown'
 
-        # Convert DataFrame to list of dictionaries (similar to data_table format)
-        result_data = df.to_dict('records')
+def execute_query_by_alias(query_alias, parameters=None, cancel_token=None, keep_watermark=False):
+    """
+    Execute a SQL query by its alias from query_config.json.
+    parameters are validated against the alias's typed parameters and bound with parameter markers.
+    The statement is cancelled on the alias's timeout or when cancel_token fires, and the result
+    is cut off at its row and byte budget (see query_limits.py).
+    A derived alias runs its base alias and transforms the result (see derived.py).
+    A watermark column the alias does not expose is dropped unless keep_watermark (see incremental.py).
+    Returns the results formatted as a list of dictionaries.
+    """
+    aliases = derived.chain(query_alias, get_query_info)
+    if len(aliases) > 1:
+        result = execute_query_by_alias(aliases[-1][0], parameters, cancel_token)
+        for alias, info in reversed(aliases[:-1]):
+            result = derived.derive(alias, info, result)
+        return result
+
+    query_info = aliases[0][1]
+    values = query_params.resolve(query_info, parameters)
+    statement = query_params.statement(query_info)
+    bind_values = query_params.bind_values(query_info, values)
+
+    with telemetry.labels(alias=query_alias):
+        try:
+            df, truncated_by = run_statement(statement, bind_values, query_limits.limits(query_info), cancel_token)
+
+            # Convert DataFrame to list of dictionaries (similar to data_table format)
+            result_data = df.to_dict('records')
+
+            result = {
+                'success': True,
+                'query_alias': query_alias,
+                'query_name': query_info.get('name', ''),
+                'query_description': query_info.get('description', ''),
+                'parameters': query_params.to_json(values),
+                'data_table': result_data,
+                'row_count': len(result_data),
+                'columns': list(df.columns),
+                'truncated': truncated_by is not None,
+                'truncated_by': truncated_by,
+                'timestamp': time.time()
+            }
+            return result if keep_watermark else incremental.without_watermark(query_info, result)
+        except (resilience.CircuitOpenError, query_limits.QueryCancelledError):
+            raise
+        except Exception as e:
+            raise Exception(f"Error executing query '{query_alias}': {str(e)}")
 
-        return {
-            'success': True,
-            'query_alias': query_alias,
-            'query_name': query_info.get('name', ''),
-            'query_description': query_info.get('description', ''),
-            'data_table': result_data,
-            'row_count': len(result_data),
-            'columns': list(df.columns),
-            'timestamp': time.time()
-        }
-    except Exception as e:
-        raise Exception(f"Error executing query '{query_alias}': {str(e)}")
-    finally:
-        # Close the connection
-        conn.close()
+def run_statement(statement, bind_values, limits, cancel_token=None):
+    """
+    Execute a statement on a pooled cursor within its timeout and row/byte budget (see query_limits.limits).
+    Returns (DataFrame, truncated_by).
+    """
+    def run_query():
+        with sql_pool.cursor(statement) as cursor:
+            with query_limits.StatementWatch(cursor, limits['timeout'], cancel_token) as watch:
+                try:
+                    # Execute and fetch separately (instead of pd.read_sql) so each stage is timed
+                    with telemetry.stage("execute"):
+                        cursor.execute(statement, *bind_values)
+
+                    with telemetry.stage("fetch"):
+                        columns = [column[0] for column in cursor.description]
+                        rows, truncated_by = query_limits.fetch_rows(cursor, limits['max_rows'], limits['max_bytes'])
+                        return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True), truncated_by
+                except Exception as e:
+                    # A cancelled statement is reported as such and never retried
+                    cancelled = watch.cancelled_error(e)
+                    if cancelled is not None:
+                        raise cancelled from e
+                    raise
+
+    # A pooled connection that went stale is discarded and the query retried once on a new one
+    return resilience.call('sql.query', run_query, max_attempts=2)
+
+def result_stats_key(result):
+    """column_stats_cache key of a result: a new one whenever the result is re-run."""
+    if 'query_alias' in result:
+        return ('query', result['query_alias'], query_params.cache_key(result.get('parameters') or {}), result['timestamp'])
+    # A routed /run-details answer carries the timestamp of the alias result it came from
+    route = result.get('route')
+    if route and route.get('query_alias'):
+        return ('query', route['query_alias'], query_params.cache_key(route.get('parameters') or {}), result['timestamp'])
+    return ('run', result['timestamp'])
+
+def with_column_stats(result):
+    """result with the column_stats profile of its data_table, computed once per result."""
+    stats = column_stats_cache.get(result_stats_key(result), result.get('data_table') or [], result.get('columns'))
+    return dict(result, column_stats=stats)
+
+def wants_column_stats(data):
+    """True if ?column_stats=1 or "column_stats": true was sent."""
+    return request.args.get('column_stats', '').lower() in ('1', 'true', 'yes') or str((data or {}).get('column_stats', '')).lower() in ('1', 'true', 'yes')
+
+def refresh_snapshot(query_alias):
+    """Run a scheduled alias for its snapshot, in the query admission lane; incrementally when it has a watermark."""
+    if credential is None:
+        raise RuntimeError("Not authenticated. Please complete authentication first.")
+    result = incremental.refresh(
+        query_alias,
+        get_query_info(query_alias),
+        snapshot_store.get(query_alias),
+        lambda parameters: admission_controller.run('query', execute_query_by_alias, query_alias, parameters, keep_watermark=True)
+    )
+    # Profile the new snapshot in the background rather than on the first request for it
+    column_stats_cache.get(result_stats_key(result), result['data_table'], result.get('columns'))
+    return result
+
+# Results of derived aliases, computed once per snapshot of their base alias
+derived_cache = derived.DerivedCache()
+
+# Aliases with a "schedule" in query_config.json are re-run in the background and
+# /execute-query serves their latest snapshot (see snapshots.py)
+SNAPSHOTS_ENABLED = os.getenv('QUERY_SNAPSHOTS', 'true').lower() in ('1', 'true', 'yes')
+snapshot_store = snapshots.SnapshotStore()
+snapshot_scheduler = snapshots.SnapshotScheduler(load_query_config, refresh_snapshot, snapshot_store)
+if SNAPSHOTS_ENABLED:
+    snapshot_scheduler.start()
+
+@app.before_request
+def start_request_telemetry():
+    """Start request timing, the root span and the ActivityId shared by every Fabric call."""
+    g.metrics_alias = ''
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.telemetry = telemetry.begin_request(endpoint, span_name=f"{request.method} {endpoint}")
+
+@app.after_request
+def record_request_telemetry(response):
+    """Record request metrics and add Server-Timing and ActivityId headers."""
+    request_telemetry = g.get('telemetry')
+    if request_telemetry is not None:
+        telemetry.record_request(
+            request_telemetry.endpoint,
+            response.status_code,
+            request_telemetry.elapsed(),
+            alias=g.get('metrics_alias', '')
+        )
+        if SERVER_TIMING_ENABLED:
+            response.headers['Server-Timing'] = request_telemetry.server_timing()
+            response.headers['Timing-Allow-Origin'] = '*'
+        response.headers['X-Activity-Id'] = request_telemetry.activity_id
+        g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_telemetry(exc):
+    """End the request span and reset per-request telemetry context."""
+    recording_session = g.pop('recording_session', None)
+    if recording_session is not None:
+        recording_session.close()
+    request_telemetry = g.pop('telemetry', None)
+    if request_telemetry is not None:
+        request_telemetry.finish(status_code=g.get('response_status'), error=exc)
+
+def request_lane():
+    """Admission lane for an agent request: 'batch' when sent with X-Request-Priority: batch."""
+    if request.headers.get('X-Request-Priority', '').lower() == 'batch':
+        return 'batch'
+    return 'interactive'
+
+def service_unavailable_response(error):
+    """Fast 503 for a request that could not be admitted in time or whose Fabric/warehouse circuit is open."""
+    body = {
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after
+    }
+    if isinstance(error, admission.AdmissionRejected):
+        body['lane'] = error.lane
+    else:
+        body['circuit'] = error.target
+    response = jsonify(body)
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def request_cancel_token(allow_disconnect_cancel=None, environ=None):
+    """
+    Cancellation token that fires when the HTTP client disconnects.
+    allow_disconnect_cancel, if given, must also return True for the disconnect to cancel the run.
+    environ defaults to the current request's.
+    """
+    disconnected = run_control.environ_disconnect_check(environ if environ is not None else request.environ)
+    if disconnected is None:
+        return run_control.CancellationToken()
+    if allow_disconnect_cancel is None:
+        return run_control.CancellationToken(check=disconnected)
+    return run_control.CancellationToken(check=lambda: disconnected() and allow_disconnect_cancel())
+
+def run_cancelled_response(error):
+    """504 for a run cancelled on timeout, 499 (client closed request) for one cancelled on disconnect."""
+    print(f"Run cancelled: {error}")
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'cancelled': True,
+        'reason': error.reason,
+        'run_status': error.run.status
+    }), 504 if error.reason == 'timeout' else 499
+
+def query_cancelled_response(error):
+    """504 for a query cancelled on timeout, 499 (client closed request) for one cancelled on disconnect."""
+    print(f"Query cancelled: {error}")
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'cancelled': True,
+        'reason': error.reason
+    }), 504 if error.reason == 'timeout' else 499
 
 @app.route('/')
 def index():
     """Render the main page with input form."""
     return render_template('index.html')
 
+@app.route('/metrics')
+def metrics():
+    """Expose Prometheus metrics for requests and run/query stages."""
+    body, content_type = telemetry.render_metrics()
+    if body is None:
+        return jsonify({
+            'error': 'Metrics unavailable: prometheus_client is not installed'
+        }), 501
+    return Response(body, mimetype=content_type)
+
 @app.route('/auth/start', methods=['GET', 'POST'])
 def start_auth():
     """Start device code authentication flow."""
@@ -259,6 +601,10 @@ def start_auth():
             try:
                 token = credential.get_token("https://api.fabric.microsoft.com/.default")
                 print("Authentication successful!")
+                # Pooled warehouse connections logged in with the previous credential
+                sql_pool.clear()
+                # Scheduled snapshots failed while unauthenticated; refresh them now
+                snapshot_scheduler.wake()
             except Exception as e:
                 print(f"Authentication failed: {e}")
             finally:
@@ -307,7 +653,8 @@ def ask_question():
             'description': 'Ask a question to the Fabric Data Agent and get a simple response',
             'request_body': {
                 'question': '(required) The question to ask',
-                'thread_name': '(optional) Name for the conversation thread'
+                'thread_name': '(optional) Name for the conversation thread',
+                'route': '(optional) false to always ask the agent, even for questions a query alias answers'
             },
             'example_curl': 'curl -X POST http://localhost:5000/ask -H "Content-Type: application/json" -d \'{"question": "What tables are available?"}\''
         })
@@ -333,62 +680,99 @@ def ask_question():
                 'error': 'Question cannot be empty'
             }), 400
 
-        # Create OpenAI client and process question
-        client = get_openai_client(data_agent_url)
-        assistant = client.beta.assistants.create(model="not used")
+        # Record or replay every Fabric exchange for this question (FABRIC_RECORD_MODE)
+        g.recording_session = recording.begin_session('/ask', question, thread_name)
+
+        # Stateless questions that a query alias answers are served without the agent
+        routed = route_question(question, request_cancel_token) if thread_name is None and wants_routing(data) else None
+        if routed is not None:
+            match, query_result, _ = routed
+            g.metrics_alias = match['alias']
+            response_text = question_router.answer_text(query_result, question_router.ANSWER_TABLE_ROWS)
+            record_answer_path(match['method'])
+        else:
+            # Wait for a slot in the interactive (or batch) lane before starting a run;
+            # the run is cancelled if the client disconnects
+            response_text = admission_controller.run(
+                request_lane(), answer_for_question, data_agent_url, question, thread_name,
+                cancel_token=request_cancel_token()
+            )
+            record_answer_path('agent')
+
+        with telemetry.stage("serialization"):
+            body = {
+                'success': True,
+                'question': question,
+                'response': response_text,
+                'answered_by': 'query_config' if routed is not None else 'agent'
+            }
+            if routed is not None:
+                body['route'] = dict(routed[0], query_alias=routed[1]['query_alias'], snapshot_at=routed[1].get('snapshot_at'))
+            return jsonify(body)
+
+    except (admission.AdmissionRejected, resilience.CircuitOpenError) as e:
+        return service_unavailable_response(e)
+
+    except run_control.RunCancelledError as e:
+        return run_cancelled_response(e)
+
+    except query_limits.QueryCancelledError as e:
+        return query_cancelled_response(e)
+
+    except Exception as e:
+        print(f"Error in /ask endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def answer_for_question(data_agent_url, question, thread_name=None, cancel_token=None) -> str:
+    """Ask a question on a thread, wait for the run and return the assistant's reply text."""
+    # Create OpenAI client and process question
+    client = get_openai_client(data_agent_url)
+    with telemetry.stage("assistant_create"):
+        assistant = resilience.call('assistants.create', client.beta.assistants.create, model="not used")
 
+    with telemetry.stage("thread_lookup"):
         thread = get_or_create_thread(data_agent_url, thread_name)
 
-        client.beta.threads.messages.create(
+    with telemetry.stage("messages_create"):
+        user_message = resilience.call(
+            'messages.create',
+            client.beta.threads.messages.create,
             thread_id=thread['id'],
             role="user",
-            content=question
+            content=question,
+            idempotent=False
         )
 
-        run = client.beta.threads.runs.create(
+    with telemetry.stage("runs_create"):
+        run = resilience.call(
+            'runs.create',
+            client.beta.threads.runs.create,
             thread_id=thread['id'],
-            assistant_id=assistant.id
+            assistant_id=assistant.id,
+            idempotent=False
         )
 
-        # Monitor run
-        start_time = time.time()
-        timeout = 120
-        while run.status in ["queued", "in_progress"]:
-            if time.time() - start_time > timeout:
-                break
-            time.sleep(2)
-            run = client.beta.threads.runs.retrieve(thread_id=thread['id'], run_id=run.id)
+    # Monitor run
+    run = wait_for_run(client, thread['id'], run, cancel_token=cancel_token)
 
-        # Get messages
-        messages = client.beta.threads.messages.list(thread_id=thread['id'], order="asc")
+    # Get messages
+    with telemetry.stage("messages_list"):
+        messages = list_run_messages(client, thread['id'], run.id, after=user_message.id)
 
-        # Extract response
-        responses = []
-        for msg in messages.data:
-            if msg.role == "assistant":
-                try:
-                    content = msg.content[0]
-                    if hasattr(content, 'text'):
-                        text_content = getattr(content, 'text', None)
-                        if text_content is not None and hasattr(text_content, 'value'):
-                            responses.append(text_content.value)
-                except (IndexError, AttributeError):
-                    pass
+    # Extract response
+    with telemetry.stage("extraction"):
+        response_text = assistant_reply(messages) or "No response received from the data agent."
 
-        response_text = "\n".join(responses) if responses else "No response received from the data agent."
+    if thread_name is None:
+        thread_cleaner.schedule_delete(thread['id'])
+    else:
+        record_exchange(thread_name, thread, question, response_text)
 
-        return jsonify({
-            'success': True,
-            'question': question,
-            'response': response_text
-        })
+    return response_text
 
-    except Exception as e:
-        print(f"Error in /ask endpoint: {e}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
 
 @app.route('/run-details', methods=['GET', 'POST'])
 def get_run_details():
@@ -406,7 +790,9 @@ def get_run_details():
             'description': 'Ask a question and return detailed run information including steps, messages, and SQL queries',
             'request_body': {
                 'question': '(required) The question to ask',
-                'thread_name': '(optional) Name for the conversation thread'
+                'thread_name': '(optional) Name for the conversation thread',
+                'column_stats': '(optional) true to include per-column profiles of data_table (or ?column_stats=1)',
+                'route': '(optional) false to always ask the agent, even for questions a query alias answers'
             },
             'response_fields': {
                 'success': 'boolean - whether the request succeeded',
@@ -414,12 +800,15 @@ def get_run_details():
                 'run_status': 'string - final status of the run (completed, failed, etc.)',
                 'run_steps': 'object - detailed step-by-step execution info',
                 'data_table' : 'object - data table formatted as json key/value pairs',
-                'messages': 'object - full message history',
+                'messages': 'object - messages created by this run',
                 'timestamp': 'number - when the request was processed',
                 'sql_queries': '(optional) array - extracted SQL queries if lakehouse data source',
                 'sql_data_previews': '(optional) array - data previews from query results',
-                'data_retrieval_query': '(optional) string - the specific query that retrieved data'
-                
+                'data_retrieval_query': '(optional) string - the specific query that retrieved data',
+                'column_stats': '(optional) object - per-column profiles of data_table',
+                'answered_by': 'string - "query_config" if a query alias answered the question without the agent, else "agent"',
+                'route': '(optional) object - the alias that answered and how the question matched it (exact or lexical, with its score)'
+
             },
             'example_curl': 'curl -X POST http://localhost:5000/run-details -H "Content-Type: application/json" -d \'{"question": "What tables are available?"}\''
         })
@@ -445,125 +834,328 @@ def get_run_details():
                 'error': 'Question cannot be empty'
             }), 400
 
-        # Create OpenAI client and process question
-        client = get_openai_client(data_agent_url)
-        assistant = client.beta.assistants.create(model="not used")
+        # Record or replay every Fabric exchange for this question (FABRIC_RECORD_MODE)
+        g.recording_session = recording.begin_session('/run-details', question, thread_name)
+
+        # Stateless questions that a query alias answers are served without the agent
+        routed = route_question(question, request_cancel_token) if thread_name is None and wants_routing(data) else None
+
+        # Identical stateless questions asked concurrently share one agent run;
+        # only the run itself takes an admission slot
+        lane = request_lane()
+        if routed is not None:
+            match, query_result, sql = routed
+            g.metrics_alias = match['alias']
+            result = question_router.run_details_result(question, match, query_result, sql)
+        elif thread_name is None and COALESCING_ENABLED:
+            key = (lane, coalescing.normalize_question(question))
+            # A shared run is only cancelled on disconnect if nobody else is waiting for it
+            cancel_token = request_cancel_token(lambda: run_details_flight.waiters(key) == 0)
+            wait_start = time.perf_counter()
+            result, shared = run_details_flight.do(
+                key,
+                lambda: admission_controller.run(
+                    lane, run_details_for_question, data_agent_url, question, cancel_token=cancel_token
+                ),
+                cancel_token=request_cancel_token()
+            )
+            if shared:
+                telemetry.observe_stage("coalesced_wait", time.perf_counter() - wait_start)
+                telemetry.record_coalesced()
+                result = dict(result, question=question)
+        else:
+            result = admission_controller.run(
+                lane, run_details_for_question, data_agent_url, question, thread_name,
+                cancel_token=request_cancel_token()
+            )
+        record_answer_path(routed[0]['method'] if routed is not None else 'agent')
+
+        if wants_column_stats(data):
+            with telemetry.stage("column_stats"):
+                result = with_column_stats(result)
+
+        with telemetry.stage("serialization"):
+            return jsonify(result)
+
+    except (admission.AdmissionRejected, resilience.CircuitOpenError) as e:
+        return service_unavailable_response(e)
+
+    except run_control.RunCancelledError as e:
+        return run_cancelled_response(e)
+
+    except query_limits.QueryCancelledError as e:
+        return query_cancelled_response(e)
+
+    except coalescing.WaitCancelledError as e:
+        print(f"Stopped waiting for a shared run: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'cancelled': True,
+            'reason': e.reason
+        }), 499
+
+    except Exception as e:
+        print(f"Error in /run-details endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 
+def run_details_for_question(data_agent_url, question, thread_name=None, cancel_token=None, on_event=None) -> dict:
+    """
+    Ask a question on a thread, wait for the run and build the /run-details result.
+    on_event, if given, is called with each progress event (see RunProgress).
+    """
+    started = time.perf_counter()
+    # Create OpenAI client and process question
+    client = get_openai_client(data_agent_url)
+    with telemetry.stage("assistant_create"):
+        assistant = resilience.call('assistants.create', client.beta.assistants.create, model="not used")
+
+    with telemetry.stage("thread_lookup"):
         thread = get_or_create_thread(data_agent_url, thread_name)
 
-        client.beta.threads.messages.create(
+    with telemetry.stage("messages_create"):
+        user_message = resilience.call(
+            'messages.create',
+            client.beta.threads.messages.create,
             thread_id=thread['id'],
             role="user",
-            content=question
+            content=question,
+            idempotent=False
         )
 
-        run = client.beta.threads.runs.create(
+    with telemetry.stage("runs_create"):
+        run = resilience.call(
+            'runs.create',
+            client.beta.threads.runs.create,
             thread_id=thread['id'],
-            assistant_id=assistant.id
+            assistant_id=assistant.id,
+            idempotent=False
         )
 
-        # Monitor run
-        start_time = time.time()
-        timeout = 120
-        while run.status in ["queued", "in_progress"]:
-            if time.time() - start_time > timeout:
+    # Monitor run
+    progress = RunProgress(client, thread['id'], on_event) if on_event is not None else None
+    run = wait_for_run(client, thread['id'], run, cancel_token=cancel_token,
+                       on_status=progress.on_status if progress is not None else None)
+
+    # Get every run step, following the pagination cursor
+    with telemetry.stage("steps_list"):
+        steps = run_steps.list_steps(client, thread['id'], run.id)
+    steps_cache.put(thread['id'], run.id, run.status, steps)
+
+    # Steps that completed after the last poll
+    if progress is not None:
+        progress.publish_status(run)
+        progress.publish_steps(steps)
+
+    # Get messages
+    with telemetry.stage("messages_list"):
+        messages = list_run_messages(client, thread['id'], run.id, after=user_message.id)
+
+    with telemetry.stage("extraction"):
+        result = build_run_details_result(question, run, steps, messages)
+
+    # Catalog the SQL the agent generated; frequent queries can be promoted to aliases
+    if query_catalog_store is not None and run.status == 'completed' and result.get('data_retrieval_query'):
+        try:
+            query_catalog_store.record(question, result['data_retrieval_query'], time.perf_counter() - started)
+        except Exception as e:
+            print(f"Warning: could not record query in the catalog: {e}")
+
+    if thread_name is None:
+        thread_cleaner.schedule_delete(thread['id'])
+    else:
+        record_exchange(thread_name, thread, question, assistant_reply(messages))
+
+    return result
+
+
+def list_run_messages(client, thread_id, run_id, after=None):
+    """
+    List only the messages created by one run, oldest first, however long the thread is.
+    Uses the run_id filter, an after cursor at the question's message and a page limit.
+    """
+    params = {'thread_id': thread_id, 'run_id': run_id, 'order': "asc", 'limit': RUN_MESSAGES_LIMIT}
+    if after is not None:
+        params['after'] = after
+    return resilience.call('messages.list', client.beta.threads.messages.list, **params)
+
+
+def wait_for_run(client, thread_id, run, timeout=120, cancel_token=None, on_status=None):
+    """Poll a run until it finishes; cancel it on timeout or when cancel_token is cancelled."""
+    return run_control.poll_run(client, thread_id, run, timeout=timeout, cancel_token=cancel_token, on_status=on_status)
+
+
+class RunProgress:
+    """
+    Publishes the progress of a run while it is polled: status changes, then each
+    tool-call step once it completes, followed by the SQL and table rows extracted from it.
+    Steps are listed on status changes and every PROGRESS_STEPS_INTERVAL seconds, only
+    after the last step of the leading run of completed ones.
+
+    Events passed to emit:
+        {'type': 'status', 'run_id', 'status'}
+        {'type': 'step', 'run_id', 'step'}
+        {'type': 'sql', 'run_id', 'step_id', 'queries'}
+        {'type': 'table', 'run_id', 'step_id', 'rows'}
+    """
+
+    def __init__(self, client, thread_id, emit):
+        self.client = client
+        self.thread_id = thread_id
+        self.emit = emit
+        self.status = None
+        self.published_steps = set()
+        # Steps up to this ID have all completed and are not listed again
+        self.steps_after = None
+        self.steps_listed_at = None
+
+    def on_status(self, run):
+        """poll_run callback: publish a status change and the steps completed so far."""
+        changed = run.status != self.status
+        self.publish_status(run)
+        if run.status != 'in_progress':
+            return
+        now = time.monotonic()
+        if not changed and self.steps_listed_at is not None and now - self.steps_listed_at < PROGRESS_STEPS_INTERVAL:
+            return
+        self.steps_listed_at = now
+        try:
+            steps = run_steps.list_steps(self.client, self.thread_id, run.id, order="asc", after=self.steps_after)
+        except Exception as e:
+            print(f"Warning: could not list steps of run {run.id}: {e}")
+            return
+        self.publish_steps(steps)
+        for step in steps.data:
+            if step.status != 'completed':
                 break
-            time.sleep(2)
-            run = client.beta.threads.runs.retrieve(thread_id=thread['id'], run_id=run.id)
+            self.steps_after = step.id
 
-        # Get detailed run steps
-        steps = client.beta.threads.runs.steps.list(
-            thread_id=thread['id'],
-            run_id=run.id
-        )
+    def publish_status(self, run):
+        if run.status != self.status:
+            self.status = run.status
+            self.emit({'type': 'status', 'run_id': run.id, 'status': run.status})
 
-        # Get messages
-        messages = client.beta.threads.messages.list(thread_id=thread['id'], order="asc")
-
-        # Extract SQL queries and data from steps
-        sql_analysis = extract_sql_queries_with_data(steps)
-
-        # Also try regex method as backup
-        if not sql_analysis["queries"]:
-            regex_queries = extract_sql_queries(steps)
-            if regex_queries:
-                sql_analysis["queries"] = regex_queries
-                sql_analysis["data_retrieval_query"] = regex_queries[0] if regex_queries else None
-
-        # Extract data from the final assistant message
-        messages_data = messages.model_dump()
-        assistant_messages = [msg for msg in messages_data.get('data', []) if msg.get('role') == 'assistant']
-        if assistant_messages:
-            latest_message = assistant_messages[-1]
-            content = latest_message.get('content', [])
-            if content and len(content) > 0:
-                text_content = ""
-                if isinstance(content[0], dict):
-                    if 'text' in content[0]:
-                        if isinstance(content[0]['text'], dict) and 'value' in content[0]['text']:
-                            text_content = content[0]['text']['value']
-                        else:
-                            text_content = str(content[0]['text'])
-                else:
-                    text_content = str(content[0])
-
-                if text_content:
-                    text_data_preview = extract_data_from_text_response(text_content)
-                    if text_data_preview:
-                        if not sql_analysis["data_previews"] or not any(sql_analysis["data_previews"]):
-                            sql_analysis["data_previews"] = [text_data_preview]
-                        else:
-                            sql_analysis["data_previews"].append(text_data_preview)
-
-                        if not sql_analysis["data_retrieval_query"] and sql_analysis["queries"]:
-                            sql_analysis["data_retrieval_query"] = sql_analysis["queries"][0]
-                            sql_analysis["data_retrieval_query_index"] = 1
-
-        #Parse markdown table into json data
-        steps_data = steps.model_dump()
-        table_data = []
-        for datum in steps_data["data"]:
-            for tool in datum["step_details"]["tool_calls"]:
-                try:
-                    if tool["function"]["name"] =="trace.analyze_semantic_model":
-                        md_data = tool["function"]["output"]
-                        lines = md_data.strip().split('\n')
-    
-                        # Parse headers (remove brackets and whitespace)
-                        headers = [h.strip().strip('[]') for h in lines[0].split('|') if h.strip()]
-                                             
-                        for line in lines[2:]:
-                            values = [v.strip() for v in line.split('|') if v.strip()]
-                            if values:
-                                table_data.append(dict(zip(headers, values)))
-                except Exception as e:
-                    print(e)
-
-        # Build result
-        result = {
-            "success": True,
-            "question": question,
-            "run_status": run.status,
-            "run_steps": steps_data,
-            "messages": messages_data,
-            "timestamp": time.time(),
-            "data_table" : table_data
-        }
-
-        # Add SQL analysis if found
-        if sql_analysis["queries"]:
-            result["sql_queries"] = sql_analysis["queries"]
-            result["sql_data_previews"] = sql_analysis["data_previews"]
-            result["data_retrieval_query"] = sql_analysis["data_retrieval_query"]
-
-        return jsonify(result)
+    def publish_steps(self, steps):
+        """Publish completed steps not published yet, oldest first."""
+        for step in sorted(steps.data, key=lambda step: step.created_at or 0):
+            if step.status != 'completed' or step.id in self.published_steps:
+                continue
+            self.published_steps.add(step.id)
+            step_data = step.model_dump()
+            self.emit({'type': 'step', 'run_id': step.run_id, 'step': step_data})
+
+            tool_calls = getattr(step.step_details, 'tool_calls', None) or []
+            queries = []
+            for tool_call in tool_calls:
+                queries.extend(extract_sql_from_function_args(tool_call))
+                queries.extend(extract_sql_from_output(tool_call))
+            if queries:
+                self.emit({'type': 'sql', 'run_id': step.run_id, 'step_id': step.id, 'queries': list(dict.fromkeys(queries))})
+
+            rows = []
+            for tool in step_data['step_details'].get('tool_calls') or []:
+                rows.extend(extract_semantic_model_table(tool))
+            if rows:
+                self.emit({'type': 'table', 'run_id': step.run_id, 'step_id': step.id, 'rows': rows})
+
+
+def build_run_details_result(question, run, steps, messages) -> dict:
+    """Build the /run-details response body: SQL analysis, data previews and the parsed data table."""
+    sql_analysis = analyze_run_sql(steps)
+
+    # Extract data from the final assistant message
+    messages_data = messages.model_dump()
+    assistant_messages = [msg for msg in messages_data.get('data', []) if msg.get('role') == 'assistant']
+    if assistant_messages:
+        latest_message = assistant_messages[-1]
+        content = latest_message.get('content', [])
+        if content and len(content) > 0:
+            text_content = ""
+            if isinstance(content[0], dict):
+                if 'text' in content[0]:
+                    if isinstance(content[0]['text'], dict) and 'value' in content[0]['text']:
+                        text_content = content[0]['text']['value']
+                    else:
+                        text_content = str(content[0]['text'])
+            else:
+                text_content = str(content[0])
+
+            if text_content:
+                text_data_preview = extract_data_from_text_response(text_content)
+                if text_data_preview:
+                    if not sql_analysis["data_previews"] or not any(sql_analysis["data_previews"]):
+                        sql_analysis["data_previews"] = [text_data_preview]
+                    else:
+                        sql_analysis["data_previews"].append(text_data_preview)
+
+                    if not sql_analysis["data_retrieval_query"] and sql_analysis["queries"]:
+                        sql_analysis["data_retrieval_query"] = sql_analysis["queries"][0]
+                        sql_analysis["data_retrieval_query_index"] = 1
+
+    #Parse markdown table into json data
+    steps_data = steps.model_dump()
+    table_data = []
+    for datum in steps_data["data"]:
+        for tool in datum["step_details"]["tool_calls"]:
+            table_data.extend(extract_semantic_model_table(tool))
+
+    # Build result
+    result = {
+        "success": True,
+        "question": question,
+        "run_status": run.status,
+        "run_steps": steps_data,
+        "messages": messages_data,
+        "timestamp": time.time(),
+        "data_table" : table_data,
+        "answered_by": "agent"
+    }
+
+    # Add SQL analysis if found
+    if sql_analysis["queries"]:
+        result["sql_queries"] = sql_analysis["queries"]
+        result["sql_data_previews"] = sql_analysis["data_previews"]
+        result["data_retrieval_query"] = sql_analysis["data_retrieval_query"]
+
+    return result
+
+
+def analyze_run_sql(steps) -> dict:
+    """SQL queries, data previews and the data retrieval query of a run's steps."""
+    # Extract SQL queries and data from steps
+    sql_analysis = extract_sql_queries_with_data(steps)
+
+    # Also try regex method as backup
+    if not sql_analysis["queries"]:
+        regex_queries = extract_sql_queries(steps)
+        if regex_queries:
+            sql_analysis["queries"] = regex_queries
+            sql_analysis["data_retrieval_query"] = regex_queries[0] if regex_queries else None
+    return sql_analysis
+
+
+def extract_semantic_model_table(tool) -> list:
+    """Parse the markdown table output of a trace.analyze_semantic_model tool call (as a dict) into rows."""
+    table_data = []
+    try:
+        if tool["function"]["name"] =="trace.analyze_semantic_model":
+            md_data = tool["function"]["output"]
+            lines = md_data.strip().split('\n')
+
+            # Parse headers (remove brackets and whitespace)
+            headers = [h.strip().strip('[]') for h in lines[0].split('|') if h.strip()]
 
+            for line in lines[2:]:
+                values = [v.strip() for v in line.split('|') if v.strip()]
+                if values:
+                    table_data.append(dict(zip(headers, values)))
     except Exception as e:
-        print(f"Error in /run-details endpoint: {e}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        print(e)
+    return table_data
 
 
 def extract_sql_queries_with_data(steps) -> dict:
@@ -999,6 +1591,104 @@ def find_sql_in_text(text: str) -> list:
     return sql_queries
 
 
+def serve_query(query_alias, supplied_parameters=None, fresh=False, cancel_token_factory=None):
+    """
+    Result of an alias for /execute-query: its snapshot, or a live (coalesced) run in the query lane.
+    cancel_token_factory(allow_disconnect_cancel) returns the token that cancels a live run
+    (see request_cancel_token); a coalesced query is only cancelled once nobody else waits for it.
+    Raises ValueError for unknown aliases and invalid parameters.
+    """
+    # A derived alias is computed from its base alias's result, once per base snapshot
+    aliases = derived.chain(query_alias, get_query_info)
+    if len(aliases) > 1:
+        result = serve_query(aliases[-1][0], supplied_parameters, fresh, cancel_token_factory)
+        for alias, info in reversed(aliases[:-1]):
+            base_result = result
+            if base_result.get('snapshot_at') is None:
+                result = derived.derive(alias, info, base_result)
+            else:
+                key = (alias, query_params.cache_key(base_result['parameters']))
+                result = derived_cache.get(key, base_result, lambda: derived.derive(alias, info, base_result))
+        return result
+
+    # Resolve parameters once so the snapshot check, the coalescing key and the query agree
+    query_info = aliases[0][1]
+    parameters = query_params.to_json(query_params.resolve(query_info, supplied_parameters))
+
+    # Scheduled aliases are served from their latest snapshot unless fresh is requested;
+    # a snapshot only answers requests for the parameter values it was taken with
+    if not fresh:
+        snapshot = snapshot_store.get(query_alias)
+        if snapshot is not None and snapshot.get('parameters') == parameters:
+            return snapshot
+
+    # Execute the query, keeping the watermark column for the snapshot published below
+    if COALESCING_ENABLED:
+        key = (query_alias, query_params.cache_key(parameters))
+        wait_start = time.perf_counter()
+        cancel_token = cancel_token_factory(lambda: query_flight.waiters(key) == 0) if cancel_token_factory else None
+        try:
+            result, shared = query_flight.do(
+                key,
+                lambda: admission_controller.run(
+                    'query', execute_query_by_alias, query_alias, parameters,
+                    cancel_token=cancel_token, keep_watermark=True
+                ),
+                cancel_token=cancel_token_factory() if cancel_token_factory else None
+            )
+        except coalescing.WaitCancelledError as e:
+            raise query_limits.QueryCancelledError(e.reason, e.elapsed) from e
+        if shared:
+            telemetry.observe_stage("coalesced_wait", time.perf_counter() - wait_start, alias=query_alias)
+            telemetry.record_coalesced(alias=query_alias)
+    else:
+        cancel_token = cancel_token_factory() if cancel_token_factory else None
+        result = admission_controller.run('query', execute_query_by_alias, query_alias, parameters, cancel_token=cancel_token,
+                                          keep_watermark=True)
+
+    # A live run of a scheduled alias with its default parameters is also its newest snapshot
+    if snapshot_scheduler.scheduled(query_alias) and parameters == query_params.to_json(query_params.resolve(query_info)):
+        snapshot_store.publish(query_alias, incremental.full_result(query_info, result))
+    return dict(incremental.without_watermark(query_info, result), snapshot_at=None)
+
+# Questions that a query_config.json alias already answers skip the agent (see question_router.py)
+question_routes = question_router.QuestionRouter()
+
+def route_question(question, cancel_token_factory=None):
+    """
+    Serve a question from the query_config.json alias that answers it, if any.
+    Returns (match, result, sql) or None when the agent should answer, including when the alias fails.
+    Raises QueryCancelledError when the query was cancelled other than by its timeout (e.g. on disconnect).
+    """
+    if not question_router.ENABLED:
+        return None
+    try:
+        match = question_routes.match(question, load_query_config().get('queries', {}))
+        if match is None:
+            return None
+        with telemetry.labels(alias=match['alias']):
+            result = serve_query(match['alias'], cancel_token_factory=cancel_token_factory)
+        # A derived alias's rows come from its base alias's query
+        sql = derived.chain(match['alias'], get_query_info)[-1][1].get('query')
+    except query_limits.QueryCancelledError as e:
+        if e.reason != 'timeout':
+            raise
+        print(f"Warning: routed question timed out, asking the agent instead: {e}")
+        return None
+    except Exception as e:
+        print(f"Warning: routed question failed, asking the agent instead: {e}")
+        return None
+    return match, result, sql
+
+def wants_routing(data):
+    """False if "route": false was sent, to always ask the agent."""
+    return str((data or {}).get('route', True)).lower() not in ('0', 'false', 'no')
+
+def record_answer_path(path):
+    """Count a question answered by 'exact' or 'lexical' routing or by the 'agent'."""
+    question_routes.record(path)
+    telemetry.record_question_answered(path)
+
 @app.route('/execute-query', methods=['GET', 'POST'])
 def execute_query():
     """
@@ -1010,28 +1700,49 @@ def execute_query():
         try:
             config = load_query_config()
             available_queries = {}
-            for alias, query_info in config.get('queries', {}).items():
+            queries = config.get('queries', {})
+            for alias, query_info in queries.items():
                 available_queries[alias] = {
                     'name': query_info.get('name', ''),
-                    'description': query_info.get('description', '')
+                    'description': query_info.get('description', ''),
+                    'parameters': query_params.describe(query_info)
                 }
+                if query_info.get('derived_from'):
+                    # Derived aliases take the parameters of the alias they are computed from
+                    try:
+                        base_alias, base_info = derived.chain(alias, lambda name: queries.get(name) or {})[-1]
+                    except ValueError as e:
+                        available_queries[alias]['error'] = str(e)
+                        continue
+                    available_queries[alias]['derived_from'] = base_alias
+                    available_queries[alias]['parameters'] = query_params.describe(base_info)
 
             return jsonify({
                 'endpoint': '/execute-query',
                 'method': 'POST',
                 'description': 'Execute a SQL query by its alias from query_config.json',
                 'request_body': {
-                    'query_alias': '(required) The alias of the query to execute'
+                    'query_alias': '(required) The alias of the query to execute',
+                    'parameters': '(optional) Values for the alias\'s typed parameters, e.g. {"start_date": "2024-08-01"}; omitted ones use their defaults',
+                    'fresh': '(optional) true to run a scheduled alias live instead of serving its snapshot (or ?fresh=1)',
+                    'column_stats': '(optional) true to include per-column profiles (or ?column_stats=1)'
                 },
                 'response_fields': {
                     'success': 'boolean - whether the request succeeded',
                     'query_alias': 'string - the alias that was executed',
                     'query_name': 'string - the name of the query',
                     'query_description': 'string - description of the query',
+                    'parameters': 'object - the parameter values the query ran with',
                     'data_table': 'array - query results as list of objects',
                     'row_count': 'number - number of rows returned',
                     'columns': 'array - column names',
-                    'timestamp': 'number - when the query was executed'
+                    'derived_from': '(derived aliases) string - the alias whose result was transformed',
+                    'column_stats': '(optional) object - per column: type, count, null_count, distinct, min, max, top_values and histogram',
+                    'truncated': 'boolean - whether the result was cut off at the row or byte budget',
+                    'truncated_by': 'string | null - the limit that cut it off (rows or bytes)',
+                    'timestamp': 'number - when the query was executed',
+                    'snapshot_at': 'number | null - when the served snapshot was taken, null for a live result',
+                    'refresh': '(snapshots of incremental aliases) object - mode, watermark, full_refresh_at and fetched_rows of the last refresh'
                 },
                 'available_queries': available_queries,
                 'example_curl': 'curl -X POST http://localhost:5000/execute-query -H "Content-Type: application/json" -d \'{"query_alias": "contact_opportunities"}\''
@@ -1060,9 +1771,18 @@ def execute_query():
                 'error': 'query_alias is required'
             }), 400
 
-        # Execute the query
-        result = execute_query_by_alias(query_alias)
-        return jsonify(result)
+        g.metrics_alias = metrics_alias(query_alias)
+
+        fresh = request.args.get('fresh', '').lower() in ('1', 'true', 'yes') or str(data.get('fresh', '')).lower() in ('1', 'true', 'yes')
+        result = serve_query(query_alias, data.get('parameters'), fresh, cancel_token_factory=request_cancel_token)
+        if wants_column_stats(data):
+            with telemetry.stage("column_stats", alias=query_alias):
+                result = with_column_stats(result)
+        with telemetry.stage("encode", alias=query_alias):
+            return jsonify(result)
+
+    except query_limits.QueryCancelledError as e:
+        return query_cancelled_response(e)
 
     except ValueError as e:
         print(f"Validation error in /execute-query endpoint: {e}")
@@ -1071,6 +1791,9 @@ def execute_query():
             'error': str(e)
         }), 400
 
+    except (admission.AdmissionRejected, resilience.CircuitOpenError) as e:
+        return service_unavailable_response(e)
+
     except Exception as e:
         print(f"Error in /execute-query endpoint: {e}")
         return jsonify({
@@ -1078,12 +1801,537 @@ def execute_query():
             'error': str(e)
         }), 500
 
+def batch_query_outcome(index, query_alias, parameters, fresh, cancel_token_factory=None, include_stats=False):
+    """One /execute-queries entry: the alias's result, or its error and the status /execute-query would have returned."""
+    failure = {'index': index, 'query_alias': query_alias, 'success': False}
+    with telemetry.labels(alias=metrics_alias(query_alias)):
+        try:
+            result = serve_query(query_alias, parameters, fresh, cancel_token_factory)
+            if include_stats:
+                with telemetry.stage("column_stats"):
+                    result = with_column_stats(result)
+            return dict(result, index=index, status=200)
+        except query_limits.QueryCancelledError as e:
+            return dict(failure, status=504 if e.reason == 'timeout' else 499, error=str(e), cancelled=True, reason=e.reason)
+        except ValueError as e:
+            return dict(failure, status=400, error=str(e))
+        except (admission.AdmissionRejected, resilience.CircuitOpenError) as e:
+            return dict(failure, status=503, error=str(e), retry_after=e.retry_after)
+        except Exception as e:
+            print(f"Error in /execute-queries endpoint for '{query_alias}': {e}")
+            return dict(failure, status=500, error=str(e))
+
+@app.route('/execute-queries', methods=['POST'])
+def execute_queries():
+    """
+    Execute several query_config.json aliases concurrently on pooled connections.
+    Returns all results in request order, or with ?stream=1 streams each one as an
+    NDJSON line as soon as it finishes.
+    """
+    if token is None or token.expires_on <= time.time():
+        return jsonify({
+            'success': False,
+            'error': 'Not authenticated. Please complete authentication first.',
+            'needs_auth': True
+        }), 401
+
+    data = request.get_json(silent=True) or {}
+    entries = data.get('queries')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({
+            'success': False,
+            'error': 'queries must be a non-empty list of aliases or {"query_alias", "parameters", "fresh"} objects'
+        }), 400
+    if len(entries) > BATCH_QUERY_MAX_ALIASES:
+        return jsonify({
+            'success': False,
+            'error': f'At most {BATCH_QUERY_MAX_ALIASES} queries can be executed per request'
+        }), 400
+
+    batch_fresh = request.args.get('fresh', '').lower() in ('1', 'true', 'yes') or str(data.get('fresh', '')).lower() in ('1', 'true', 'yes')
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes') or str(data.get('stream', '')).lower() in ('1', 'true', 'yes')
+    include_stats = wants_column_stats(data)
+
+    queries = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'query_alias': entry}
+        if not isinstance(entry, dict) or not str(entry.get('query_alias', '')).strip():
+            return jsonify({
+                'success': False,
+                'error': 'Every entry of queries needs a query_alias'
+            }), 400
+        fresh = batch_fresh or str(entry.get('fresh', '')).lower() in ('1', 'true', 'yes')
+        queries.append((str(entry['query_alias']).strip(), entry.get('parameters'), fresh))
+
+    # Queries still running when the client disconnects are cancelled
+    environ = request.environ
+    def cancel_token_factory(allow_disconnect_cancel=None):
+        return request_cancel_token(allow_disconnect_cancel, environ)
+
+    # Each alias runs in its own copy of the request's context so its stages are
+    # timed and traced under this request
+    executor = ThreadPoolExecutor(max_workers=min(BATCH_QUERY_CONCURRENCY, len(queries)), thread_name_prefix='execute-queries')
+    futures = [
+        executor.submit(
+            contextvars.copy_context().run, batch_query_outcome,
+            index, query_alias, parameters, fresh, cancel_token_factory, include_stats
+        )
+        for index, (query_alias, parameters, fresh) in enumerate(queries)
+    ]
+    executor.shutdown(wait=False)
+
+    if stream:
+        def generate():
+            for future in as_completed(futures):
+                yield app.json.dumps(future.result()) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    results = [future.result() for future in futures]
+    with telemetry.stage("encode"):
+        return jsonify({
+            'success': True,
+            'results': results,
+            'failed': sum(1 for result in results if not result['success'])
+        })
+
+def stream_question(send, request_id, data_agent_url, question, thread_name, lane, cancel_token, route=True):
+    """
+    Answer one question received over a WebSocket, sending its progress events and then its result.
+    Stateless questions that a query alias answers are sent only their result, unless route is False.
+    """
+    request_telemetry = telemetry.begin_request('/ws', span_name='WS ask')
+    error = None
+
+    def emit(event):
+        send(dict(event, id=request_id))
+
+    try:
+        routed = route_question(question, lambda *_: cancel_token) if thread_name is None and route else None
+        if routed is not None:
+            result = question_router.run_details_result(question, *routed)
+            record_answer_path(routed[0]['method'])
+        else:
+            with recording.session('/ws', question, thread_name):
+                result = admission_controller.run(
+                    lane, run_details_for_question, data_agent_url, question, thread_name,
+                    cancel_token=cancel_token, on_event=emit
+                )
+            record_answer_path('agent')
+        emit({'type': 'result', 'result': result})
+
+    except (admission.AdmissionRejected, resilience.CircuitOpenError) as e:
+        emit({'type': 'error', 'status': 503, 'error': str(e), 'retry_after': e.retry_after})
+
+    except run_control.RunCancelledError as e:
+        emit({'type': 'cancelled', 'reason': e.reason, 'run_status': e.run.status, 'error': str(e)})
+
+    except query_limits.QueryCancelledError as e:
+        emit({'type': 'cancelled', 'reason': e.reason, 'error': str(e)})
+
+    except Exception as e:
+        error = e
+        print(f"Error in /ws question {request_id}: {e}")
+        emit({'type': 'error', 'status': 500, 'error': str(e)})
+
+    finally:
+        request_telemetry.finish(error=error)
+
+
+if WEBSOCKETS_AVAILABLE:
+    @sock.route('/ws')
+    def run_events(ws):
+        """
+        Stream the progress of agent runs over a WebSocket.
+
+        One connection carries any number of concurrent questions, told apart by
+        the id the client gives each one:
+            -> {"type": "ask", "id": "q1", "question": "...", "thread_name": null, "priority": "batch", "route": true}
+            -> {"type": "cancel", "id": "q1"}
+            <- {"id": "q1", "type": "status" | "step" | "sql" | "table", ...}  (see RunProgress)
+            <- {"id": "q1", "type": "result" | "error" | "cancelled", ...}
+        Runs still in progress are cancelled when the connection closes.
+        """
+        send_lock = threading.Lock()
+        questions = {}
+
+        def send(message):
+            with send_lock:
+                try:
+                    ws.send(json.dumps(message))
+                except ConnectionClosed:
+                    pass
+
+        def finish(request_id, *args):
+            try:
+                stream_question(send, request_id, *args)
+            finally:
+                questions.pop(request_id, None)
+
+        try:
+            while True:
+                try:
+                    message = json.loads(ws.receive())
+                except ValueError:
+                    send({'type': 'error', 'status': 400, 'error': 'Messages must be JSON'})
+                    continue
+                if not isinstance(message, dict):
+                    send({'type': 'error', 'status': 400, 'error': 'Messages must be JSON objects'})
+                    continue
+                request_id = str(message.get('id', ''))
+                message_type = message.get('type')
+
+                if message_type == 'cancel':
+                    if request_id in questions:
+                        questions[request_id].cancel('cancelled')
+                    continue
+
+                if message_type != 'ask':
+                    send({'id': request_id, 'type': 'error', 'status': 400, 'error': f"Unknown message type: {message_type}"})
+                    continue
+
+                question = str(message.get('question', '')).strip()
+                if not request_id or not question:
+                    send({'id': request_id, 'type': 'error', 'status': 400, 'error': 'id and question are required'})
+                    continue
+                if request_id in questions:
+                    send({'id': request_id, 'type': 'error', 'status': 409, 'error': f"Question {request_id} is already running"})
+                    continue
+                if token is None or token.expires_on <= time.time():
+                    send({'id': request_id, 'type': 'error', 'status': 401, 'needs_auth': True,
+                          'error': 'Not authenticated. Please complete authentication first.'})
+                    continue
+
+                try:
+                    _, data_agent_url = get_config()
+                except ValueError as e:
+                    send({'id': request_id, 'type': 'error', 'status': 500, 'error': str(e)})
+                    continue
+                lane = 'batch' if str(message.get('priority', '')).lower() == 'batch' else 'interactive'
+                cancel_token = questions[request_id] = run_control.CancellationToken()
+                threading.Thread(
+                    target=finish,
+                    args=(request_id, data_agent_url, question, message.get('thread_name'), lane, cancel_token,
+                          wants_routing(message)),
+                    name=f"ws-{request_id}",
+                    daemon=True
+                ).start()
+
+        except ConnectionClosed:
+            pass
+
+        finally:
+            for cancel_token in list(questions.values()):
+                cancel_token.cancel('disconnect')
+
+
+def fetch_run_steps(thread_id, run_id):
+    """Retrieve a run's status and complete steps from Fabric and cache them; returns (run_status, steps)."""
+    _, data_agent_url = get_config()
+    client = get_openai_client(data_agent_url)
+    with telemetry.stage("runs_retrieve"):
+        run = resilience.call('runs.retrieve', client.beta.threads.runs.retrieve, thread_id=thread_id, run_id=run_id)
+    with telemetry.stage("steps_list"):
+        steps = run_steps.list_steps(client, thread_id, run_id)
+    steps_cache.put(thread_id, run_id, run.status, steps)
+    return run.status, steps
+
+@app.route('/runs/<thread_id>/<run_id>', methods=['GET'])
+def get_run(thread_id, run_id):
+    """
+    Return the status and complete steps of a run.
+    Finished runs are served from the steps cache without calling Fabric.
+    """
+    try:
+        cached = steps_cache.get(thread_id, run_id)
+        if cached is not None:
+            run_status, steps = cached
+        else:
+            # Check if authenticated
+            if token is None or token.expires_on <= time.time():
+                return jsonify({
+                    'success': False,
+                    'error': 'Not authenticated. Please complete authentication first.',
+                    'needs_auth': True
+                }), 401
+
+            run_status, steps = fetch_run_steps(thread_id, run_id)
+
+        with telemetry.stage("serialization"):
+            return jsonify({
+                'success': True,
+                'thread_id': thread_id,
+                'run_id': run_id,
+                'run_status': run_status,
+                'run_steps': steps.model_dump(),
+                'cached': cached is not None
+            })
+
+    except resilience.CircuitOpenError as e:
+        return service_unavailable_response(e)
+
+    except Exception as e:
+        if getattr(e, 'status_code', None) == 404:
+            return jsonify({
+                'success': False,
+                'error': f"Run {run_id} not found in thread {thread_id}"
+            }), 404
+        print(f"Error in /runs endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# SQL generated by agent runs, by fingerprint, for promotion to aliases (see query_catalog.py)
+QUERY_CATALOG_ADMIN_TOKEN = os.getenv('QUERY_CATALOG_ADMIN_TOKEN')
+query_catalog_store = query_catalog.QueryCatalog() if query_catalog.ENABLED else None
+
+def admin_forbidden_response():
+    """
+    403 unless the request carries QUERY_CATALOG_ADMIN_TOKEN in X-Admin-Token, else None.
+    Without a configured token the admin endpoints are closed.
+    """
+    if not QUERY_CATALOG_ADMIN_TOKEN:
+        return jsonify({
+            'success': False,
+            'error': 'Admin endpoints are disabled; set QUERY_CATALOG_ADMIN_TOKEN to enable them'
+        }), 403
+    if not secrets.compare_digest(request.headers.get('X-Admin-Token', ''), QUERY_CATALOG_ADMIN_TOKEN):
+        return jsonify({
+            'success': False,
+            'error': 'A valid X-Admin-Token header is required'
+        }), 403
+    return None
+
+@app.route('/admin/query-catalog', methods=['GET'])
+def list_query_catalog():
+    """
+    List the SQL the agent generated most often, with its questions, counts and agent latency.
+    Query string: limit (default 20), min_count (default 2), q (search words), include_promoted.
+    """
+    forbidden = admin_forbidden_response()
+    if forbidden is not None:
+        return forbidden
+    if query_catalog_store is None:
+        return jsonify({'success': False, 'error': 'The query catalog is disabled (QUERY_CATALOG_PATH is not set)'}), 404
+    try:
+        limit = int(request.args.get('limit', 20))
+        min_count = int(request.args.get('min_count', 2))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit and min_count must be integers'}), 400
+    include_promoted = request.args.get('include_promoted', '').lower() in ('1', 'true', 'yes')
+    candidates = query_catalog_store.candidates(limit, min_count, request.args.get('q'), include_promoted)
+    return jsonify({
+        'success': True,
+        'candidates': candidates,
+        'catalog': query_catalog_store.snapshot()
+    })
+
+@app.route('/admin/query-catalog/<fingerprint>/promote', methods=['POST'])
+def promote_query(fingerprint):
+    """
+    Add a cataloged query to query_config.json as a new alias.
+    Body: alias (required), name, description (default: its most frequent question), schedule.
+    """
+    forbidden = admin_forbidden_response()
+    if forbidden is not None:
+        return forbidden
+    if query_catalog_store is None:
+        return jsonify({'success': False, 'error': 'The query catalog is disabled (QUERY_CATALOG_PATH is not set)'}), 404
+
+    data = request.get_json(silent=True) or {}
+    query_alias = str(data.get('alias', '')).strip()
+    if not query_params.PARAMETER_NAME.match(query_alias):
+        return jsonify({
+            'success': False,
+            'error': 'alias is required and must be a valid identifier (letters, digits and underscores)'
+        }), 400
+
+    candidate = query_catalog_store.get(fingerprint)
+    if candidate is None:
+        return jsonify({'success': False, 'error': f"No cataloged query with fingerprint {fingerprint}"}), 404
+
+    entry = query_catalog.alias_entry(candidate, data.get('name'), data.get('description'))
+    if not entry['description']:
+        return jsonify({
+            'success': False,
+            'error': 'No cataloged question produced this exact SQL; pass a description'
+        }), 400
+    if data.get('schedule') is not None:
+        try:
+            snapshots.parse_schedule(data['schedule'])
+        except ValueError as e:
+            return jsonify({'success': False, 'error': f"Invalid schedule: {e}"}), 400
+        entry['schedule'] = data['schedule']
+
+    try:
+        with query_config_lock:
+            config = load_query_config()
+            queries = config.setdefault('queries', {})
+            if query_alias in queries:
+                return jsonify({'success': False, 'error': f"Query alias '{query_alias}' already exists"}), 409
+            queries[query_alias] = entry
+            save_query_config(config)
+    except (ValueError, OSError) as e:
+        print(f"Error promoting query {fingerprint}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    query_catalog_store.mark_promoted(fingerprint, query_alias)
+    print(f"Promoted query {fingerprint} to alias '{query_alias}'")
+    return jsonify({
+        'success': True,
+        'query_alias': query_alias,
+        'query': entry
+    }), 201
+
+# Results of re-executed run SQL, by normalized statement (see adhoc_sql.py)
+sql_results = adhoc_sql.ResultCache()
+
+def execute_adhoc_sql(statement, max_rows, cancel_token=None):
+    """Run a read-only statement generated by the agent, keeping at most max_rows rows."""
+    limits = {'timeout': query_limits.QUERY_TIMEOUT, 'max_rows': max_rows, 'max_bytes': query_limits.MAX_BYTES}
+    df, truncated_by = run_statement(statement, [], limits, cancel_token)
+    rows = df.to_dict('records')
+    return {
+        'data_table': rows,
+        'row_count': len(rows),
+        'columns': list(df.columns),
+        'truncated': truncated_by is not None,
+        'truncated_by': truncated_by,
+        'timestamp': time.time()
+    }
+
+@app.route('/runs/<thread_id>/<run_id>/execute-sql', methods=['POST'])
+def execute_run_sql(thread_id, run_id):
+    """
+    Re-execute the SQL a run generated directly against the warehouse and return every row.
+    Only a single SELECT is run, capped at max_rows; results are cached by normalized SQL.
+    Returns one JSON object, or with ?stream=1 NDJSON: the result without its rows, then
+    {"rows": [...]} lines of up to SQL_FETCH_BATCH rows each.
+    """
+    # Check if authenticated; the query runs with the same credential
+    if token is None or token.expires_on <= time.time():
+        return jsonify({
+            'success': False,
+            'error': 'Not authenticated. Please complete authentication first.',
+            'needs_auth': True
+        }), 401
+
+    data = request.get_json(silent=True) or {}
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes') or str(data.get('stream', '')).lower() in ('1', 'true', 'yes')
+    fresh = str(data.get('fresh', '')).lower() in ('1', 'true', 'yes')
+
+    try:
+        try:
+            max_rows = int(data.get('max_rows', adhoc_sql.MAX_ROWS))
+            if max_rows < 1 or max_rows > adhoc_sql.MAX_ROWS:
+                raise ValueError(f"max_rows must be between 1 and {adhoc_sql.MAX_ROWS}")
+
+            cached = steps_cache.get(thread_id, run_id)
+            _, steps = cached if cached is not None else fetch_run_steps(thread_id, run_id)
+            with telemetry.stage("extraction"):
+                sql_analysis = analyze_run_sql(steps)
+            sql = adhoc_sql.select_query(sql_analysis["queries"], sql_analysis["data_retrieval_query"], data.get('query_index'))
+            if sql is None:
+                return jsonify({
+                    'success': False,
+                    'error': f"Run {run_id} has no SQL query to execute"
+                }), 404
+            sql = adhoc_sql.check_read_only(sql)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        # The same statement from any run is served from the cache; concurrent requests share one query
+        key = (adhoc_sql.sql_hash(sql), max_rows)
+        result = None if fresh else sql_results.get(key)
+        cached_result = result is not None
+        if result is None:
+            # One row past the cap tells a complete result from a truncated one
+            statement = adhoc_sql.with_row_cap(sql, max_rows + 1)
+            if COALESCING_ENABLED:
+                flight_key = ('sql',) + key
+                cancel_token = request_cancel_token(lambda: query_flight.waiters(flight_key) == 0)
+                try:
+                    result, shared = query_flight.do(
+                        flight_key,
+                        lambda: admission_controller.run('query', execute_adhoc_sql, statement, max_rows, cancel_token=cancel_token),
+                        cancel_token=request_cancel_token()
+                    )
+                except coalescing.WaitCancelledError as e:
+                    raise query_limits.QueryCancelledError(e.reason, e.elapsed) from e
+                if shared:
+                    telemetry.record_coalesced()
+            else:
+                result = admission_controller.run('query', execute_adhoc_sql, statement, max_rows, cancel_token=request_cancel_token())
+            sql_results.put(key, result)
+
+        body = dict(
+            result,
+            success=True,
+            thread_id=thread_id,
+            run_id=run_id,
+            sql=sql,
+            sql_hash=key[0],
+            max_rows=max_rows,
+            cached=cached_result
+        )
+        if stream:
+            rows = body.pop('data_table')
+
+            def generate():
+                yield app.json.dumps(body) + '\n'
+                for start in range(0, len(rows), query_limits.FETCH_BATCH):
+                    yield app.json.dumps({'rows': rows[start:start + query_limits.FETCH_BATCH]}) + '\n'
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        with telemetry.stage("encode"):
+            return jsonify(body)
+
+    except (admission.AdmissionRejected, resilience.CircuitOpenError) as e:
+        return service_unavailable_response(e)
+
+    except query_limits.QueryCancelledError as e:
+        return query_cancelled_response(e)
+
+    except Exception as e:
+        if getattr(e, 'status_code', None) == 404:
+            return jsonify({
+                'success': False,
+                'error': f"Run {run_id} not found in thread {thread_id}"
+            }), 404
+        print(f"Error in /runs execute-sql endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/admission')
+def admission_status():
+    """Concurrency, queue depth and wait times of each admission lane."""
+    return jsonify(admission_controller.snapshot())
+
 @app.route('/health')
 def health():
     """Health check endpoint."""
     return jsonify({
         'status': 'healthy',
-        'authenticated': token is not None and token.expires_on > time.time() if token else False
+        'authenticated': token is not None and token.expires_on > time.time() if token else False,
+        'circuits': resilience.circuit_states(),
+        'thread_cleanup': thread_cleaner.pending(),
+        'thread_pool': spare_threads.snapshot() if spare_threads is not None else None,
+        'thread_rollover': thread_rollovers.snapshot() if thread_rollovers is not None else None,
+        'steps_cache': steps_cache.snapshot(),
+        'snapshots': snapshot_scheduler.status(),
+        'sql_pool': sql_pool.snapshot(),
+        'queries': query_limits.snapshot(),
+        'derived_cache': derived_cache.snapshot(),
+        'column_stats_cache': column_stats_cache.snapshot(),
+        'question_router': question_routes.snapshot(),
+        'sql_results_cache': sql_results.snapshot(),
+        'query_catalog': query_catalog_store.snapshot() if query_catalog_store is not None else None
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Incremental refresh of scheduled alias snapshots using watermark columns
+
+Re-running a report that covers "everything since August 2024" every few
+minutes rescans rows the previous snapshot already holds. An alias can
+declare how to fetch only what is new instead:
+
+    "incremental": {
+        "watermark_column": "opportunity_created_at",
+        "watermark_parameter": "watermark",
+        "merge_key": ["transaction_id"],
+        "sort": ["crm_contact_first_name"],
+        "full_refresh_interval": 86400
+    }
+
+watermark_column is a result column that grows with new data and
+watermark_parameter a nullable parameter (see query_params.py) the query
+filters on, e.g. "AND (@watermark IS NULL OR created_at >= @watermark)".
+A refresh binds the highest watermark of the previous snapshot, replaces the
+rows whose merge_key matches a fetched row, appends the others and sorts the
+result again by sort ("column" or "column DESC", with SQL Server ordering as
+in derived.py), like the alias's ORDER BY.
+Filtering with >= rather than > re-fetches the rows at the watermark itself,
+which the merge deduplicates, so rows committed with the same timestamp are
+not missed.
+
+A query can select its watermark only for the refresh, e.g. a MAX() over
+the rows behind each result row. With "expose_watermark": false the column is
+removed from every result the alias serves, snapshots included, once the
+watermark has been read from it.
+
+Rows that were deleted or changed without moving the watermark are only
+picked up by a full refresh: one runs when there is no usable previous
+snapshot, when the default parameters or the columns changed, and
+full_refresh_interval seconds (INCREMENTAL_FULL_REFRESH_INTERVAL by default,
+null for never) after the last full refresh.
+
+Settings (environment variables): INCREMENTAL_REFRESH,
+INCREMENTAL_FULL_REFRESH_INTERVAL.
+"""
+
+import os
+import time
+
+import derived
+import query_params
+import telemetry
+
+ENABLED = os.getenv('INCREMENTAL_REFRESH', 'true').lower() in ('1', 'true', 'yes')
+FULL_REFRESH_INTERVAL = float(os.getenv('INCREMENTAL_FULL_REFRESH_INTERVAL', '86400'))
+
+
+def settings(query_info):
+    """
+    The validated "incremental" settings of an alias, or None if it has none.
+
+    Raises:
+        ValueError: For incomplete settings or an undeclared watermark parameter
+    """
+    spec = query_info.get('incremental')
+    if not spec:
+        return None
+    for field in ('watermark_column', 'watermark_parameter', 'merge_key'):
+        if not spec.get(field):
+            raise ValueError(f"Incremental refresh requires '{field}'")
+
+    parameter = spec['watermark_parameter']
+    definition = query_params.definitions(query_info).get(parameter)
+    if definition is None:
+        raise ValueError(f"Watermark parameter '{parameter}' is not a declared parameter")
+    if definition.get('default', ...) is not None:
+        raise ValueError(f"Watermark parameter '{parameter}' must default to null (a full refresh)")
+
+    merge_key = spec['merge_key']
+    return {
+        'watermark_column': spec['watermark_column'],
+        'watermark_parameter': parameter,
+        'merge_key': [merge_key] if isinstance(merge_key, str) else list(merge_key),
+        'sort': derived.parse_sort(spec.get('sort', [])),
+        'full_refresh_interval': spec.get('full_refresh_interval', FULL_REFRESH_INTERVAL),
+        'expose_watermark': spec.get('expose_watermark', True)
+    }
+
+
+def _without_watermark(spec, result):
+    column = spec['watermark_column']
+    if spec['expose_watermark'] or column not in (result.get('columns') or []):
+        return result
+    rows = [{key: value for key, value in row.items() if key != column} for row in result['data_table']]
+    return dict(result, data_table=rows, columns=[name for name in result['columns'] if name != column])
+
+
+def without_watermark(query_info, result):
+    """result without its watermark column if the alias declares "expose_watermark": false."""
+    spec = settings(query_info)
+    return result if spec is None else _without_watermark(spec, result)
+
+
+def merge_rows(rows, new_rows, merge_key):
+    """rows with those matching a new row's merge key replaced, and the other new rows appended."""
+    def key(row):
+        return tuple(row.get(column) for column in merge_key)
+
+    fetched = {key(row): row for row in new_rows}
+    merged = [fetched.pop(key(row), row) for row in rows]
+    merged.extend(fetched.values())
+    return merged
+
+
+def _to_json(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def latest_watermark(rows, column):
+    """Highest non-null value of column, JSON-friendly (timestamps as ISO strings), or None."""
+    values = [row.get(column) for row in rows if not derived.is_null(row.get(column))]
+    return _to_json(max(values)) if values else None
+
+
+def _full_refresh_reason(spec, previous, defaults, now):
+    if not ENABLED:
+        return 'disabled'
+    if previous is None:
+        return 'no snapshot'
+    state = previous.get('refresh') or {}
+    if state.get('watermark') is None:
+        return 'no watermark'
+    if previous.get('parameters') != defaults:
+        return 'parameters changed'
+    interval = spec['full_refresh_interval']
+    if interval is not None and now - state.get('full_refresh_at', 0) >= interval:
+        return 'interval'
+    return None
+
+
+def full_result(query_info, result, now=None):
+    """A full result annotated with its watermark, so the next refresh can be incremental."""
+    spec = settings(query_info)
+    if spec is None:
+        return result
+    # A truncated result has no reliable watermark; the next refresh is full again
+    watermark = None if result.get('truncated') else latest_watermark(result['data_table'], spec['watermark_column'])
+    return dict(_without_watermark(spec, result), refresh={
+        'mode': 'full',
+        'watermark': watermark,
+        'full_refresh_at': now if now is not None else time.time(),
+        'fetched_rows': result['row_count']
+    })
+
+
+def refresh(query_alias, query_info, previous, run):
+    """
+    Refresh an alias's snapshot, incrementally from previous when its settings allow.
+
+    Args:
+        query_alias (str): The alias, for logging and metrics
+        query_info (dict): The alias's query_config.json entry
+        previous (dict): The current snapshot, or None
+        run (callable): Runs the alias with a parameters dict (None for the defaults), keeping its watermark column
+
+    Returns:
+        dict: The new /execute-query result, with a "refresh" object describing the refresh
+    """
+    spec = settings(query_info)
+    if spec is None:
+        return run(None)
+
+    now = time.time()
+    defaults = query_params.to_json(query_params.resolve(query_info))
+    reason = _full_refresh_reason(spec, previous, defaults, now)
+    if reason is None:
+        state = previous['refresh']
+        fetched = run({spec['watermark_parameter']: state['watermark']})
+        fetched_watermark = latest_watermark(fetched['data_table'], spec['watermark_column'])
+        fetched = _without_watermark(spec, fetched)
+        if fetched.get('truncated'):
+            reason = 'truncated'
+        elif fetched['row_count'] and fetched['columns'] != previous['columns']:
+            reason = 'columns changed'
+        else:
+            rows = merge_rows(previous['data_table'], fetched['data_table'], spec['merge_key'])
+            rows = derived.sort_rows(rows, spec['sort'])
+            telemetry.record_snapshot_rows(query_alias, 'incremental', fetched['row_count'])
+            return dict(
+                fetched,
+                parameters=previous['parameters'],
+                data_table=rows,
+                row_count=len(rows),
+                columns=previous['columns'],
+                refresh={
+                    'mode': 'incremental',
+                    # The query filters on >= the previous watermark, so fetched rows never lower it
+                    'watermark': fetched_watermark or state['watermark'],
+                    'full_refresh_at': state['full_refresh_at'],
+                    'fetched_rows': fetched['row_count']
+                }
+            )
+
+    if reason not in ('no snapshot', 'disabled'):
+        print(f"Full refresh of '{query_alias}' ({reason})")
+    result = full_result(query_info, run(None), now)
+    telemetry.record_snapshot_rows(query_alias, 'full', result['row_count'])
+    return result
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Local Mock Fabric Data Agent Server
+
+A stand-in for a published Fabric Data Agent, for load testing the Flask app
+and FabricDataAgentClient without spending Fabric capacity. Implements the
+Assistants endpoints used by this project (assistants, threads/messages,
+runs, run steps, thread deletion) and the private threads/fabric lookup.
+
+Run latency, step payload size and error rate are configurable. Point the
+app at the mock with:
+
+    DATA_AGENT_URL=http://localhost:8089/v1/workspaces/mock-workspace/dataagents/mock-agent/aiassistant/openai
+    FABRIC_STATIC_TOKEN=mock-token
+
+Usage:
+    python mock_fabric_server.py --port 8089 --run-latency 5 --step-payload-bytes 20000 --error-rate 0.01
+"""
+
+import os
+import time
+import uuid
+import json
+import random
+import argparse
+import threading
+from flask import Flask, request, jsonify
+
+app = Flask(__name__)
+
+OPENAI_PREFIX = '/v1/workspaces/<workspace_id>/dataagents/<agent_id>/aiassistant/openai'
+PRIVATE_PREFIX = '/v1/workspaces/<workspace_id>/dataagents/<agent_id>/__private/aiassistant'
+
+# Behaviour of the mock, overridable from the command line or environment
+config = {
+    'run_latency': float(os.getenv('MOCK_RUN_LATENCY', 5.0)),
+    'run_latency_jitter': float(os.getenv('MOCK_RUN_LATENCY_JITTER', 0.2)),
+    'steps_per_run': int(os.getenv('MOCK_STEPS_PER_RUN', 2)),
+    'step_payload_bytes': int(os.getenv('MOCK_STEP_PAYLOAD_BYTES', 4000)),
+    'error_rate': float(os.getenv('MOCK_ERROR_RATE', 0.0)),
+    'error_status': int(os.getenv('MOCK_ERROR_STATUS', 429)),
+    'retry_after': int(os.getenv('MOCK_RETRY_AFTER', 1)),
+    'run_failure_rate': float(os.getenv('MOCK_RUN_FAILURE_RATE', 0.0)),
+}
+
+# In-memory state; guarded by state_lock
+state_lock = threading.Lock()
+threads_by_tag = {}
+threads = {}
+messages = {}
+runs = {}
+steps = {}
+
+
+class StaticTokenCredential:
+    """
+    Credential returning a fixed bearer token, for the mock server and offline replay.
+
+    Implements the get_token() method used by this project, so it can stand in
+    for DeviceCodeCredential or InteractiveBrowserCredential.
+    """
+
+    def __init__(self, token: str, lifetime: int = 3600):
+        self.token = token
+        self.lifetime = lifetime
+
+    def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+        return AccessToken(self.token, int(time.time()) + self.lifetime)
+
+
+def new_id(prefix):
+    """Generate an OpenAI-style object id."""
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def injected_error():
+    """Return an error response for a configured fraction of calls, or None."""
+    if config['error_rate'] and random.random() < config['error_rate']:
+        status = config['error_status']
+        response = jsonify({'error': {'message': f'Injected mock error ({status})', 'type': 'mock_error'}})
+        response.status_code = status
+        if status in (429, 503):
+            response.headers['Retry-After'] = str(config['retry_after'])
+        return response
+    return None
+
+
+def not_found(kind, object_id):
+    """Return an OpenAI-style 404 response."""
+    return jsonify({'error': {'message': f'No {kind} found with id {object_id}', 'type': 'invalid_request_error'}}), 404
+
+
+def paginate(items, id_key='id'):
+    """Apply the order/after/before/limit query parameters to a list of objects."""
+    order = request.args.get('order', 'desc')
+    limit = min(int(request.args.get('limit', 20)), 100)
+    after = request.args.get('after')
+    before = request.args.get('before')
+
+    # Lists are kept in creation order
+    ordered = list(reversed(items)) if order == 'desc' else list(items)
+    ids = [item[id_key] for item in ordered]
+    if after in ids:
+        ordered = ordered[ids.index(after) + 1:]
+    elif before in ids:
+        ordered = ordered[:ids.index(before)]
+
+    page = ordered[:limit]
+    return {
+        'object': 'list',
+        'data': page,
+        'first_id': page[0][id_key] if page else None,
+        'last_id': page[-1][id_key] if page else None,
+        'has_more': len(ordered) > limit
+    }
+
+
+def make_message(thread_id, role, text, run_id=None, assistant_id=None):
+    """Create a message object and append it to its thread."""
+    message = {
+        'id': new_id('msg'),
+        'object': 'thread.message',
+        'created_at': int(time.time()),
+        'thread_id': thread_id,
+        'role': role,
+        'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}],
+        'assistant_id': assistant_id,
+        'run_id': run_id,
+        'attachments': [],
+        'metadata': {},
+        'status': 'completed'
+    }
+    messages.setdefault(thread_id, []).append(message)
+    return message
+
+
+def make_markdown_table(target_bytes):
+    """Build a semantic-model style markdown table of roughly target_bytes."""
+    lines = ['| [crm_contact_lead_source] | [client_name] | [count] |', '|---|---|---|']
+    size = sum(len(line) + 1 for line in lines)
+    row = 0
+    while size < target_bytes:
+        line = f'| Source {row % 37} | Client {row} | {random.randint(1, 500)} |'
+        lines.append(line)
+        size += len(line) + 1
+        row += 1
+    return '\n'.join(lines)
+
+
+def make_steps(thread_id, run):
+    """Create the tool-call steps and the final assistant message of a completed run."""
+    sql = (
+        "SELECT t_dcc.crm_contact_lead_source, COUNT(*) AS count "
+        "FROM dbo.FactCRMOpportunityTransaction t_ot "
+        "JOIN dbo.DimCRMContact t_dcc ON t_ot.crm_contact_key = t_dcc.crm_contact_key "
+        "GROUP BY t_dcc.crm_contact_lead_source"
+    )
+    run_steps = []
+    created_at = int(run['_started'])
+    for index in range(config['steps_per_run']):
+        is_last = index == config['steps_per_run'] - 1
+        output = make_markdown_table(config['step_payload_bytes']) if is_last else json.dumps({'sql': sql})
+        run_steps.append({
+            'id': new_id('step'),
+            'object': 'thread.run.step',
+            'created_at': created_at + index,
+            'completed_at': created_at + index + 1,
+            'run_id': run['id'],
+            'assistant_id': run['assistant_id'],
+            'thread_id': thread_id,
+            'type': 'tool_calls',
+            'status': 'completed',
+            'step_details': {
+                'type': 'tool_calls',
+                'tool_calls': [{
+                    'id': new_id('call'),
+                    'type': 'function',
+                    'function': {
+                        'name': 'trace.analyze_semantic_model' if is_last else 'trace.generate_sql',
+                        'arguments': json.dumps({'query': sql}),
+                        'output': output
+                    }
+                }]
+            }
+        })
+    steps[run['id']] = run_steps
+
+    preview = '\n'.join(make_markdown_table(600).split('\n')[:8])
+    make_message(
+        thread_id, 'assistant',
+        f"Here are the converted opportunities by lead source:\n\n{preview}",
+        run_id=run['id'], assistant_id=run['assistant_id']
+    )
+
+
+def advance_run(thread_id, run):
+    """Move a run through queued -> in_progress -> completed/failed based on elapsed time."""
+    if run['status'] not in ('queued', 'in_progress'):
+        return run
+    elapsed = time.time() - run['_started']
+    if elapsed >= run['_duration']:
+        if random.random() < config['run_failure_rate']:
+            run['status'] = 'failed'
+            run['failed_at'] = int(time.time())
+            run['last_error'] = {'code': 'server_error', 'message': 'Injected mock run failure'}
+        else:
+            make_steps(thread_id, run)
+            run['status'] = 'completed'
+            run['completed_at'] = int(time.time())
+    elif elapsed >= min(1.0, run['_duration'] / 4):
+        run['status'] = 'in_progress'
+        run['started_at'] = run.get('started_at') or int(time.time())
+    return run
+
+
+def public(run):
+    """Strip mock-internal fields from a run."""
+    return {key: value for key, value in run.items() if not key.startswith('_')}
+
+
+@app.route(f'{PRIVATE_PREFIX}/threads/fabric', methods=['GET'])
+def get_thread_by_tag(workspace_id, agent_id):
+    """Return the thread tagged with the given name, creating it if needed."""
+    error = injected_error()
+    if error is not None:
+        return error
+    tag = request.args.get('tag', '').strip('"')
+    with state_lock:
+        thread_id = threads_by_tag.get(tag)
+        if thread_id is None:
+            thread_id = new_id('thread')
+            threads_by_tag[tag] = thread_id
+            threads[thread_id] = {'id': thread_id, 'object': 'thread', 'created_at': int(time.time()), 'metadata': {'tag': tag}}
+        return jsonify(threads[thread_id])
+
+
+@app.route(f'{OPENAI_PREFIX}/assistants', methods=['POST'])
+def create_assistant(workspace_id, agent_id):
+    """Create an assistant (the model argument is ignored, as in Fabric)."""
+    error = injected_error()
+    if error is not None:
+        return error
+    return jsonify({
+        'id': new_id('asst'),
+        'object': 'assistant',
+        'created_at': int(time.time()),
+        'model': 'not used',
+        'name': None,
+        'description': None,
+        'instructions': None,
+        'tools': [],
+        'metadata': {}
+    })
+
+
+@app.route(f'{OPENAI_PREFIX}/threads/<thread_id>', methods=['DELETE'])
+def delete_thread(workspace_id, agent_id, thread_id):
+    """Delete a thread and everything in it."""
+    error = injected_error()
+    if error is not None:
+        return error
+    with state_lock:
+        if threads.pop(thread_id, None) is None:
+            return not_found('thread', thread_id)
+        messages.pop(thread_id, None)
+        for tag, tagged_id in list(threads_by_tag.items()):
+            if tagged_id == thread_id:
+                del threads_by_tag[tag]
+    return jsonify({'id': thread_id, 'object': 'thread.deleted', 'deleted': True})
+
+
+@app.route(f'{OPENAI_PREFIX}/threads/<thread_id>/messages', methods=['GET', 'POST'])
+def thread_messages(workspace_id, agent_id, thread_id):
+    """Create a message or list a thread's messages."""
+    error = injected_error()
+    if error is not None:
+        return error
+    with state_lock:
+        if thread_id not in threads:
+            return not_found('thread', thread_id)
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            content = data.get('content', '')
+            if isinstance(content, list):
+                content = ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+            return jsonify(make_message(thread_id, data.get('role', 'user'), content))
+
+        thread_messages_list = messages.get(thread_id, [])
+        run_id = request.args.get('run_id')
+        if run_id:
+            thread_messages_list = [message for message in thread_messages_list if message['run_id'] == run_id]
+        return jsonify(paginate(thread_messages_list))
+
+
+@app.route(f'{OPENAI_PREFIX}/threads/<thread_id>/runs', methods=['POST'])
+def create_run(workspace_id, agent_id, thread_id):
+    """Start a run that completes after the configured latency."""
+    error = injected_error()
+    if error is not None:
+        return error
+    data = request.get_json(silent=True) or {}
+    duration = max(0.0, random.gauss(config['run_latency'], config['run_latency'] * config['run_latency_jitter']))
+    with state_lock:
+        if thread_id not in threads:
+            return not_found('thread', thread_id)
+        run = {
+            'id': new_id('run'),
+            'object': 'thread.run',
+            'created_at': int(time.time()),
+            'thread_id': thread_id,
+            'assistant_id': data.get('assistant_id'),
+            'status': 'queued',
+            'model': 'not used',
+            'instructions': '',
+            'tools': [],
+            'metadata': {},
+            'parallel_tool_calls': False,
+            '_started': time.time(),
+            '_duration': duration
+        }
+        runs[run['id']] = run
+        return jsonify(public(run))
+
+
+@app.route(f'{OPENAI_PREFIX}/threads/<thread_id>/runs/<run_id>', methods=['GET'])
+def retrieve_run(workspace_id, agent_id, thread_id, run_id):
+    """Return the current state of a run."""
+    error = injected_error()
+    if error is not None:
+        return error
+    with state_lock:
+        run = runs.get(run_id)
+        if run is None or run['thread_id'] != thread_id:
+            return not_found('run', run_id)
+        return jsonify(public(advance_run(thread_id, run)))
+
+
+@app.route(f'{OPENAI_PREFIX}/threads/<thread_id>/runs/<run_id>/cancel', methods=['POST'])
+def cancel_run(workspace_id, agent_id, thread_id, run_id):
+    """Cancel a queued or in-progress run."""
+    error = injected_error()
+    if error is not None:
+        return error
+    with state_lock:
+        run = runs.get(run_id)
+        if run is None or run['thread_id'] != thread_id:
+            return not_found('run', run_id)
+        advance_run(thread_id, run)
+        if run['status'] in ('queued', 'in_progress'):
+            run['status'] = 'cancelled'
+            run['cancelled_at'] = int(time.time())
+        return jsonify(public(run))
+
+
+@app.route(f'{OPENAI_PREFIX}/threads/<thread_id>/runs/<run_id>/steps', methods=['GET'])
+def list_run_steps(workspace_id, agent_id, thread_id, run_id):
+    """List the steps of a run."""
+    error = injected_error()
+    if error is not None:
+        return error
+    with state_lock:
+        run = runs.get(run_id)
+        if run is None or run['thread_id'] != thread_id:
+            return not_found('run', run_id)
+        return jsonify(paginate(steps.get(run_id, [])))
+
+
+@app.route('/mock/config', methods=['GET', 'POST'])
+def mock_config():
+    """Show or update the mock's behaviour at runtime."""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        for key, value in data.items():
+            if key in config:
+                config[key] = type(config[key])(value)
+    return jsonify(config)
+
+
+@app.route('/mock/stats', methods=['GET'])
+def mock_stats():
+    """Return counts of the objects held by the mock."""
+    with state_lock:
+        return jsonify({
+            'threads': len(threads),
+            'messages': sum(len(thread_messages_list) for thread_messages_list in messages.values()),
+            'runs': len(runs),
+            'runs_by_status': {
+                status: sum(1 for run in runs.values() if run['status'] == status)
+                for status in {run['status'] for run in runs.values()}
+            }
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock Fabric Data Agent server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.getenv('MOCK_PORT', 8089)))
+    parser.add_argument('--run-latency', type=float, default=config['run_latency'], help='Mean seconds until a run completes')
+    parser.add_argument('--run-latency-jitter', type=float, default=config['run_latency_jitter'], help='Standard deviation as a fraction of the mean')
+    parser.add_argument('--steps-per-run', type=int, default=config['steps_per_run'])
+    parser.add_argument('--step-payload-bytes', type=int, default=config['step_payload_bytes'], help='Size of the final tool output')
+    parser.add_argument('--error-rate', type=float, default=config['error_rate'], help='Fraction of API calls that fail')
+    parser.add_argument('--error-status', type=int, default=config['error_status'], help='HTTP status of injected errors')
+    parser.add_argument('--run-failure-rate', type=float, default=config['run_failure_rate'], help='Fraction of runs that end as failed')
+    args = parser.parse_args()
+
+    for key in config:
+        if hasattr(args, key):
+            config[key] = getattr(args, key)
+
+    print(f"Mock Fabric Data Agent listening on port {args.port}")
+    print(f"DATA_AGENT_URL=http://localhost:{args.port}/v1/workspaces/mock-workspace/dataagents/mock-agent/aiassistant/openai")
+    print(f"Config: {json.dumps(config)}")
+    app.run(host=args.host, port=args.port, threaded=True, debug=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Catalog of the SQL the agent generates, for promotion into query_config.json
+
+Recurring questions make the agent generate near-identical SQL again and
+again, each time for an agent run's worth of latency. QueryCatalog keeps
+every data_retrieval_query a /run-details run extracted, with the question
+that produced it, in a local SQLite database:
+
+- queries: one row per fingerprint (adhoc_sql.fingerprint: the normalized
+  statement with its literals replaced, so the same query over other dates
+  counts as one), with the latest SQL text, how often it was generated and
+  the agent time spent on it;
+- questions: the distinct questions (normalized as for coalescing) that
+  produced each fingerprint, with counts and the hash of the exact SQL each
+  last produced, also indexed with FTS5 for search.
+
+Only SQL that passes adhoc_sql.check_read_only is recorded. The most
+frequent fingerprints are candidates for a query_config.json alias
+(alias_entry), whose description is their most frequent question, so the
+question router (question_router.py) then answers them without the agent.
+
+The catalog is off unless QUERY_CATALOG_PATH names its database file, which
+is created on the first recorded query.
+
+Settings (environment variables): QUERY_CATALOG_PATH.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+
+import adhoc_sql
+import coalescing
+
+PATH = os.getenv('QUERY_CATALOG_PATH')
+ENABLED = bool(PATH)
+
+# Questions listed (and added as "questions" of a promoted alias) per candidate
+MAX_QUESTIONS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    fingerprint TEXT PRIMARY KEY,
+    sql TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    total_seconds REAL NOT NULL,
+    max_seconds REAL NOT NULL,
+    promoted_alias TEXT
+);
+CREATE TABLE IF NOT EXISTS questions (
+    fingerprint TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    question TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    last_seen REAL NOT NULL,
+    sql_hash TEXT,
+    PRIMARY KEY (fingerprint, normalized)
+);
+CREATE INDEX IF NOT EXISTS queries_by_count ON queries (count DESC);
+CREATE VIRTUAL TABLE IF NOT EXISTS question_index USING fts5(question, sql, fingerprint UNINDEXED);
+"""
+
+
+def _match_expression(text):
+    # Any of the words, each quoted so FTS5 operators in the search text are taken literally
+    return ' OR '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+
+class QueryCatalog:
+    """SQLite store of generated SQL, its questions, counts and agent latency; the database is opened on first use."""
+
+    def __init__(self, path=PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def _db(self):
+        """The open database, created with its schema on first use. Caller holds the lock."""
+        if self._connection is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.executescript(SCHEMA)
+            columns = {row['name'] for row in db.execute("PRAGMA table_info(questions)")}
+            if 'sql_hash' not in columns:
+                # Catalogs created before questions were tied to their exact SQL
+                db.execute("ALTER TABLE questions ADD COLUMN sql_hash TEXT")
+            self._connection = db
+        return self._connection
+
+    def record(self, question, sql, seconds):
+        """
+        Record SQL a run generated for a question and how long the run took.
+
+        Returns:
+            str: The SQL's fingerprint, or None if the SQL is not a read-only SELECT
+        """
+        try:
+            sql = adhoc_sql.check_read_only(sql)
+        except adhoc_sql.UnsafeSqlError:
+            return None
+        fingerprint = adhoc_sql.fingerprint(sql)
+        sql_hash = adhoc_sql.sql_hash(sql)
+        normalized = coalescing.normalize_question(question)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                """INSERT INTO queries (fingerprint, sql, count, first_seen, last_seen, total_seconds, max_seconds)
+                   VALUES (?, ?, 1, ?, ?, ?, ?)
+                   ON CONFLICT (fingerprint) DO UPDATE SET
+                       sql = excluded.sql, count = count + 1, last_seen = excluded.last_seen,
+                       total_seconds = total_seconds + excluded.total_seconds,
+                       max_seconds = MAX(max_seconds, excluded.max_seconds)""",
+                (fingerprint, sql, now, now, seconds, seconds)
+            )
+            seen = self._db.execute(
+                "SELECT 1 FROM questions WHERE fingerprint = ? AND normalized = ?", (fingerprint, normalized)
+            ).fetchone()
+            if seen is None:
+                self._db.execute(
+                    "INSERT INTO questions (fingerprint, normalized, question, count, last_seen, sql_hash) VALUES (?, ?, ?, 1, ?, ?)",
+                    (fingerprint, normalized, question, now, sql_hash)
+                )
+                self._db.execute(
+                    "INSERT INTO question_index (question, sql, fingerprint) VALUES (?, ?, ?)",
+                    (question, sql, fingerprint)
+                )
+            else:
+                self._db.execute(
+                    "UPDATE questions SET count = count + 1, last_seen = ?, sql_hash = ? WHERE fingerprint = ? AND normalized = ?",
+                    (now, sql_hash, fingerprint, normalized)
+                )
+        return fingerprint
+
+    def _questions(self, fingerprint):
+        rows = self._db.execute(
+            "SELECT question, count, sql_hash FROM questions WHERE fingerprint = ? ORDER BY count DESC, last_seen DESC LIMIT ?",
+            (fingerprint, MAX_QUESTIONS)
+        ).fetchall()
+        return [{'question': row['question'], 'count': row['count'], 'sql_hash': row['sql_hash']} for row in rows]
+
+    def _candidate(self, row):
+        return {
+            'fingerprint': row['fingerprint'],
+            'sql': row['sql'],
+            'count': row['count'],
+            'first_seen': row['first_seen'],
+            'last_seen': row['last_seen'],
+            'avg_seconds': round(row['total_seconds'] / row['count'], 3),
+            'max_seconds': round(row['max_seconds'], 3),
+            'total_seconds': round(row['total_seconds'], 3),
+            'promoted_alias': row['promoted_alias'],
+            'questions': self._questions(row['fingerprint'])
+        }
+
+    def candidates(self, limit=20, min_count=2, search=None, include_promoted=False):
+        """
+        The most frequently generated queries, most agent time first among equal counts.
+
+        Args:
+            limit (int): Candidates to return
+            min_count (int): Times a query must have been generated
+            search (str, optional): Only queries whose questions or SQL contain any of these words
+            include_promoted (bool): Also list queries already promoted to an alias
+        """
+        conditions = ["count >= ?"]
+        params = [min_count]
+        if not include_promoted:
+            conditions.append("promoted_alias IS NULL")
+        if search:
+            expression = _match_expression(search)
+            if not expression:
+                return []
+            conditions.append("fingerprint IN (SELECT fingerprint FROM question_index WHERE question_index MATCH ?)")
+            params.append(expression)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM queries WHERE {' AND '.join(conditions)} ORDER BY count DESC, total_seconds DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+            return [self._candidate(row) for row in rows]
+
+    def get(self, fingerprint):
+        """One candidate by fingerprint, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM queries WHERE fingerprint = ?", (fingerprint,)).fetchone()
+            return self._candidate(row) if row is not None else None
+
+    def mark_promoted(self, fingerprint, alias):
+        with self._lock, self._db:
+            self._db.execute("UPDATE queries SET promoted_alias = ? WHERE fingerprint = ?", (alias, fingerprint))
+
+    def snapshot(self):
+        with self._lock:
+            if self._connection is None and not os.path.exists(self.path):
+                # Nothing recorded yet; /health does not create the database
+                queries = generated = promoted = questions = 0
+            else:
+                queries, generated, promoted = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(count), 0), COUNT(promoted_alias) FROM queries"
+                ).fetchone()
+                questions = self._db.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+        return {
+            'path': self.path,
+            'queries': queries,
+            'generated': generated,
+            'questions': questions,
+            'promoted': promoted
+        }
+
+
+def alias_entry(candidate, name=None, description=None):
+    """
+    The query_config.json entry for a candidate. Its description defaults to the most frequent
+    question, so the question router answers that question (and the other listed ones) directly.
+
+    A fingerprint groups queries that differ only in their literals, but the alias runs the
+    latest SQL with its literals as they are. Only questions whose latest SQL is that exact
+    statement are attached, so "revenue for March" is never answered with June's rows.
+    """
+    sql_hash = adhoc_sql.sql_hash(candidate['sql'])
+    questions = [item['question'] for item in candidate['questions'] if item.get('sql_hash') == sql_hash]
+    description = description or (questions[0] if questions else '')
+    entry = {
+        'name': name or description[:80],
+        'description': description,
+        'query': candidate['sql'],
+        'promoted_from': {'fingerprint': candidate['fingerprint'], 'count': candidate['count']}
+    }
+    others = [question for question in questions if question != description]
+    if others:
+        entry['questions'] = others
+    return entry
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Statement timeouts, cancellation and result budgets for warehouse queries
+
+A query used to run for as long as the warehouse took and fetch every row
+it returned, so one runaway alias could hold a Flask thread indefinitely and
+fill the container's memory. Each query now runs under:
+
+- a statement timeout: the driver's query timeout (connection.timeout), with
+  a watchdog that cancels the statement if fetching runs past it too;
+- a cancel path: the watchdog calls cursor.cancel() as soon as the request's
+  CancellationToken fires, e.g. when the HTTP client disconnects;
+- a row and byte budget: rows are fetched in batches and fetching stops
+  once max_rows rows or about max_bytes bytes are held. The rest of the
+  result is cancelled and the response is flagged as truncated.
+
+An alias can override the defaults with "timeout" (seconds), "max_rows" and
+"max_bytes" in query_config.json; 0 disables a limit.
+
+Settings (environment variables): SQL_QUERY_TIMEOUT, SQL_MAX_ROWS,
+SQL_MAX_BYTES, SQL_FETCH_BATCH.
+"""
+
+import os
+import math
+import time
+import threading
+
+import telemetry
+
+QUERY_TIMEOUT = float(os.getenv('SQL_QUERY_TIMEOUT', '120'))
+MAX_ROWS = int(os.getenv('SQL_MAX_ROWS', '100000'))
+MAX_BYTES = int(os.getenv('SQL_MAX_BYTES', str(64 * 1024 * 1024)))
+FETCH_BATCH = int(os.getenv('SQL_FETCH_BATCH', '1000'))
+# How often the watchdog checks the cancellation token
+CANCEL_CHECK_INTERVAL = 0.25
+
+# Estimated size of non-text values, roughly their JSON length
+VALUE_BYTES = 16
+
+_counts = {'timeouts': 0, 'cancelled': 0, 'truncated': 0}
+_counts_lock = threading.Lock()
+
+
+class QueryCancelledError(Exception):
+    """Raised when a query was cancelled on timeout or by its CancellationToken."""
+
+    def __init__(self, reason, elapsed):
+        messages = {
+            'timeout': f"Query timed out after {elapsed:.0f} seconds and was cancelled",
+            'disconnect': "Client disconnected; query was cancelled",
+        }
+        super().__init__(messages.get(reason, f"Query was cancelled ({reason})"))
+        self.reason = reason
+        self.elapsed = elapsed
+
+
+def limits(query_info):
+    """Timeout (seconds), max_rows and max_bytes for an alias; 0 means unlimited."""
+    return {
+        'timeout': float(query_info.get('timeout', QUERY_TIMEOUT)),
+        'max_rows': int(query_info.get('max_rows', MAX_ROWS)),
+        'max_bytes': int(query_info.get('max_bytes', MAX_BYTES))
+    }
+
+
+def is_timeout(error):
+    """True for the ODBC "query timeout expired" error (SQLSTATE HYT00)."""
+    return 'HYT00' in str(error)
+
+
+def _count(name):
+    with _counts_lock:
+        _counts[name] += 1
+
+
+def snapshot():
+    """Timeout, cancellation and truncation counts since startup."""
+    with _counts_lock:
+        return dict(_counts)
+
+
+class StatementWatch:
+    """
+    Cancel a cursor's statement when a token is cancelled or a timeout passes, for the duration of the block.
+
+    Args:
+        cursor: The pyodbc cursor running the statement
+        timeout (float): Seconds before the statement is cancelled; 0 or None waits indefinitely
+        cancel_token (CancellationToken, optional): Cancels the statement when cancelled
+    """
+
+    def __init__(self, cursor, timeout=None, cancel_token=None):
+        self.cursor = cursor
+        self.timeout = timeout or None
+        self.cancel_token = cancel_token
+        self.reason = None
+        self.started = None
+        self._done = threading.Event()
+        # Held while cancelling, so the cursor is never cancelled after the block has left it
+        self._lock = threading.Lock()
+        self._finished = False
+        self._watcher = None
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        # The driver enforces the timeout while the statement executes (0 disables it);
+        # it is set every time because pooled connections are shared by aliases
+        self.cursor.connection.timeout = math.ceil(self.timeout) if self.timeout is not None else 0
+        if self.timeout is not None or self.cancel_token is not None:
+            self._watcher = threading.Thread(target=self._watch, name='statement-watch', daemon=True)
+            self._watcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        # After this the cursor may go back to the pool and run another request's statement
+        with self._lock:
+            self._finished = True
+        self._done.set()
+        if self._watcher is not None:
+            self._watcher.join()
+        return False
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def _watch(self):
+        while not self._done.wait(CANCEL_CHECK_INTERVAL):
+            if self.cancel_token is not None and self.cancel_token.cancelled:
+                self.cancel(self.cancel_token.reason or 'cancelled')
+            elif self.timeout is not None and self.elapsed >= self.timeout:
+                self.cancel('timeout')
+            if self.reason is not None:
+                return
+
+    def cancel(self, reason):
+        """Abort the running statement, unless the block has finished; failures are logged, not raised."""
+        with self._lock:
+            if self._finished:
+                return
+            self.reason = reason
+            try:
+                self.cursor.cancel()
+            except Exception as e:
+                print(f"Warning: could not cancel query: {e}")
+
+    def cancelled_error(self, error):
+        """
+        The QueryCancelledError for an error the statement raised, or None if it was not cancelled.
+        Counts the timeout or cancellation.
+        """
+        reason = self.reason or ('timeout' if is_timeout(error) else None)
+        if reason is None:
+            return None
+        _count('timeouts' if reason == 'timeout' else 'cancelled')
+        telemetry.record_query_cancelled(reason)
+        return QueryCancelledError(reason, self.elapsed)
+
+
+def _row_bytes(row):
+    size = 0
+    for value in row:
+        if isinstance(value, (str, bytes)):
+            size += len(value)
+        elif value is not None:
+            size += VALUE_BYTES
+    return size
+
+
+def fetch_rows(cursor, max_rows=0, max_bytes=0, batch_size=FETCH_BATCH):
+    """
+    Fetch the result of an executed statement within a row and byte budget.
+
+    Returns:
+        tuple: (rows, truncated_by) where truncated_by is 'rows', 'bytes' or None
+    """
+    rows = []
+    size = 0
+    truncated_by = None
+    while truncated_by is None:
+        batch = cursor.fetchmany(batch_size if not max_rows else min(batch_size, max_rows - len(rows) + 1))
+        if not batch:
+            break
+        for row in batch:
+            if max_rows and len(rows) >= max_rows:
+                truncated_by = 'rows'
+                break
+            size += _row_bytes(row)
+            if max_bytes and size > max_bytes:
+                truncated_by = 'bytes'
+                break
+            rows.append(tuple(row))
+
+    if truncated_by is not None:
+        # Stop the warehouse from sending the rest of the result
+        try:
+            cursor.cancel()
+        except Exception as e:
+            print(f"Warning: could not cancel truncated query: {e}")
+        _count('truncated')
+        telemetry.record_query_truncated(truncated_by)
+    return rows, truncated_by
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Typed parameters for query_config.json aliases
+
+An alias can declare parameters that its query refers to as T-SQL variables:
+
+    "parameters": {
+        "start_date": {"type": "date", "default": "2024-08-01"},
+        "end_date": {"type": "date", "default": null},
+        "min_count": {"type": "int", "default": 1, "min": 1},
+        "lead_source": {"type": "enum", "values": ["Referral", "Website"]}
+    }
+
+Supplied values are validated and converted, then bound through pyodbc
+parameter markers: the query is prefixed with one "DECLARE @name type = ?;"
+per parameter, so values are never formatted into the SQL text and the
+statement text of an alias is always the same, which lets a pooled cursor
+reuse its prepared statement. A parameter without a default is required;
+a null default binds NULL (e.g. for COALESCE(@end_date, GETDATE())). Date
+defaults may also be "today". datetime parameters take ISO 8601 timestamps.
+"""
+
+import re
+from datetime import date, datetime
+
+PARAMETER_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+MAX_STRING_LENGTH = 4000
+
+
+def _parse_date(value, name):
+    if isinstance(value, date):
+        return value
+    text = str(value).strip().lower()
+    if text == 'today':
+        return date.today()
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Parameter '{name}' must be a date in YYYY-MM-DD format, got '{value}'")
+
+
+def _parse_datetime(value, name):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Parameter '{name}' must be an ISO 8601 timestamp, got '{value}'")
+
+
+def _parse_int(value, name, spec):
+    if isinstance(value, bool):
+        raise ValueError(f"Parameter '{name}' must be an integer, got {value}")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Parameter '{name}' must be an integer, got '{value}'")
+    if isinstance(value, float) and value != number:
+        raise ValueError(f"Parameter '{name}' must be an integer, got {value}")
+    if 'min' in spec and number < spec['min']:
+        raise ValueError(f"Parameter '{name}' must be at least {spec['min']}, got {number}")
+    if 'max' in spec and number > spec['max']:
+        raise ValueError(f"Parameter '{name}' must be at most {spec['max']}, got {number}")
+    return number
+
+
+def _parse_enum(value, name, spec):
+    values = spec.get('values', [])
+    if value not in values:
+        raise ValueError(f"Parameter '{name}' must be one of {values}, got '{value}'")
+    return value
+
+
+def _parse_string(value, name, spec):
+    text = str(value)
+    max_length = spec.get('max_length', MAX_STRING_LENGTH)
+    if len(text) > max_length:
+        raise ValueError(f"Parameter '{name}' must be at most {max_length} characters")
+    return text
+
+
+def _convert(name, spec, value):
+    kind = spec.get('type')
+    if kind == 'date':
+        return _parse_date(value, name)
+    if kind == 'datetime':
+        return _parse_datetime(value, name)
+    if kind == 'int':
+        return _parse_int(value, name, spec)
+    if kind == 'enum':
+        return _parse_enum(value, name, spec)
+    if kind == 'string':
+        return _parse_string(value, name, spec)
+    raise ValueError(f"Parameter '{name}' has unsupported type '{kind}'")
+
+
+def sql_type(spec):
+    """T-SQL type of the variable a parameter is declared as."""
+    kind = spec.get('type')
+    if kind == 'date':
+        return 'date'
+    if kind == 'datetime':
+        return 'datetime2'
+    if kind == 'int':
+        return 'int'
+    if kind == 'enum':
+        longest = max((len(str(value)) for value in spec.get('values', [])), default=1)
+        return f'nvarchar({max(longest, 1)})'
+    if kind == 'string':
+        return f"nvarchar({spec.get('max_length', MAX_STRING_LENGTH)})"
+    raise ValueError(f"Unsupported parameter type '{kind}'")
+
+
+def definitions(query_info):
+    """The parameters declared by an alias, validated, in declaration order."""
+    parameters = query_info.get('parameters') or {}
+    if not isinstance(parameters, dict):
+        raise ValueError("'parameters' must be an object mapping names to definitions")
+    for name, spec in parameters.items():
+        if not PARAMETER_NAME.match(name):
+            raise ValueError(f"Invalid parameter name '{name}'")
+        sql_type(spec)
+    return parameters
+
+
+def resolve(query_info, supplied=None):
+    """
+    Validate supplied parameter values against an alias's definitions and fill in defaults.
+
+    Returns:
+        dict: Parameter name to converted value (date, int or str; None for a null default)
+
+    Raises:
+        ValueError: For unknown, missing or invalid parameters
+    """
+    supplied = supplied or {}
+    if not isinstance(supplied, dict):
+        raise ValueError("parameters must be an object mapping names to values")
+    parameters = definitions(query_info)
+
+    unknown = sorted(set(supplied) - set(parameters))
+    if unknown:
+        raise ValueError(f"Unknown parameters {unknown}. Available parameters: {list(parameters)}")
+
+    values = {}
+    for name, spec in parameters.items():
+        if name in supplied and supplied[name] is not None:
+            values[name] = _convert(name, spec, supplied[name])
+        elif 'default' not in spec:
+            raise ValueError(f"Parameter '{name}' is required")
+        elif spec['default'] is None:
+            values[name] = None
+        else:
+            values[name] = _convert(name, spec, spec['default'])
+    return values
+
+
+def statement(query_info):
+    """The alias's query prefixed with a DECLARE per parameter, bound with parameter markers."""
+    query = query_info.get('query')
+    declarations = [f"DECLARE @{name} {sql_type(spec)} = ?;" for name, spec in definitions(query_info).items()]
+    if not declarations:
+        return query
+    return '\n'.join(declarations) + '\n' + query
+
+
+def bind_values(query_info, values):
+    """Values for the parameter markers of statement(), in declaration order."""
+    return [values[name] for name in definitions(query_info)]
+
+
+def to_json(values):
+    """Resolved values as JSON-friendly data (dates as ISO strings)."""
+    return {name: value.isoformat() if isinstance(value, date) else value for name, value in values.items()}
+
+
+def cache_key(values):
+    """Hashable key for a set of resolved values, for coalescing and snapshot matching."""
+    return tuple(sorted(to_json(values).items()))
+
+
+def describe(query_info):
+    """Parameter definitions for the /execute-query usage listing."""
+    return {name: dict(spec) for name, spec in (query_info.get('parameters') or {}).items()}
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Fast path for questions a query_config.json alias already answers
+
+The descriptions in query_config.json are the questions users type into
+/ask and /run-details, and the agent takes 20-60 seconds to answer them
+with the same SQL. QuestionRouter matches an incoming question to an alias
+so it can be served like /execute-query (from its snapshot or one warehouse
+query) instead:
+
+1. exact: the question equals an alias's description (or one of its
+   optional "questions") after normalization - case, punctuation and
+   whitespace are ignored;
+2. lexical: the TF-IDF cosine similarity of the question's words and word
+   pairs to the closest description is at least THRESHOLD, and beats the
+   best description of every other alias by MARGIN. Most descriptions
+   share their wording ("contact opportunities created between ..."), so
+   near-ties go to the agent rather than to a guess.
+
+Numbers and month names decide which rows a question asks for, so a lexical
+match is also rejected when the question mentions one the description does
+not ("... since March 2023" never matches an August 2024 report). Aliases
+are always run with their default parameters, which are what their
+descriptions state.
+
+An alias can add phrasings with "questions": [...] or opt out with
+"route": false. The index is rebuilt whenever those change.
+
+Settings (environment variables): QUESTION_ROUTER, QUESTION_ROUTER_THRESHOLD,
+QUESTION_ROUTER_MARGIN.
+"""
+
+import os
+import re
+import math
+import threading
+from collections import Counter
+
+ENABLED = os.getenv('QUESTION_ROUTER', 'true').lower() in ('1', 'true', 'yes')
+THRESHOLD = float(os.getenv('QUESTION_ROUTER_THRESHOLD', '0.7'))
+MARGIN = float(os.getenv('QUESTION_ROUTER_MARGIN', '0.15'))
+
+# Rows rendered into the text answer of a routed question (/ask has no data_table)
+ANSWER_TABLE_ROWS = 50
+
+MONTHS = {
+    'january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+    'september', 'october', 'november', 'december'
+}
+
+
+def normalize(question):
+    """Question text casefolded, with punctuation dropped and whitespace collapsed."""
+    return ' '.join(re.sub(r"[^\w\s]", ' ', question.casefold()).split())
+
+
+def _terms(words):
+    # Word pairs keep some of the order ("ordered alphabetically" vs "count descending")
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def _literals(words):
+    return {word for word in words if word.isdigit() or word in MONTHS}
+
+
+class QuestionRouter:
+    """TF-IDF index over the descriptions of the aliases in query_config.json."""
+
+    def __init__(self, threshold=THRESHOLD, margin=MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._exact = {}
+        self._phrases = []
+        self._idf = {}
+        self._counts = {'exact': 0, 'lexical': 0, 'agent': 0}
+
+    def _ensure_index(self, queries):
+        phrases = []
+        for alias, query_info in queries.items():
+            if query_info.get('route', True) is False:
+                continue
+            for text in [query_info.get('description', '')] + list(query_info.get('questions', [])):
+                if normalize(text):
+                    phrases.append((alias, normalize(text)))
+        fingerprint = tuple(phrases)
+
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return
+            documents = [_terms(text.split()) for _, text in phrases]
+            frequency = Counter(term for terms in documents for term in set(terms))
+            idf = {term: math.log((1 + len(documents)) / (1 + count)) + 1 for term, count in frequency.items()}
+            self._idf = idf
+            self._exact = {}
+            for alias, text in phrases:
+                self._exact.setdefault(text, alias)
+            self._phrases = [
+                (alias, self._vector(terms), _literals(text.split()))
+                for (alias, text), terms in zip(phrases, documents)
+            ]
+            self._fingerprint = fingerprint
+
+    def _vector(self, terms):
+        weights = {term: count * self._idf.get(term, 0.0) for term, count in Counter(terms).items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+    def match(self, question, queries):
+        """
+        The alias that answers a question, or None if it should go to the agent.
+
+        Args:
+            question (str): The question as asked
+            queries (dict): The "queries" object of query_config.json
+
+        Returns:
+            dict: {'alias', 'method' ('exact' or 'lexical'), 'score'} or None
+        """
+        self._ensure_index(queries)
+        text = normalize(question)
+        with self._lock:
+            alias = self._exact.get(text)
+            if alias is not None:
+                return {'alias': alias, 'method': 'exact', 'score': 1.0}
+
+            words = text.split()
+            vector = self._vector(_terms(words))
+            literals = _literals(words)
+            best = {}
+            for alias, phrase, phrase_literals in self._phrases:
+                if not literals <= phrase_literals:
+                    continue
+                score = sum(weight * phrase.get(term, 0.0) for term, weight in vector.items())
+                best[alias] = max(score, best.get(alias, 0.0))
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < self.threshold:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < self.margin:
+            return None
+        return {'alias': ranked[0][0], 'method': 'lexical', 'score': round(ranked[0][1], 4)}
+
+    def record(self, path):
+        """Count a question answered by 'exact' or 'lexical' routing or by the 'agent'."""
+        with self._lock:
+            self._counts[path] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'enabled': ENABLED,
+                'threshold': self.threshold,
+                'margin': self.margin,
+                'phrases': len(self._phrases),
+                'answered': dict(self._counts)
+            }
+
+
+def _markdown_table(rows, columns):
+    def cell(value):
+        # NaN (a NULL in a pandas result) is not equal to itself
+        return '' if value is None or value != value else str(value).replace('|', '\\|').replace('\n', ' ')
+
+    lines = ['| ' + ' | '.join(columns) + ' |', '|' + '---|' * len(columns)]
+    lines.extend('| ' + ' | '.join(cell(row.get(column)) for column in columns) + ' |' for row in rows)
+    return '\n'.join(lines)
+
+
+def answer_text(result, table_rows=0):
+    """Reply text for a routed question, optionally followed by the first table_rows rows as a markdown table."""
+    text = f"{result.get('query_name') or result['query_alias']}: {result['row_count']} rows"
+    if result.get('snapshot_at'):
+        text += " from the latest scheduled snapshot"
+    if result.get('truncated'):
+        text += f" (truncated at the {result.get('truncated_by')} limit)"
+    text += '.'
+    if table_rows and result['data_table']:
+        rows = result['data_table'][:table_rows]
+        text += '\n\n' + _markdown_table(rows, result['columns'] or list(rows[0]))
+        if result['row_count'] > table_rows:
+            text += f"\n\nShowing the first {table_rows} of {result['row_count']} rows."
+    return text
+
+
+def run_details_result(question, match, result, sql=None):
+    """
+    The /run-details response for a question answered by an alias's /execute-query result.
+
+    Args:
+        question (str): The question as asked
+        match (dict): The router's match
+        result (dict): The alias's /execute-query result
+        sql (str, optional): The query the rows come from (the base alias's for a derived alias)
+    """
+    routed = {
+        "success": True,
+        "question": question,
+        "run_status": "completed",
+        "run_steps": {"data": []},
+        "messages": {"data": [{
+            "role": "assistant",
+            "content": [{"type": "text", "text": {"value": answer_text(result), "annotations": []}}]
+        }]},
+        "timestamp": result.get('timestamp'),
+        "data_table": result['data_table'],
+        "answered_by": "query_config",
+        "route": dict(match, query_alias=result['query_alias'], parameters=result.get('parameters') or {},
+                      snapshot_at=result.get('snapshot_at'))
+    }
+    if result.get('truncated'):
+        routed["truncated"] = True
+        routed["truncated_by"] = result.get('truncated_by')
+    if sql:
+        routed["sql_queries"] = [sql]
+        routed["sql_data_previews"] = []
+        routed["data_retrieval_query"] = sql
+    return routed
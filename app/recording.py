@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Record and replay Fabric Data Agent exchanges
+
+In record mode every Fabric API call made while answering a question (the
+threads/fabric lookup, assistant creation, messages, run creation, each run
+status poll, run steps, message listing, thread deletion) is saved with its
+timing to one JSON file per question. In replay mode those files are served
+instead of calling Fabric, with the original timing or compressed by a speed
+factor, so the full /ask and /run-details pipeline can be profiled and
+regression-tested offline and deterministically.
+
+Configuration (environment variables):
+    FABRIC_RECORD_MODE   off (default), record or replay
+    FABRIC_RECORD_DIR    Directory of recordings (default: recordings)
+    FABRIC_REPLAY_SPEED  Replay speed factor: 1 keeps the original timing,
+                         10 is ten times faster, 0 removes all delays
+
+Recordings contain response bodies (questions, generated SQL, result data)
+but never the Authorization header.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import atexit
+import inspect
+import tempfile
+import functools
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import httpx
+import requests
+
+MODES = ('off', 'record', 'replay')
+
+_mode = os.getenv('FABRIC_RECORD_MODE', 'off').lower()
+_directory = os.getenv('FABRIC_RECORD_DIR', 'recordings')
+_speed = float(os.getenv('FABRIC_REPLAY_SPEED', '1'))
+
+# Session (one question) the current request or client call belongs to
+_current_session = contextvars.ContextVar("recording_session", default=None)
+
+# httpx client shared by every OpenAI client while recording or replaying
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+class RecordingNotFoundError(Exception):
+    """Raised in replay mode when no recording exists for a question."""
+
+
+def configure(mode=None, directory=None, speed=None):
+    """
+    Change the recording mode, directory or replay speed at runtime.
+
+    Args:
+        mode (str, optional): 'off', 'record' or 'replay'
+        directory (str, optional): Directory recordings are written to and read from
+        speed (float, optional): Replay speed factor (0 removes all delays)
+    """
+    global _mode, _directory, _speed
+    if mode is not None:
+        if mode not in MODES:
+            raise ValueError(f"Recording mode must be one of {', '.join(MODES)}")
+        _mode = mode
+    if directory is not None:
+        _directory = directory
+    if speed is not None:
+        _speed = float(speed)
+
+
+def mode():
+    """Current recording mode."""
+    return _mode
+
+
+def recording_path(scope, question, thread_name=None):
+    """File a question's exchanges are recorded to, e.g. recordings/run-details/what-tables-are-3f2a9c1b0d4e.json."""
+    digest = hashlib.sha256(f"{question}\n{thread_name or ''}".encode('utf-8')).hexdigest()[:12]
+    slug = re.sub(r'[^a-z0-9]+', '-', question.lower()).strip('-')[:40] or 'question'
+    return os.path.join(_directory, re.sub(r'[^A-Za-z0-9_.-]+', '-', scope).strip('-'), f"{slug}-{digest}.json")
+
+
+def _route(url):
+    """Route used to match requests in replay: the path after /aiassistant, without the query string."""
+    path = httpx.URL(str(url)).path
+    return path.split('/aiassistant', 1)[-1]
+
+
+class Session:
+    """Exchanges recorded for, or replayed to, a single question."""
+
+    def __init__(self, scope, question, thread_name=None):
+        self.scope = scope
+        self.question = question
+        self.thread_name = thread_name
+        self.path = recording_path(scope, question, thread_name)
+        self.mode = _mode
+        self.speed = _speed
+        self.started = time.perf_counter()
+        self.exchanges = []
+        self._lock = threading.Lock()
+        self._replay_queues = defaultdict(list)
+        self._last_replayed = {}
+        self._token = None
+
+        if self.mode == 'replay':
+            if not os.path.exists(self.path):
+                raise RecordingNotFoundError(f"No recording for this question in {self.path}")
+            with open(self.path) as f:
+                self.exchanges = json.load(f)['exchanges']
+            for exchange in self.exchanges:
+                self._replay_queues[(exchange['request']['method'], exchange['request']['route'])].append(exchange)
+
+    def record(self, method, url, body, status, headers, response_body, elapsed):
+        """Append one exchange (record mode)."""
+        exchange = {
+            'offset': round(time.perf_counter() - self.started - elapsed, 6),
+            'elapsed': round(elapsed, 6),
+            'request': {'method': method, 'url': str(url), 'route': _route(url), 'body': body},
+            'response': {'status': status, 'headers': headers, 'body': response_body}
+        }
+        with self._lock:
+            self.exchanges.append(exchange)
+
+    def next_exchange(self, method, url):
+        """
+        Return the next recorded exchange for a request (replay mode).
+
+        Exchanges are served in recorded order per method and route. Once a
+        route is exhausted its last exchange is repeated, so an extra status
+        poll sees the final run state again.
+        """
+        key = (method, _route(url))
+        with self._lock:
+            queue = self._replay_queues.get(key)
+            if queue:
+                self._last_replayed[key] = queue.pop(0)
+            exchange = self._last_replayed.get(key)
+        if exchange is not None:
+            self.wait(exchange['elapsed'])
+        return exchange
+
+    def wait(self, seconds):
+        """Sleep for a recorded duration scaled by the replay speed."""
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def save(self):
+        """Write the recording atomically (record mode)."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        payload = {
+            'scope': self.scope,
+            'question': self.question,
+            'thread_name': self.thread_name,
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+            'duration': round(time.perf_counter() - self.started, 6),
+            'exchanges': self.exchanges
+        }
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(payload, f, indent=1)
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        """Save the recording if recording and detach the session from the current context."""
+        if self._token is not None:
+            try:
+                _current_session.reset(self._token)
+            except ValueError:
+                _current_session.set(None)
+            self._token = None
+        if self.mode == 'record' and self.exchanges:
+            self.save()
+            print(f"Recorded {len(self.exchanges)} Fabric exchanges to {self.path}")
+
+
+def begin_session(scope, question, thread_name=None):
+    """
+    Start recording or replaying the Fabric exchanges for a question.
+
+    Returns None when recording is off. Call close() on the returned session
+    when the question has been answered.
+    """
+    if _mode == 'off':
+        return None
+    session = Session(scope, question, thread_name)
+    session._token = _current_session.set(session)
+    return session
+
+
+@contextmanager
+def session(scope, question, thread_name=None):
+    """Context manager form of begin_session()."""
+    active = begin_session(scope, question, thread_name)
+    try:
+        yield active
+    finally:
+        if active is not None:
+            active.close()
+
+
+def recorded(scope):
+    """
+    Decorator for client methods taking (question, ..., thread_name=None):
+    records or replays every Fabric exchange made during the call.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _mode == 'off':
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            with session(scope, bound.arguments.get('question', ''), bound.arguments.get('thread_name')):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def poll_interval(seconds):
+    """Run status poll interval, compressed by the replay speed while replaying."""
+    active = _current_session.get()
+    if active is None or active.mode != 'replay':
+        return seconds
+    return seconds / active.speed if active.speed > 0 else 0
+
+
+def _decode(content):
+    """Body as JSON when possible, otherwise as text."""
+    if not content:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content.decode('utf-8', errors='replace')
+
+
+def _encode(body):
+    """Inverse of _decode()."""
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return json.dumps(body).encode('utf-8')
+
+
+def _missing_response(method, url):
+    """JSON 404 returned for requests that have no recorded exchange."""
+    return 404, json.dumps({'error': {
+        'message': f"No recorded response for {method} {_route(url)}",
+        'type': 'recording_not_found'
+    }}).encode('utf-8')
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """httpx transport for the OpenAI client that records or replays exchanges."""
+
+    def __init__(self, transport=None):
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        active = _current_session.get()
+        if active is None and _mode != 'replay':
+            return self.transport.handle_request(request)
+
+        if _mode == 'replay':
+            exchange = active.next_exchange(request.method, request.url) if active else None
+            if exchange is None:
+                status, content = _missing_response(request.method, request.url)
+                return httpx.Response(status, headers={'content-type': 'application/json'}, content=content, request=request)
+            recorded_response = exchange['response']
+            return httpx.Response(
+                recorded_response['status'],
+                headers=recorded_response['headers'],
+                content=_encode(recorded_response['body']),
+                request=request
+            )
+
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        headers = {'content-type': response.headers.get('content-type', 'application/json')}
+        active.record(request.method, request.url, _decode(request.content), response.status_code,
+                      headers, _decode(content), time.perf_counter() - start)
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    def close(self):
+        self.transport.close()
+
+
+def http_client():
+    """The shared httpx client for OpenAI(http_client=...), or None to use the default when recording is off."""
+    global _http_client
+    if _mode == 'off':
+        return None
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(transport=RecordingTransport(), timeout=httpx.Timeout(600.0, connect=5.0),
+                                        follow_redirects=True)
+        return _http_client
+
+
+@atexit.register
+def _close_http_client():
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+
+
+def get(url, headers=None, **kwargs):
+    """requests.get() that records or replays the exchange (used for the threads/fabric lookup)."""
+    active = _current_session.get()
+    if _mode == 'off' or (active is None and _mode != 'replay'):
+        return requests.get(url, headers=headers, **kwargs)
+
+    if _mode == 'replay':
+        exchange = active.next_exchange('GET', url) if active else None
+        response = requests.Response()
+        response.url = url
+        if exchange is None:
+            response.status_code, response._content = _missing_response('GET', url)
+        else:
+            response.status_code = exchange['response']['status']
+            response._content = _encode(exchange['response']['body'])
+        response.headers['content-type'] = 'application/json'
+        return response
+
+    start = time.perf_counter()
+    response = requests.get(url, headers=headers, **kwargs)
+    active.record('GET', url, None, response.status_code,
+                  {'content-type': response.headers.get('content-type', 'application/json')},
+                  _decode(response.content), time.perf_counter() - start)
+    return response
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Retries and circuit breakers for Fabric and warehouse calls
+
+call() runs a Fabric or warehouse call with bounded retries (exponential
+backoff with full jitter, honoring Retry-After) behind a circuit breaker per
+call target. After CIRCUIT_FAILURE_THRESHOLD consecutive transient failures
+the breaker opens and further calls fail fast with CircuitOpenError for
+CIRCUIT_RESET_TIMEOUT seconds; then a single trial call decides whether it
+closes again.
+
+Only transient failures are retried: 429 and 5xx responses, connection
+errors and timeouts, and pyodbc operational errors. Calls that are not
+idempotent (e.g. runs.create) are only retried when the request was
+certainly not processed: 429, 503 and failures to connect (an
+httpx.ConnectError or ConnectTimeout, not openai's APIConnectionError, which
+also covers read and protocol failures after the request was sent).
+
+Settings (environment variables): RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY,
+RETRY_MAX_DELAY, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT.
+"""
+
+import os
+import time
+import random
+import threading
+import email.utils
+
+import httpx
+
+import telemetry
+
+MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '4'))
+BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.5'))
+MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '20'))
+FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Responses that guarantee the request was not processed
+NOT_PROCESSED_STATUS = {429, 503}
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a target whose circuit breaker is open."""
+
+    def __init__(self, target, retry_after):
+        super().__init__(f"{target} is temporarily unavailable (circuit open), retry after {retry_after}s")
+        self.target = target
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one call target."""
+
+    def __init__(self, target, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.target = target
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Check that a call may proceed; raises CircuitOpenError while open."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_after = max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1)
+        telemetry.record_circuit_rejection(self.target)
+        raise CircuitOpenError(self.target, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            if self.state != CLOSED:
+                print(f"Circuit for {self.target} closed")
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                print(f"Circuit for {self.target} opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        """End a trial call that neither succeeded nor failed transiently."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _set_state(self, state):
+        self.state = state
+        telemetry.set_circuit_state(self.target, state)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(target):
+    """The circuit breaker for a call target, created on first use."""
+    with _breakers_lock:
+        if target not in _breakers:
+            _breakers[target] = CircuitBreaker(target)
+        return _breakers[target]
+
+
+def circuit_states():
+    """State and consecutive failure count of every circuit breaker."""
+    with _breakers_lock:
+        return {target: {'state': b.state, 'failures': b.failures} for target, b in _breakers.items()}
+
+
+def _status_code(error):
+    """HTTP status of an openai or requests error, if any."""
+    status = getattr(error, 'status_code', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = getattr(error.response, 'status_code', None)
+    return status
+
+
+def _retry_after(error):
+    """Seconds from a Retry-After (or retry-after-ms) response header, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(error, idempotent=True):
+    """
+    Decide whether an error is transient.
+
+    Returns:
+        str | None: Short reason ('429', '503', 'connect', 'timeout', 'odbc') or None if not retryable
+    """
+    name = type(error).__name__
+    module = type(error).__module__ or ''
+
+    status = _status_code(error)
+    if status is not None:
+        retryable = RETRYABLE_STATUS if idempotent else NOT_PROCESSED_STATUS
+        return str(status) if status in retryable else None
+
+    if module.startswith('pyodbc'):
+        return 'odbc' if name in ('OperationalError', 'InterfaceError') else None
+
+    # openai.APITimeoutError, requests.Timeout, httpx.TimeoutException
+    if 'Timeout' in name:
+        if not idempotent and not _connect_failed(error):
+            return None
+        return 'timeout'
+
+    # openai.APIConnectionError, requests.ConnectionError, httpx.ConnectError
+    if 'Connect' in name:
+        if not idempotent and not _connect_failed(error):
+            return None
+        return 'connect'
+    return None
+
+
+def _connect_failed(error):
+    """True if the error, or one it was raised from, is a failure to connect (so nothing was sent)."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff, or the server's Retry-After when it asks for longer."""
+    delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+    retry_after = _retry_after(error) if error is not None else None
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, MAX_DELAY * 3))
+    return delay
+
+
+def call(target, func, *args, idempotent=True, max_attempts=None, **kwargs):
+    """
+    Call func(*args, **kwargs) with retries behind the circuit breaker for target.
+
+    Args:
+        target (str): Call target, e.g. 'runs.create', 'runs.retrieve', 'thread_lookup', 'sql.connect'
+        func (callable): The call to make
+        idempotent (bool): False for calls that must not be repeated after the server may have processed them
+        max_attempts (int, optional): Overrides RETRY_MAX_ATTEMPTS
+
+    Raises:
+        CircuitOpenError: If the breaker is open
+        Exception: The last error once retries are exhausted or for a non-transient error
+    """
+    circuit = breaker(target)
+    attempts = max_attempts or MAX_ATTEMPTS
+    for attempt in range(attempts):
+        circuit.allow()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            reason = classify(e, idempotent)
+            if reason is None:
+                circuit.release()
+                raise
+            circuit.record_failure()
+            if attempt + 1 >= attempts or circuit.state == OPEN:
+                raise
+            delay = backoff_delay(attempt, e)
+            telemetry.record_retry(target, reason)
+            print(f"{target} failed ({reason}), retry {attempt + 1}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+        except BaseException:
+            circuit.release()
+            raise
+        else:
+            circuit.record_success()
+            return result
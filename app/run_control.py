@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Polling and cancellation of agent runs
+
+poll_run() waits for a run to finish and, instead of abandoning it, calls
+runs.cancel when the timeout expires, when its CancellationToken is
+cancelled (e.g. the HTTP client disconnected or the caller gave up) or on
+KeyboardInterrupt, so a run nobody is waiting for stops using capacity.
+"""
+
+import time
+import select
+import socket
+import threading
+
+import telemetry
+import recording
+import resilience
+
+POLL_INTERVAL = 2
+ACTIVE_STATUSES = ("queued", "in_progress")
+
+
+class RunCancelledError(Exception):
+    """Raised when a run was cancelled before it finished."""
+
+    def __init__(self, reason, run, elapsed):
+        messages = {
+            'timeout': f"Run timed out after {elapsed:.0f} seconds and was cancelled",
+            'disconnect': "Client disconnected; run was cancelled",
+        }
+        super().__init__(messages.get(reason, f"Run was cancelled ({reason})"))
+        self.reason = reason
+        self.run = run
+        self.elapsed = elapsed
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation signal for a run.
+
+    Args:
+        check (callable, optional): Polled while waiting; a truthy return
+            cancels the token with check_reason (e.g. a disconnect check)
+        check_reason (str): Reason recorded when check() fires
+    """
+
+    def __init__(self, check=None, check_reason='disconnect'):
+        self._event = threading.Event()
+        self._check = check
+        self._check_reason = check_reason
+        self.reason = None
+
+    def cancel(self, reason='cancelled'):
+        """Request cancellation; the run is cancelled at its next poll."""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self._check is not None and self._check():
+            self.cancel(self._check_reason)
+        return self._event.is_set()
+
+    def wait(self, seconds, slice_seconds=0.25):
+        """Sleep up to seconds, waking early on cancellation. Returns True if cancelled."""
+        deadline = time.monotonic() + seconds
+        while not self.cancelled:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._event.wait(min(remaining, slice_seconds) if self._check is not None else remaining)
+        return True
+
+
+def socket_disconnected(sock):
+    """True if the peer of an idle HTTP connection has closed it."""
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except ValueError:
+        # TLS sockets do not support MSG_PEEK; disconnects cannot be detected
+        return False
+    except OSError:
+        return True
+
+
+def environ_disconnect_check(environ):
+    """Disconnect check for a WSGI request, using the socket Werkzeug or Gunicorn exposes."""
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None:
+        return None
+    return lambda: socket_disconnected(sock)
+
+
+def cancel_run(client, thread_id, run, reason):
+    """Ask Fabric to cancel a run; failures are logged, not raised."""
+    try:
+        resilience.call('runs.cancel', client.beta.threads.runs.cancel, thread_id=thread_id, run_id=run.id)
+        print(f"Cancelled run {run.id} ({reason})")
+    except Exception as e:
+        print(f"Warning: could not cancel run {run.id}: {e}")
+    telemetry.record_run_cancelled(reason)
+
+
+def poll_run(client, thread_id, run, timeout=None, cancel_token=None, on_status=None):
+    """
+    Poll a run until it leaves the queued/in_progress states.
+
+    Args:
+        client (OpenAI): Client used to retrieve and cancel the run
+        thread_id (str): ID of the thread the run belongs to
+        run: The run returned by runs.create
+        timeout (float, optional): Seconds to wait before cancelling the run. None waits indefinitely
+        cancel_token (CancellationToken, optional): Cancels the run when cancelled
+        on_status (callable, optional): Called with the run before each poll
+
+    Returns:
+        The last retrieved run
+
+    Raises:
+        RunCancelledError: If the run was cancelled on timeout or by the token
+    """
+    cancel_token = cancel_token or CancellationToken()
+    polls = 0
+    reason = None
+    start_time = time.time()
+    try:
+        with telemetry.stage("polling"):
+            while run.status in ACTIVE_STATUSES:
+                interval = recording.poll_interval(POLL_INTERVAL)
+                if timeout is not None:
+                    remaining = timeout - (time.time() - start_time)
+                    if remaining <= 0:
+                        reason = 'timeout'
+                        break
+                    interval = min(interval, remaining)
+                if on_status is not None:
+                    on_status(run)
+                if cancel_token.wait(interval):
+                    reason = cancel_token.reason
+                    break
+                run = resilience.call('runs.retrieve', client.beta.threads.runs.retrieve, thread_id=thread_id, run_id=run.id)
+                polls += 1
+    except KeyboardInterrupt:
+        cancel_run(client, thread_id, run, 'interrupted')
+        raise
+    finally:
+        telemetry.record_polls(polls, run.status)
+
+    if reason is not None:
+        cancel_run(client, thread_id, run, reason)
+        raise RunCancelledError(reason, run, time.time() - start_time)
+    return run
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Complete run step retrieval and a cache of finished runs' steps
+
+runs.steps.list returns one page (20 steps by default), so a run with many
+tool calls lost the rest of its steps. iter_steps() follows the after
+cursor until has_more is false and list_steps() returns every step as a
+single page, so the extractors see the whole run.
+
+The steps of a run that has reached a terminal status never change, so
+StepsCache keeps them keyed by (thread_id, run_id) without expiry; entries
+are only evicted, least recently used first, once STEPS_CACHE_SIZE runs are
+cached. Cached pages are shared and must not be modified.
+
+Settings (environment variables): STEPS_PAGE_SIZE, STEPS_CACHE_SIZE.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import telemetry
+import resilience
+
+PAGE_SIZE = int(os.getenv('STEPS_PAGE_SIZE', '100'))
+CACHE_SIZE = int(os.getenv('STEPS_CACHE_SIZE', '256'))
+
+# Runs in these states will not produce any more steps
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+
+def iter_steps(client, thread_id, run_id, order="desc", page_size=PAGE_SIZE, after=None):
+    """
+    Yield every page of a run's steps, following the after cursor until exhausted.
+
+    Args:
+        client (OpenAI): Client for the data agent
+        thread_id (str): ID of the thread the run belongs to
+        run_id (str): ID of the run
+        order (str): "desc" (newest first, the API default) or "asc"
+        page_size (int): Steps requested per page (the API allows up to 100)
+        after (str, optional): Step ID to start after
+    """
+    while True:
+        params = {'thread_id': thread_id, 'run_id': run_id, 'order': order, 'limit': page_size}
+        if after is not None:
+            params['after'] = after
+        page = resilience.call('steps.list', client.beta.threads.runs.steps.list, **params)
+        yield page
+        if not page.data or not getattr(page, 'has_more', False):
+            return
+        after = page.data[-1].id
+
+
+def list_steps(client, thread_id, run_id, order="desc", page_size=PAGE_SIZE, after=None):
+    """
+    List all steps of a run (after the step ID after, if given) as one page.
+
+    Returns:
+        The first page returned by the API with data holding every step and has_more False
+    """
+    pages = list(iter_steps(client, thread_id, run_id, order=order, page_size=page_size, after=after))
+    if len(pages) == 1:
+        return pages[0]
+    data = [step for page in pages for step in page.data]
+    return pages[0].model_copy(update={'data': data, 'has_more': False})
+
+
+class StepsCache:
+    """Least-recently-used cache of the steps of runs that have finished."""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, thread_id, run_id):
+        """Cached (run_status, steps) of a finished run, or None."""
+        key = (thread_id, run_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        telemetry.record_steps_cache('miss' if entry is None else 'hit')
+        return entry
+
+    def put(self, thread_id, run_id, run_status, steps):
+        """Cache the steps of a run; runs that have not finished are ignored."""
+        if run_status not in TERMINAL_STATUSES or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(thread_id, run_id)] = (run_status, steps)
+            self._entries.move_to_end((thread_id, run_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def fetch(self, client, thread_id, run):
+        """
+        Steps of a run, from the cache when the run has finished and was read before.
+
+        Returns:
+            tuple: (steps, cached)
+        """
+        entry = self.get(thread_id, run.id)
+        if entry is not None:
+            return entry[1], True
+        steps = list_steps(client, thread_id, run.id)
+        self.put(thread_id, run.id, run.status, steps)
+        return steps, False
+
+    def snapshot(self):
+        """Size and hit counts of the cache."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
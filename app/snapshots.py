@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Scheduled snapshots of query_config.json aliases
+
+The aliases in query_config.json are fixed reports. An alias with a
+"schedule" is re-run in the background by SnapshotScheduler and its latest
+result is kept in a SnapshotStore, from which /execute-query serves it with
+a snapshot_at timestamp. A new result replaces the previous one in a single
+reference swap, so readers see either the old or the new snapshot, never a
+partial one.
+
+A schedule is either a number of seconds between runs or a five-field cron
+expression (minute hour day-of-month month day-of-week, local time), e.g.
+"schedule": 900 or "schedule": "0 6 * * 1-5". Scheduled aliases are
+materialized when the app starts and refreshed one at a time so the
+warehouse never sees a burst of report queries. A failed refresh keeps the
+previous snapshot and is retried after SNAPSHOT_RETRY_DELAY seconds.
+
+Settings (environment variables): SNAPSHOT_RETRY_DELAY.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+import telemetry
+
+RETRY_DELAY = float(os.getenv('SNAPSHOT_RETRY_DELAY', '60'))
+# The scheduler re-reads query_config.json at least this often
+CONFIG_CHECK_INTERVAL = 60.0
+
+# (lowest, highest) value of each cron field
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+class IntervalSchedule:
+    """Run every N seconds."""
+
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError(f"Schedule interval must be positive, got {seconds}")
+        self.seconds = seconds
+        self.expression = seconds
+
+    def next_after(self, timestamp):
+        return timestamp + self.seconds
+
+
+class CronSchedule:
+    """Run at the times matching a five-field cron expression, in local time."""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron schedule must have 5 fields, got '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        ]
+        # Standard cron: when both day fields are restricted, either may match
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(','):
+            spec, _, step = part.partition('/')
+            step = int(step) if step else 1
+            if spec == '*':
+                start, end = low, high
+            elif '-' in spec:
+                start, end = (int(value) for value in spec.split('-', 1))
+            else:
+                start = int(spec)
+                end = high if step > 1 else start
+            # 7 is also Sunday in the day-of-week field
+            if high == 6 and end == 7:
+                values.add(0)
+                end = 6
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Invalid cron field '{field}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp):
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skip whole months, days and hours that cannot match; five years covers any valid expression
+        limit = moment + timedelta(days=5 * 366)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"Cron schedule '{self.expression}' never matches")
+
+
+def parse_schedule(spec):
+    """Schedule for a query_config.json "schedule" value: seconds or a cron expression."""
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        return IntervalSchedule(float(spec))
+    if isinstance(spec, str):
+        if spec.strip().isdigit():
+            return IntervalSchedule(float(spec))
+        return CronSchedule(spec)
+    raise ValueError(f"Unsupported schedule: {spec!r}")
+
+
+class SnapshotStore:
+    """Latest published result of each scheduled alias."""
+
+    def __init__(self):
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, alias):
+        """The latest snapshot of an alias (shared, do not modify), or None."""
+        with self._lock:
+            return self._snapshots.get(alias)
+
+    def publish(self, alias, result):
+        """Replace the snapshot of an alias with a new result, stamped with snapshot_at."""
+        snapshot = dict(result, snapshot_at=time.time())
+        with self._lock:
+            self._snapshots[alias] = snapshot
+        telemetry.set_snapshot_time(alias, snapshot['snapshot_at'])
+        return snapshot
+
+    def discard(self, alias):
+        with self._lock:
+            self._snapshots.pop(alias, None)
+
+
+class SnapshotScheduler:
+    """
+    Background thread re-running scheduled aliases into a SnapshotStore.
+
+    Args:
+        load_config (callable): Returns the query_config.json contents
+        refresh (callable): Runs an alias and returns its /execute-query result
+        store (SnapshotStore): Where results are published
+    """
+
+    def __init__(self, load_config, refresh, store, retry_delay=RETRY_DELAY):
+        self.load_config = load_config
+        self.refresh = refresh
+        self.store = store
+        self.retry_delay = retry_delay
+        self._schedules = {}
+        self._next_run = {}
+        self._last_error = {}
+        self._invalid = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """Start the scheduler thread (no-op if it is running)."""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='snapshot-scheduler', daemon=True)
+                self._worker.start()
+
+    def wake(self):
+        """Retry failed refreshes now, e.g. once authentication has completed."""
+        with self._lock:
+            now = time.time()
+            for alias in self._last_error:
+                self._next_run[alias] = now
+        self._wake.set()
+
+    def scheduled(self, alias):
+        with self._lock:
+            return alias in self._schedules
+
+    def status(self):
+        """Schedule, snapshot time, next run and last error of each scheduled alias."""
+        with self._lock:
+            aliases = {alias: schedule.expression for alias, schedule in self._schedules.items()}
+            next_run = dict(self._next_run)
+            errors = dict(self._last_error)
+        status = {}
+        for alias, expression in aliases.items():
+            snapshot = self.store.get(alias)
+            status[alias] = {
+                'schedule': expression,
+                'snapshot_at': snapshot['snapshot_at'] if snapshot is not None else None,
+                'next_run_at': next_run.get(alias),
+                'last_error': errors.get(alias)
+            }
+        return status
+
+    def _load_schedules(self):
+        """Pick up added, changed and removed schedules from query_config.json."""
+        try:
+            queries = self.load_config().get('queries', {})
+        except Exception as e:
+            print(f"Warning: could not load query schedules: {e}")
+            return
+        schedules = {}
+        for alias, query_info in queries.items():
+            spec = query_info.get('schedule')
+            if spec is None:
+                continue
+            try:
+                schedules[alias] = parse_schedule(spec)
+            except ValueError as e:
+                # Warn once per invalid value, not on every config check
+                if self._invalid.get(alias) != spec:
+                    print(f"Warning: ignoring schedule of query alias '{alias}': {e}")
+                self._invalid[alias] = spec
+
+        with self._lock:
+            for alias in set(self._schedules) - set(schedules):
+                self._next_run.pop(alias, None)
+                self._last_error.pop(alias, None)
+                self.store.discard(alias)
+            for alias, schedule in schedules.items():
+                previous = self._schedules.get(alias)
+                if previous is None:
+                    # Materialize new aliases right away
+                    self._next_run[alias] = time.time()
+                elif previous.expression != schedule.expression:
+                    self._next_run[alias] = schedule.next_after(time.time())
+            self._schedules = schedules
+
+    def _run(self):
+        last_config_check = 0.0
+        while True:
+            if time.time() - last_config_check >= CONFIG_CHECK_INTERVAL:
+                self._load_schedules()
+                last_config_check = time.time()
+
+            with self._lock:
+                now = time.time()
+                due = sorted((run_at, alias) for alias, run_at in self._next_run.items() if run_at <= now)
+                upcoming = min(self._next_run.values(), default=now + CONFIG_CHECK_INTERVAL)
+
+            for _, alias in due:
+                self._refresh(alias)
+
+            if not due:
+                self._wake.wait(max(0.0, min(upcoming - time.time(), CONFIG_CHECK_INTERVAL)))
+                self._wake.clear()
+
+    def _refresh(self, alias):
+        start = time.perf_counter()
+        try:
+            result = self.refresh(alias)
+        except Exception as e:
+            print(f"Snapshot refresh of '{alias}' failed, retrying in {self.retry_delay:.0f}s: {e}")
+            telemetry.record_snapshot_refresh(alias, 'failed', time.perf_counter() - start)
+            with self._lock:
+                self._last_error[alias] = str(e)
+                if alias in self._schedules:
+                    self._next_run[alias] = min(
+                        time.time() + self.retry_delay,
+                        self._schedules[alias].next_after(time.time())
+                    )
+            return
+
+        telemetry.record_snapshot_refresh(alias, 'published', time.perf_counter() - start)
+        with self._lock:
+            self._last_error.pop(alias, None)
+            if alias not in self._schedules:
+                return
+            self.store.publish(alias, result)
+            self._next_run[alias] = self._schedules[alias].next_after(time.time())
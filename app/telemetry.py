@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+"""
+Telemetry for the Fabric Data Agent Flask app and client
+
+Prometheus counters and histograms for every stage of an agent run
+(thread lookup, assistant creation, messages, runs, polling, steps,
+extraction, serialization) and of warehouse query execution (token,
+connect, execute, fetch, encode).
+
+Each stage is also recorded as a span. Spans are collected per request for
+the Server-Timing response header and, when OpenTelemetry is installed and
+OTEL_EXPORTER_OTLP_ENDPOINT is set, exported over OTLP/HTTP. Every span
+carries the ActivityId sent to Fabric so traces can be matched with
+Fabric-side logs.
+
+prometheus_client and opentelemetry are optional: without them the
+corresponding helpers in this module are no-ops.
+"""
+
+import os
+import time
+import uuid
+import functools
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+try:
+    from opentelemetry import trace, context as otel_context
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+# Agent runs routinely take 20-60 seconds, warehouse queries a few milliseconds
+# to several seconds, so the buckets span both ranges.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+POLL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 15, 20, 30, 45, 60)
+
+# Label values for the code currently executing. Flask sets the endpoint per
+# request, execute_query_by_alias sets the alias, the client sets its method name.
+_current_endpoint = contextvars.ContextVar("telemetry_endpoint", default="")
+_current_alias = contextvars.ContextVar("telemetry_alias", default="")
+
+# ActivityId sent to Fabric for the current request, and the stage timings
+# collected for its Server-Timing header (None outside of a request).
+_current_activity_id = contextvars.ContextVar("telemetry_activity_id", default=None)
+_current_timings = contextvars.ContextVar("telemetry_timings", default=None)
+
+_tracer = None
+
+if PROMETHEUS_AVAILABLE:
+    REQUESTS_TOTAL = Counter(
+        "fabric_agent_requests_total",
+        "Requests handled, by endpoint, HTTP status and query alias",
+        ["endpoint", "status", "alias"]
+    )
+    REQUEST_SECONDS = Histogram(
+        "fabric_agent_request_duration_seconds",
+        "End-to-end request latency, by endpoint, HTTP status and query alias",
+        ["endpoint", "status", "alias"],
+        buckets=LATENCY_BUCKETS
+    )
+    STAGE_SECONDS = Histogram(
+        "fabric_agent_stage_duration_seconds",
+        "Latency of each stage of an agent run or warehouse query",
+        ["endpoint", "stage", "status", "alias"],
+        buckets=LATENCY_BUCKETS
+    )
+    RUN_POLLS_TOTAL = Counter(
+        "fabric_agent_run_polls_total",
+        "runs.retrieve calls made while waiting for a run to finish",
+        ["endpoint", "status", "alias"]
+    )
+    RUN_POLLS_PER_RUN = Histogram(
+        "fabric_agent_run_polls_per_run",
+        "Number of runs.retrieve polls needed per run",
+        ["endpoint", "status", "alias"],
+        buckets=POLL_COUNT_BUCKETS
+    )
+    COALESCED_TOTAL = Counter(
+        "fabric_agent_coalesced_requests_total",
+        "Requests that joined an identical in-flight agent run or query instead of starting their own",
+        ["endpoint", "alias"]
+    )
+    ADMISSION_IN_FLIGHT = Gauge(
+        "fabric_agent_admission_in_flight",
+        "Agent runs or queries currently holding an admission slot, by lane",
+        ["lane"]
+    )
+    ADMISSION_QUEUE_DEPTH = Gauge(
+        "fabric_agent_admission_queue_depth",
+        "Requests waiting for an admission slot, by lane",
+        ["lane"]
+    )
+    ADMISSION_WAIT_SECONDS = Histogram(
+        "fabric_agent_admission_wait_seconds",
+        "Time spent waiting for an admission slot, by lane and outcome (admitted, queue_full, deadline_exceeded)",
+        ["lane", "outcome"],
+        buckets=LATENCY_BUCKETS
+    )
+    RETRIES_TOTAL = Counter(
+        "fabric_agent_retries_total",
+        "Retried Fabric and warehouse calls, by call target and failure reason",
+        ["target", "reason"]
+    )
+    CIRCUIT_STATE = Gauge(
+        "fabric_agent_circuit_state",
+        "Circuit breaker state by call target (0 closed, 1 half open, 2 open)",
+        ["target"]
+    )
+    CIRCUIT_REJECTIONS_TOTAL = Counter(
+        "fabric_agent_circuit_rejections_total",
+        "Calls failed fast because the target's circuit breaker was open",
+        ["target"]
+    )
+
+    RUNS_CANCELLED_TOTAL = Counter(
+        "fabric_agent_runs_cancelled_total",
+        "Agent runs cancelled before finishing, by reason (timeout, disconnect, interrupted, cancelled)",
+        ["endpoint", "reason"]
+    )
+    QUERIES_CANCELLED_TOTAL = Counter(
+        "fabric_agent_queries_cancelled_total",
+        "Warehouse queries cancelled before finishing, by alias and reason (timeout, disconnect, cancelled)",
+        ["alias", "reason"]
+    )
+    QUERIES_TRUNCATED_TOTAL = Counter(
+        "fabric_agent_queries_truncated_total",
+        "Warehouse query results cut off at their row or byte budget, by alias and limit (rows, bytes)",
+        ["alias", "limit"]
+    )
+    THREADS_DELETED_TOTAL = Counter(
+        "fabric_agent_threads_deleted_total",
+        "Background thread deletions, by outcome (deleted, not_found, failed)",
+        ["outcome"]
+    )
+    STEPS_CACHE_TOTAL = Counter(
+        "fabric_agent_steps_cache_total",
+        "Lookups in the cache of finished runs' steps, by result (hit, miss)",
+        ["result"]
+    )
+    SNAPSHOT_REFRESHES = Histogram(
+        "fabric_agent_snapshot_refresh_seconds",
+        "Scheduled query alias refreshes, by alias and outcome (published, failed)",
+        ["alias", "outcome"],
+        buckets=LATENCY_BUCKETS
+    )
+    SNAPSHOT_ROWS = Counter(
+        "fabric_agent_snapshot_rows_fetched_total",
+        "Rows fetched by scheduled query alias refreshes, by alias and mode (full, incremental)",
+        ["alias", "mode"]
+    )
+    THREAD_POOL_SPARES = Gauge(
+        "fabric_agent_thread_pool_spares",
+        "Ready-made unnamed threads waiting in the spare thread pool"
+    )
+    THREAD_POOL_REQUESTS_TOTAL = Counter(
+        "fabric_agent_thread_pool_requests_total",
+        "Unnamed threads requested from the spare thread pool, by result (hit, miss)",
+        ["result"]
+    )
+    THREAD_ROLLOVERS_TOTAL = Counter(
+        "fabric_agent_thread_rollovers_total",
+        "Named threads continued on a new thread after reaching the rollover limits"
+    )
+    QUESTIONS_ANSWERED_TOTAL = Counter(
+        "fabric_agent_questions_answered_total",
+        "Questions answered, by endpoint and path (exact or lexical match to a query alias, or agent)",
+        ["endpoint", "path"]
+    )
+
+    SNAPSHOT_TIMESTAMP = Gauge(
+        "fabric_agent_snapshot_timestamp_seconds",
+        "Unix time the served snapshot of a scheduled query alias was taken",
+        ["alias"]
+    )
+
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def configure_tracing(service_name="fabric-data-agent"):
+    """
+    Configure OpenTelemetry span export. Safe to call more than once.
+
+    Spans are exported over OTLP/HTTP when OTEL_EXPORTER_OTLP_ENDPOINT (or
+    OTEL_EXPORTER_OTLP_TRACES_ENDPOINT) is set, e.g. http://localhost:4318 for a
+    local collector. Without an endpoint, spans are only used for Server-Timing.
+
+    Args:
+        service_name (str): Value of the service.name resource attribute
+
+    Returns:
+        bool: True if spans are exported
+    """
+    global _tracer
+
+    if not OTEL_AVAILABLE:
+        return False
+    if _tracer is not None:
+        return True
+    if not (os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")):
+        return False
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError as e:
+        print(f"Warning: OTLP export requested but not available: {e}")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("fabric_data_agent")
+    print(f"Exporting spans over OTLP as service '{service_name}'")
+    return True
+
+
+def current_activity_id() -> str:
+    """
+    Return the ActivityId for the current request, or a fresh one outside a request.
+
+    Sending the same ActivityId on every Fabric call of a request lets Fabric-side
+    logs be joined with the spans recorded here.
+    """
+    activity_id = _current_activity_id.get()
+    return activity_id if activity_id is not None else str(uuid.uuid4())
+
+
+class RequestTelemetry:
+    """Per-request state: endpoint label, ActivityId, root span and stage timings."""
+
+    def __init__(self, endpoint, span_name):
+        self.endpoint = endpoint
+        self.activity_id = str(uuid.uuid4())
+        self.start = time.perf_counter()
+        self.timings = []
+        self.span = None
+        self._tokens = [
+            (_current_endpoint, _current_endpoint.set(endpoint)),
+            (_current_activity_id, _current_activity_id.set(self.activity_id)),
+            (_current_timings, _current_timings.set(self.timings)),
+        ]
+        self._otel_token = None
+        if _tracer is not None:
+            self.span = _tracer.start_span(span_name, attributes={
+                "fabric.activity_id": self.activity_id,
+                "http.route": endpoint
+            })
+            self._otel_token = otel_context.attach(trace.set_span_in_context(self.span))
+
+    def elapsed(self) -> float:
+        """Seconds since the request started."""
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """
+        Format the collected stage timings as a Server-Timing header value.
+
+        Returns:
+            str: e.g. 'thread_lookup;dur=182.4, runs_create;dur=311.0, total;dur=24510.7'
+        """
+        entries = [f"{name};dur={duration * 1000:.1f}" for name, duration in self.timings]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self, status_code=None, error=None):
+        """End the root span and restore the context that was active before the request."""
+        if self.span is not None:
+            if status_code is not None:
+                self.span.set_attribute("http.status_code", status_code)
+            if error is not None:
+                self.span.record_exception(error)
+                self.span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+            self.span.end()
+            self.span = None
+        if self._otel_token is not None:
+            otel_context.detach(self._otel_token)
+            self._otel_token = None
+        for var, token in reversed(self._tokens):
+            try:
+                var.reset(token)
+            except ValueError:
+                # Finished from a different context (e.g. after a streamed response)
+                pass
+        self._tokens = []
+
+
+def begin_request(endpoint, span_name=None) -> RequestTelemetry:
+    """
+    Start telemetry for a request or client call: endpoint label, ActivityId,
+    root span and Server-Timing collection.
+
+    Args:
+        endpoint (str): Endpoint label, e.g. '/run-details' or 'client.ask'
+        span_name (str, optional): Name of the root span, defaults to the endpoint
+
+    Returns:
+        RequestTelemetry: Call finish() on it when the request is done
+    """
+    return RequestTelemetry(endpoint, span_name or endpoint)
+
+
+def current_endpoint() -> str:
+    """Return the endpoint label for the current context."""
+    return _current_endpoint.get()
+
+
+def current_alias() -> str:
+    """Return the query alias label for the current context."""
+    return _current_alias.get()
+
+
+@contextmanager
+def labels(endpoint=None, alias=None):
+    """
+    Set the endpoint and/or alias labels used by stage() for the duration of the block.
+
+    Args:
+        endpoint (str, optional): Endpoint label, e.g. '/run-details' or 'client.ask'
+        alias (str, optional): Query alias label
+    """
+    endpoint_reset = _current_endpoint.set(endpoint) if endpoint is not None else None
+    alias_reset = _current_alias.set(alias) if alias is not None else None
+    try:
+        yield
+    finally:
+        if alias_reset is not None:
+            _current_alias.reset(alias_reset)
+        if endpoint_reset is not None:
+            _current_endpoint.reset(endpoint_reset)
+
+
+def instrument(endpoint):
+    """
+    Decorator that wraps a client call in begin_request()/finish(): every stage
+    recorded inside the call gets the endpoint label, the same ActivityId and a
+    common root span.
+
+    Args:
+        endpoint (str): Endpoint label, e.g. 'client.get_run_details'
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            request_telemetry = begin_request(endpoint)
+            error = None
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                request_telemetry.finish(error=error)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def stage(name, endpoint=None, alias=None):
+    """
+    Time a stage and record it in the stage latency histogram.
+
+    The status label is 'ok' when the block completes and 'error' when it raises;
+    exceptions are always re-raised.
+
+    Args:
+        name (str): Stage name, e.g. 'runs_create' or 'execute'
+        endpoint (str, optional): Endpoint label; defaults to the current context
+        alias (str, optional): Alias label; defaults to the current context
+    """
+    start = time.perf_counter()
+    status = "ok"
+    with _stage_span(name, endpoint, alias):
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            observe_stage(name, time.perf_counter() - start, status=status, endpoint=endpoint, alias=alias)
+
+
+def _stage_span(name, endpoint, alias):
+    """Return a context manager for the stage's OpenTelemetry span (a no-op when not exporting)."""
+    if _tracer is None:
+        return nullcontext()
+    attributes = {
+        "fabric.activity_id": current_activity_id(),
+        "fabric.endpoint": endpoint if endpoint is not None else _current_endpoint.get()
+    }
+    alias = alias if alias is not None else _current_alias.get()
+    if alias:
+        attributes["fabric.query_alias"] = alias
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def observe_stage(name, duration, status="ok", endpoint=None, alias=None):
+    """
+    Record a stage duration that was measured by the caller, both in the stage
+    histogram and in the current request's Server-Timing entries.
+
+    Args:
+        name (str): Stage name
+        duration (float): Duration in seconds
+        status (str): 'ok' or 'error'
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.append((name, duration))
+    if not PROMETHEUS_AVAILABLE:
+        return
+    STAGE_SECONDS.labels(
+        endpoint=endpoint if endpoint is not None else _current_endpoint.get(),
+        stage=name,
+        status=status,
+        alias=alias if alias is not None else _current_alias.get()
+    ).observe(duration)
+
+
+def record_polls(count, run_status, endpoint=None, alias=None):
+    """
+    Record how many runs.retrieve polls a run needed.
+
+    Args:
+        count (int): Number of polls made
+        run_status (str): Final run status (completed, failed, in_progress on timeout...)
+    """
+    if not PROMETHEUS_AVAILABLE:
+        return
+    label_values = {
+        "endpoint": endpoint if endpoint is not None else _current_endpoint.get(),
+        "status": run_status,
+        "alias": alias if alias is not None else _current_alias.get()
+    }
+    RUN_POLLS_TOTAL.labels(**label_values).inc(count)
+    RUN_POLLS_PER_RUN.labels(**label_values).observe(count)
+
+
+def record_coalesced(endpoint=None, alias=None):
+    """Record a request that shared another request's in-flight result."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    COALESCED_TOTAL.labels(
+        endpoint=endpoint if endpoint is not None else _current_endpoint.get(),
+        alias=alias if alias is not None else _current_alias.get()
+    ).inc()
+
+
+def record_admission(lane, outcome, wait):
+    """Record an admission decision and how long the request waited for it."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    ADMISSION_WAIT_SECONDS.labels(lane=lane, outcome=outcome).observe(wait)
+
+
+def set_admission_state(lane, in_flight, queue_depth):
+    """Publish the current in-flight count and queue depth of an admission lane."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    ADMISSION_IN_FLIGHT.labels(lane=lane).set(in_flight)
+    ADMISSION_QUEUE_DEPTH.labels(lane=lane).set(queue_depth)
+
+
+def record_retry(target, reason):
+    """Record a retried Fabric or warehouse call."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    RETRIES_TOTAL.labels(target=target, reason=reason).inc()
+
+
+def set_circuit_state(target, state):
+    """Publish a circuit breaker state change ('closed', 'half_open' or 'open')."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    CIRCUIT_STATE.labels(target=target).set(CIRCUIT_STATE_VALUES[state])
+
+
+def record_circuit_rejection(target):
+    """Record a call failed fast by an open circuit breaker."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    CIRCUIT_REJECTIONS_TOTAL.labels(target=target).inc()
+
+
+def record_query_cancelled(reason, alias=None):
+    """Record a warehouse query cancelled on timeout or by its cancellation token."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    QUERIES_CANCELLED_TOTAL.labels(alias=alias if alias is not None else _current_alias.get(), reason=reason).inc()
+
+
+def record_query_truncated(limit, alias=None):
+    """Record a warehouse query result cut off at its row or byte budget."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    QUERIES_TRUNCATED_TOTAL.labels(alias=alias if alias is not None else _current_alias.get(), limit=limit).inc()
+
+
+def record_run_cancelled(reason, endpoint=None):
+    """Record an agent run cancelled before it finished."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    RUNS_CANCELLED_TOTAL.labels(
+        endpoint=endpoint if endpoint is not None else _current_endpoint.get(),
+        reason=reason
+    ).inc()
+
+
+def record_thread_deleted(outcome):
+    """Record a background thread deletion."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    THREADS_DELETED_TOTAL.labels(outcome=outcome).inc()
+
+
+def record_steps_cache(result):
+    """Record a lookup in the run steps cache ('hit' or 'miss')."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    STEPS_CACHE_TOTAL.labels(result=result).inc()
+
+
+def record_snapshot_refresh(alias, outcome, duration):
+    """Record a scheduled refresh of a query alias snapshot."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    SNAPSHOT_REFRESHES.labels(alias=alias, outcome=outcome).observe(duration)
+
+
+def record_snapshot_rows(alias, mode, rows):
+    """Count the rows a full or incremental snapshot refresh fetched."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    SNAPSHOT_ROWS.labels(alias=alias, mode=mode).inc(rows)
+
+
+def record_thread_pool(hit, spares):
+    """Record a request for a spare thread ('hit' if one was ready) and the spares left."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    THREAD_POOL_REQUESTS_TOTAL.labels(result='hit' if hit else 'miss').inc()
+    THREAD_POOL_SPARES.set(spares)
+
+
+def set_thread_pool_size(spares):
+    """Publish how many spare threads are ready."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    THREAD_POOL_SPARES.set(spares)
+
+
+def record_thread_rollover():
+    """Record a named thread continued on a new thread."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    THREAD_ROLLOVERS_TOTAL.inc()
+
+
+def record_question_answered(path, endpoint=None):
+    """Record whether a question was routed to a query alias ('exact', 'lexical') or answered by the 'agent'."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    QUESTIONS_ANSWERED_TOTAL.labels(
+        endpoint=endpoint if endpoint is not None else _current_endpoint.get(),
+        path=path
+    ).inc()
+
+
+def set_snapshot_time(alias, timestamp):
+    """Publish when the current snapshot of a query alias was taken."""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    SNAPSHOT_TIMESTAMP.labels(alias=alias).set(timestamp)
+
+
+def record_request(endpoint, status, duration, alias=""):
+    """
+    Record a finished request.
+
+    Args:
+        endpoint (str): Endpoint label
+        status (int | str): HTTP status code
+        duration (float): Request duration in seconds
+        alias (str): Query alias label, empty for agent endpoints
+    """
+    if not PROMETHEUS_AVAILABLE:
+        return
+    REQUESTS_TOTAL.labels(endpoint=endpoint, status=str(status), alias=alias).inc()
+    REQUEST_SECONDS.labels(endpoint=endpoint, status=str(status), alias=alias).observe(duration)
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Returns:
+        tuple: (body, content_type), or (None, None) when prometheus_client is not installed
+    """
+    if not PROMETHEUS_AVAILABLE:
+        return None, None
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Background thread deletion and a stale-thread reaper
+
+ThreadCleaner moves threads.delete off the request path: deletions are
+queued and a daemon worker deletes them in batches, one OpenAI client (and
+token) per batch. It also tracks the unnamed external-client-thread-<uuid>
+threads this process creates and periodically reaps any that are older than
+THREAD_REAPER_MAX_AGE seconds and were never deleted (e.g. because the
+request failed). The Assistants API cannot list threads, so only threads
+this process created are known; set THREAD_REAPER_FILE to persist them
+across restarts. A thread whose deletion fails THREAD_CLEANUP_MAX_ATTEMPTS
+times is given up on and no longer tracked.
+
+Settings (environment variables): THREAD_CLEANUP_BATCH_SIZE,
+THREAD_CLEANUP_BATCH_WINDOW, THREAD_CLEANUP_MAX_ATTEMPTS,
+THREAD_REAPER_MAX_AGE, THREAD_REAPER_INTERVAL, THREAD_REAPER_FILE.
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import tempfile
+import threading
+
+import telemetry
+import recording
+import resilience
+
+BATCH_SIZE = int(os.getenv('THREAD_CLEANUP_BATCH_SIZE', '20'))
+BATCH_WINDOW = float(os.getenv('THREAD_CLEANUP_BATCH_WINDOW', '2'))
+MAX_ATTEMPTS = int(os.getenv('THREAD_CLEANUP_MAX_ATTEMPTS', '5'))
+REAPER_MAX_AGE = float(os.getenv('THREAD_REAPER_MAX_AGE', '3600'))
+REAPER_INTERVAL = float(os.getenv('THREAD_REAPER_INTERVAL', '300'))
+REAPER_FILE = os.getenv('THREAD_REAPER_FILE')
+
+
+class ThreadCleaner:
+    """
+    Deletes threads in the background and reaps stale unnamed threads.
+
+    Args:
+        client_factory (callable): Returns an OpenAI client for the data agent
+        state_file (str, optional): JSON file the tracked unnamed threads are persisted to
+    """
+
+    def __init__(self, client_factory, state_file=REAPER_FILE, max_age=REAPER_MAX_AGE,
+                 reap_interval=REAPER_INTERVAL):
+        self.client_factory = client_factory
+        self.state_file = state_file
+        self.max_age = max_age
+        self.reap_interval = reap_interval
+        self._queue = queue.Queue()
+        self._tracked = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        self._last_reap = time.time()
+        self._load_state()
+
+    def track(self, thread_id):
+        """Remember an unnamed thread this process created so the reaper can delete it."""
+        if recording.mode() == 'replay':
+            return
+        with self._lock:
+            self._tracked[thread_id] = time.time()
+            self._save_state()
+        self._ensure_worker()
+
+    def schedule_delete(self, thread_id):
+        """Queue a thread for deletion and return immediately."""
+        # Replayed threads do not exist on Fabric
+        if recording.mode() == 'replay':
+            return
+        self._queue.put(thread_id)
+        self._ensure_worker()
+
+    def flush(self, timeout=10):
+        """Wait for queued deletions to finish (used at exit)."""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.1)
+
+    def pending(self):
+        """Number of queued deletions and of tracked unnamed threads."""
+        with self._lock:
+            return {'queued': self._queue.qsize(), 'tracked': len(self._tracked)}
+
+    def reap(self):
+        """Queue deletion of tracked unnamed threads older than max_age."""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            stale = [thread_id for thread_id, created in self._tracked.items() if created < cutoff]
+        for thread_id in stale:
+            self._queue.put(thread_id)
+        self._last_reap = time.time()
+        if stale:
+            print(f"Reaping {len(stale)} stale unnamed threads")
+        return len(stale)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='thread-cleanup', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            timeout = max(0.0, self.reap_interval - (time.time() - self._last_reap))
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                self.reap()
+                continue
+
+            # Collect more deletions for up to BATCH_WINDOW seconds
+            deadline = time.time() + BATCH_WINDOW
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                self._delete_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _delete_batch(self, thread_ids):
+        try:
+            client = self.client_factory()
+        except Exception as e:
+            print(f"Thread cleanup skipped, no client available: {e}")
+            return
+        deleted = []
+        for thread_id in dict.fromkeys(thread_ids):
+            try:
+                resilience.call('threads.delete', client.beta.threads.delete, thread_id=thread_id)
+                deleted.append(thread_id)
+                telemetry.record_thread_deleted('deleted')
+            except Exception as e:
+                # A thread that is already gone will not come back; stop tracking it
+                if getattr(e, 'status_code', None) == 404:
+                    deleted.append(thread_id)
+                    telemetry.record_thread_deleted('not_found')
+                else:
+                    print(f"Warning: could not delete thread {thread_id}: {e}")
+                    telemetry.record_thread_deleted('failed')
+                    # Only a real attempt counts; an open circuit made none
+                    if not isinstance(e, resilience.CircuitOpenError) and self._record_failure(thread_id):
+                        deleted.append(thread_id)
+        with self._lock:
+            for thread_id in deleted:
+                self._tracked.pop(thread_id, None)
+                self._failures.pop(thread_id, None)
+            self._save_state()
+
+    def _record_failure(self, thread_id):
+        """Count a failed deletion of a tracked thread; True once it has failed MAX_ATTEMPTS times and is given up on."""
+        with self._lock:
+            # Untracked threads are not retried
+            if thread_id not in self._tracked:
+                return False
+            self._failures[thread_id] = self._failures.get(thread_id, 0) + 1
+            if self._failures[thread_id] < MAX_ATTEMPTS:
+                return False
+        print(f"Warning: giving up on deleting thread {thread_id} after {MAX_ATTEMPTS} attempts")
+        telemetry.record_thread_deleted('abandoned')
+        return True
+
+    def _load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file) as f:
+                self._tracked = {thread_id: float(created) for thread_id, created in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not load thread reaper state from {self.state_file}: {e}")
+            return
+        if self._tracked:
+            self._ensure_worker()
+
+    def _save_state(self):
+        """Persist tracked threads atomically. Caller holds the lock."""
+        if not self.state_file:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._tracked, f)
+        os.replace(temp_path, self.state_file)
+
+
+_cleaners = []
+
+
+def create(client_factory, **kwargs):
+    """Create a ThreadCleaner whose queued deletions are flushed at interpreter exit."""
+    cleaner = ThreadCleaner(client_factory, **kwargs)
+    _cleaners.append(cleaner)
+    return cleaner
+
+
+@atexit.register
+def _flush_all():
+    for cleaner in _cleaners:
+        cleaner.flush()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Pool of ready-made unnamed threads
+
+Every question without a thread_name needs a new external-client-thread-<uuid>
+thread, and creating one is a threads/fabric lookup round trip before the
+question can even be posted. SpareThreadPool creates those threads ahead of
+time on a background worker, so an unnamed question takes one instantly and
+only falls back to creating its own when the pool is empty.
+
+The pool's target size follows demand: enough threads to cover the requests
+expected while replacements are created (the take rate over the last
+THREAD_POOL_RATE_WINDOW seconds times twice the average creation time), at
+least THREAD_POOL_MIN_SIZE and at most THREAD_POOL_MAX_SIZE. Threads are
+handed out at most once. Pooled threads are tracked by the thread reaper
+like any unnamed thread, so spares older than THREAD_POOL_MAX_AGE (which
+must stay below THREAD_REAPER_MAX_AGE) are deleted instead of handed out.
+
+Settings (environment variables): THREAD_POOL, THREAD_POOL_MIN_SIZE,
+THREAD_POOL_MAX_SIZE, THREAD_POOL_RATE_WINDOW, THREAD_POOL_MAX_AGE.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import deque
+
+import telemetry
+import thread_cleanup
+
+ENABLED = os.getenv('THREAD_POOL', 'true').lower() in ('1', 'true', 'yes')
+MIN_SIZE = int(os.getenv('THREAD_POOL_MIN_SIZE', '2'))
+MAX_SIZE = int(os.getenv('THREAD_POOL_MAX_SIZE', '16'))
+RATE_WINDOW = float(os.getenv('THREAD_POOL_RATE_WINDOW', '60'))
+MAX_AGE = float(os.getenv('THREAD_POOL_MAX_AGE', str(min(1800.0, thread_cleanup.REAPER_MAX_AGE / 2))))
+
+# Seconds between checks for stale spares, and before retrying after a failed creation
+CHECK_INTERVAL = 5.0
+RETRY_DELAY = 30.0
+
+
+class SpareThreadPool:
+    """
+    Creates unnamed threads in the background and hands each out once.
+
+    Args:
+        create (callable): Creates and returns a new unnamed thread (a dict with 'id')
+        discard (callable): Deletes a thread id that will not be handed out
+    """
+
+    def __init__(self, create, discard, min_size=MIN_SIZE, max_size=MAX_SIZE,
+                 rate_window=RATE_WINDOW, max_age=MAX_AGE):
+        self.create = create
+        self.discard = discard
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.rate_window = rate_window
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._spares = deque()
+        self._takes = deque()
+        self._create_seconds = None
+        self._retry_at = 0.0
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def take(self):
+        """A ready-made thread, or None if the pool is empty (the caller creates one)."""
+        now = time.monotonic()
+        with self._condition:
+            self._takes.append(now)
+            thread = None
+            while self._spares:
+                created, candidate = self._spares.popleft()
+                if now - created < self.max_age:
+                    thread = candidate
+                    break
+                self.discard(candidate['id'])
+            if thread is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            telemetry.record_thread_pool(thread is not None, len(self._spares))
+            self._condition.notify()
+        self._ensure_worker()
+        return thread
+
+    def target_size(self):
+        """Spares to keep: the expected takes while replacements are created, within min/max size."""
+        with self._condition:
+            return self._target_size(time.monotonic())
+
+    def _target_size(self, now):
+        while self._takes and now - self._takes[0] > self.rate_window:
+            self._takes.popleft()
+        if self._create_seconds is None:
+            return self.min_size
+        rate = len(self._takes) / self.rate_window
+        wanted = math.ceil(rate * self._create_seconds * 2)
+        return max(self.min_size, min(self.max_size, wanted))
+
+    def _ensure_worker(self):
+        with self._condition:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='thread-pool', daemon=True)
+                self._worker.start()
+
+    def _evict_stale(self, now):
+        while self._spares and now - self._spares[0][0] >= self.max_age:
+            _, thread = self._spares.popleft()
+            self.discard(thread['id'])
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                self._evict_stale(now)
+                if now < self._retry_at or len(self._spares) >= self._target_size(now):
+                    delay = self._retry_at - now if now < self._retry_at else CHECK_INTERVAL
+                    self._condition.wait(min(delay, CHECK_INTERVAL))
+                    continue
+
+            started = time.monotonic()
+            try:
+                thread = self.create()
+            except Exception as e:
+                # e.g. not authenticated yet, or the Fabric circuit is open
+                with self._condition:
+                    self.failures += 1
+                    self._retry_at = time.monotonic() + RETRY_DELAY
+                print(f"Warning: could not create a spare thread, retrying in {RETRY_DELAY:.0f}s: {e}")
+                continue
+
+            elapsed = time.monotonic() - started
+            with self._condition:
+                # Average creation time, weighted towards recent creations
+                self._create_seconds = elapsed if self._create_seconds is None else 0.8 * self._create_seconds + 0.2 * elapsed
+                self._spares.append((time.monotonic(), thread))
+                telemetry.set_thread_pool_size(len(self._spares))
+
+    def drain(self):
+        """Delete every spare (used at exit)."""
+        with self._condition:
+            spares = list(self._spares)
+            self._spares.clear()
+        for _, thread in spares:
+            self.discard(thread['id'])
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                'enabled': ENABLED,
+                'spares': len(self._spares),
+                'target': self._target_size(time.monotonic()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'failures': self.failures,
+                'avg_create_seconds': round(self._create_seconds, 3) if self._create_seconds is not None else None
+            }
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Rollover of long named threads
+
+A named thread (thread_name) is one Fabric thread tagged with that name, and
+it keeps every question and answer ever asked on it; the agent's latency and
+token use grow with it. ThreadRollover keeps a mapping from each logical
+thread name to the thread currently serving it:
+
+- every answered question adds two messages and their characters to the
+  current thread's counts;
+- once the thread has THREAD_ROLLOVER_MAX_MESSAGES messages or
+  THREAD_ROLLOVER_MAX_CHARS characters, the next lookup of the name moves
+  to a new thread tagged <name>~<generation>;
+- the new thread is seeded with one message carrying the last
+  THREAD_ROLLOVER_KEEP_EXCHANGES questions and answers (each cut to
+  EXCHANGE_CHARS characters), so follow-up questions keep their context.
+
+Generation 0 is the thread tagged with the name itself. The first time a
+name is resolved, the messages already on its thread are listed and counted,
+so a named thread that was long before rollover was enabled rolls over on
+its next question. The previous threads are left as they are.
+
+Rollover is off unless THREAD_ROLLOVER_FILE names the JSON file the mapping
+is kept in. Every change re-reads and rewrites it while holding an exclusive
+lock on <file>.lock, so the Flask app and the client can share it (the
+cross-process lock needs fcntl, i.e. not Windows).
+
+Settings (environment variables): THREAD_ROLLOVER_FILE,
+THREAD_ROLLOVER_MAX_MESSAGES, THREAD_ROLLOVER_MAX_CHARS,
+THREAD_ROLLOVER_KEEP_EXCHANGES.
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: the mapping is only locked within one process
+    fcntl = None
+
+import telemetry
+import resilience
+
+STATE_FILE = os.getenv('THREAD_ROLLOVER_FILE')
+ENABLED = bool(STATE_FILE)
+MAX_MESSAGES = int(os.getenv('THREAD_ROLLOVER_MAX_MESSAGES', '40'))
+MAX_CHARS = int(os.getenv('THREAD_ROLLOVER_MAX_CHARS', '40000'))
+KEEP_EXCHANGES = int(os.getenv('THREAD_ROLLOVER_KEEP_EXCHANGES', '3'))
+
+# Characters kept of each question and answer carried into the next thread
+EXCHANGE_CHARS = 1000
+
+# Tags of previous threads remembered per name
+MAX_PREVIOUS = 10
+
+# Messages listed per call when counting an existing thread
+COUNT_PAGE_SIZE = 100
+
+SEED_HEADER = (
+    "This conversation continues an earlier one. "
+    "Its most recent questions and answers were:"
+)
+
+
+def thread_tag(name, generation):
+    """The tag of a logical thread's thread of a generation; '~' needs no escaping in the lookup URL."""
+    return name if generation == 0 else f"{name}~{generation}"
+
+
+def _clip(text):
+    text = ' '.join(str(text).split())
+    return text if len(text) <= EXCHANGE_CHARS else text[:EXCHANGE_CHARS - 3] + '...'
+
+
+def _message_text(message):
+    parts = []
+    for content in getattr(message, 'content', None) or []:
+        text = getattr(content, 'text', None)
+        parts.append(getattr(text, 'value', None) or '')
+    return '\n'.join(parts)
+
+
+def count_messages(client, thread_id, keep_exchanges=KEEP_EXCHANGES):
+    """
+    What is already on a thread, listing it page by page.
+
+    Returns:
+        tuple: (messages, characters, the last keep_exchanges questions and answers)
+    """
+    messages = chars = 0
+    recent = deque(maxlen=max(keep_exchanges, 0))
+    question = None
+    after = None
+    while True:
+        params = {'thread_id': thread_id, 'order': 'asc', 'limit': COUNT_PAGE_SIZE}
+        if after is not None:
+            params['after'] = after
+        page = resilience.call('messages.list', client.beta.threads.messages.list, **params)
+        for message in page.data:
+            text = _message_text(message)
+            messages += 1
+            chars += len(text)
+            if message.role == 'user':
+                question = text
+            elif question is not None:
+                recent.append({'question': _clip(question), 'answer': _clip(text)})
+                question = None
+        if not page.data or not getattr(page, 'has_more', False):
+            return messages, chars, list(recent)
+        after = page.data[-1].id
+
+
+def seed_text(exchanges):
+    """The first message of a new thread: the carried questions and answers, oldest first."""
+    lines = [SEED_HEADER]
+    for exchange in exchanges:
+        lines.append(f"\nQ: {exchange['question']}\nA: {exchange['answer']}")
+    return '\n'.join(lines)
+
+
+class ThreadRollover:
+    """
+    Maps logical thread names to the current thread and rolls them over when they grow too long.
+
+    Args:
+        state_file (str, optional): JSON file the mapping is persisted to
+    """
+
+    def __init__(self, state_file=STATE_FILE, max_messages=MAX_MESSAGES, max_chars=MAX_CHARS,
+                 keep_exchanges=KEEP_EXCHANGES):
+        self.state_file = state_file
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.keep_exchanges = keep_exchanges
+        self.rollovers = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._load_state()
+
+    def _entry(self, name):
+        return self._threads.setdefault(name, {
+            'generation': 0,
+            'messages': 0,
+            'chars': 0,
+            'recent': [],
+            'previous': []
+        })
+
+    def tracked(self, name):
+        """True once a name has counts (its existing thread was counted or it was rolled over)."""
+        with self._locked():
+            return name in self._threads
+
+    def adopt(self, name, messages, chars, recent=None):
+        """Start counting a name from the messages, characters and exchanges already on its thread."""
+        with self._locked():
+            if name in self._threads:
+                return
+            entry = self._entry(name)
+            entry['messages'] = messages
+            entry['chars'] = chars
+            entry['recent'] = list(recent or [])[-self.keep_exchanges:] if self.keep_exchanges > 0 else []
+            self._save_state()
+
+    def _full(self, entry):
+        return entry['messages'] >= self.max_messages or entry['chars'] >= self.max_chars
+
+    def current(self, name):
+        """
+        The tag of the thread a logical name resolves to, rolling over to a new thread if the current one is full.
+
+        Returns:
+            tuple: (tag, seed) where seed is the text to post first on a new thread, or None
+        """
+        with self._locked():
+            entry = self._threads.get(name)
+            if entry is None or not self._full(entry):
+                return thread_tag(name, entry['generation'] if entry else 0), None
+
+            entry['previous'] = (entry['previous'] + [thread_tag(name, entry['generation'])])[-MAX_PREVIOUS:]
+            entry['generation'] += 1
+            seed = seed_text(entry['recent']) if self.keep_exchanges > 0 and entry['recent'] else None
+            entry['messages'] = 1 if seed else 0
+            entry['chars'] = len(seed) if seed else 0
+            entry['rolled_over_at'] = time.time()
+            self.rollovers += 1
+            self._save_state()
+            tag = thread_tag(name, entry['generation'])
+
+        print(f"Thread '{name}' is full, continuing on a new thread tagged '{tag}'")
+        telemetry.record_thread_rollover()
+        return tag, seed
+
+    def record(self, name, tag, question, answer):
+        """
+        Count an answered question on the thread tagged tag and keep it to seed the next thread.
+        Counts only apply while tag is still the name's current thread.
+        """
+        with self._locked():
+            entry = self._entry(name)
+            if tag == thread_tag(name, entry['generation']):
+                entry['messages'] += 2
+                entry['chars'] += len(question) + len(answer)
+            if self.keep_exchanges > 0:
+                exchange = {'question': _clip(question), 'answer': _clip(answer)}
+                entry['recent'] = (entry['recent'] + [exchange])[-self.keep_exchanges:]
+            self._save_state()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'enabled': ENABLED,
+                'max_messages': self.max_messages,
+                'max_chars': self.max_chars,
+                'threads': {
+                    name: {
+                        'tag': thread_tag(name, entry['generation']),
+                        'messages': entry['messages'],
+                        'chars': entry['chars']
+                    }
+                    for name, entry in self._threads.items()
+                },
+                'rollovers': self.rollovers
+            }
+
+    @contextmanager
+    def _locked(self):
+        """Hold the mapping for a read-modify-write, across threads and processes, re-reading it first."""
+        with self._lock:
+            if not self.state_file or fcntl is None:
+                self._load_state()
+                yield
+                return
+            with open(self.state_file + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._load_state()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_state(self):
+        """Re-read the mapping, which another process may have changed. Caller holds _locked() (or is __init__)."""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file) as f:
+                self._threads = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not load thread rollover state from {self.state_file}: {e}")
+
+    def resolve(self, name, lookup, client_factory):
+        """
+        The thread a logical name currently resolves to, rolling over to a seeded new thread if it is full.
+
+        Args:
+            name (str): The logical thread name
+            lookup (callable): Gets or creates the thread with a tag, returning a dict with 'id'
+            client_factory (callable): Returns an OpenAI client for the data agent
+
+        Returns:
+            dict: The thread, with 'name' set to the logical name and 'tag' to its tag
+        """
+        tag, seed = self.current(name)
+        thread = lookup(tag)
+        if seed is None and not self.tracked(name):
+            try:
+                self.adopt(name, *count_messages(client_factory(), thread['id'], self.keep_exchanges))
+            except Exception as e:
+                print(f"Warning: could not count the messages of thread '{tag}': {e}")
+            else:
+                # A thread that was already long rolls over before this question
+                new_tag, seed = self.current(name)
+                if new_tag != tag:
+                    tag = new_tag
+                    thread = lookup(tag)
+
+        if seed:
+            try:
+                resilience.call(
+                    'messages.create',
+                    client_factory().beta.threads.messages.create,
+                    thread_id=thread['id'],
+                    role="user",
+                    content=seed,
+                    idempotent=False
+                )
+            except Exception as e:
+                # The new thread still works, only without the earlier context
+                print(f"Warning: could not seed thread '{tag}': {e}")
+        thread["name"] = name
+        thread["tag"] = tag
+        return thread
+
+    def _save_state(self):
+        """Persist the mapping atomically. Caller holds _locked()."""
+        if not self.state_file:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._threads, f, indent=2)
+        os.replace(temp_path, self.state_file)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for SQL and data extraction over a run-step corpus
+
+Times the extraction functions in flask_app.py and their _extract_* twins in
+FabricDataAgentClient over small, typical and 10 MB semantic-model payloads
+(plus any recorded payloads in --corpus-dir), and reports time and peak
+memory per function and payload. Compare against a saved baseline to catch
+regressions.
+
+Usage (from the repository root):
+
+    PYTHONPATH=app python benchmarks/extraction_benchmark.py
+    PYTHONPATH=app python benchmarks/extraction_benchmark.py --sizes small typical --json-out baseline.json
+    PYTHONPATH=app python benchmarks/extraction_benchmark.py --baseline baseline.json --max-regression 0.25
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+
+import step_corpus
+
+
+def to_steps_page(steps_dump):
+    """Rebuild the runs.steps.list() page object from its model_dump()."""
+    from openai.pagination import SyncCursorPage
+    from openai.types.beta.threads.runs import RunStep
+    return SyncCursorPage[RunStep].model_validate(steps_dump)
+
+
+def tool_text(entry):
+    """Concatenated tool arguments and outputs, the text find_sql_in_text and extract_data_preview scan."""
+    parts = []
+    for step in entry['steps'].get('data', []):
+        for call in (step.get('step_details') or {}).get('tool_calls') or []:
+            function = call.get('function') or {}
+            parts.append(function.get('arguments') or '')
+            parts.append(function.get('output') or '')
+    return '\n'.join(parts)
+
+
+def last_tool_output(entry):
+    """Output of the last tool call (the semantic model table for Fabric runs)."""
+    output = ''
+    for step in entry['steps'].get('data', []):
+        for call in (step.get('step_details') or {}).get('tool_calls') or []:
+            output = (call.get('function') or {}).get('output') or output
+    return output
+
+
+def benchmark_targets():
+    """
+    Return (name, callable, input kind) for every function under test.
+
+    Input kinds: 'steps' (page object), 'tool_text', 'tool_output', 'assistant_text'.
+    """
+    import flask_app
+    from fabric_data_agent_client import FabricDataAgentClient
+
+    # Extraction methods do not use authentication state, so skip __init__
+    client = FabricDataAgentClient.__new__(FabricDataAgentClient)
+
+    return [
+        ('extract_sql_queries_with_data', flask_app.extract_sql_queries_with_data, 'steps'),
+        ('client._extract_sql_queries_with_data', client._extract_sql_queries_with_data, 'steps'),
+        ('extract_sql_queries', flask_app.extract_sql_queries, 'steps'),
+        ('client._extract_sql_queries', client._extract_sql_queries, 'steps'),
+        ('find_sql_in_text', flask_app.find_sql_in_text, 'tool_text'),
+        ('client._find_sql_in_text', client._find_sql_in_text, 'tool_text'),
+        ('extract_data_preview', flask_app.extract_data_preview, 'tool_output'),
+        ('client._extract_data_preview', client._extract_data_preview, 'tool_output'),
+        ('extract_markdown_table', flask_app.extract_markdown_table, 'assistant_text'),
+        ('client._extract_markdown_table', client._extract_markdown_table, 'assistant_text'),
+        ('extract_data_from_text_response', flask_app.extract_data_from_text_response, 'assistant_text'),
+        ('client._extract_data_from_text_response', client._extract_data_from_text_response, 'assistant_text'),
+    ]
+
+
+def prepare_inputs(entry):
+    """Build every input kind for a corpus entry once, outside the timed region."""
+    return {
+        'steps': to_steps_page(entry['steps']),
+        'tool_text': tool_text(entry),
+        'tool_output': last_tool_output(entry),
+        'assistant_text': entry.get('assistant_text', ''),
+    }
+
+
+def time_call(func, argument, min_time, max_repeats):
+    """
+    Time func(argument), repeating until min_time has elapsed or max_repeats calls were made.
+
+    Returns:
+        tuple: (median seconds, min seconds, repeats)
+    """
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < max_repeats:
+        start = time.perf_counter()
+        func(argument)
+        durations.append(time.perf_counter() - start)
+        if time.perf_counter() - started >= min_time and len(durations) >= 3:
+            break
+    return statistics.median(durations), min(durations), len(durations)
+
+
+def peak_memory(func, argument):
+    """Peak bytes allocated by one call of func(argument), measured with tracemalloc."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_benchmarks(entries, functions, min_time, max_repeats):
+    """Benchmark each selected function over each corpus entry."""
+    results = []
+    targets = [target for target in benchmark_targets() if not functions or target[0] in functions]
+    for entry in entries:
+        inputs = prepare_inputs(entry)
+        for name, func, kind in targets:
+            argument = inputs[kind]
+            median, best, repeats = time_call(func, argument, min_time, max_repeats)
+            results.append({
+                'function': name,
+                'payload': entry['name'],
+                'input_bytes': len(argument) if isinstance(argument, str) else len(json.dumps(entry['steps'])),
+                'median_ms': median * 1000,
+                'min_ms': best * 1000,
+                'repeats': repeats,
+                'peak_memory_kb': peak_memory(func, argument) / 1024,
+            })
+            print(f"  {entry['name']:<22} {name:<42} {median * 1000:>10.3f} ms  {results[-1]['peak_memory_kb']:>10.1f} KiB")
+    return results
+
+
+def compare_to_baseline(results, baseline, max_regression):
+    """
+    Compare median times and peak memory against a baseline run.
+
+    Returns:
+        list: Human-readable regression descriptions
+    """
+    previous = {(row['function'], row['payload']): row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get((row['function'], row['payload']))
+        if before is None:
+            continue
+        for metric in ('median_ms', 'peak_memory_kb'):
+            # Ignore sub-millisecond / sub-KiB noise
+            if before[metric] > 1 and row[metric] > before[metric] * (1 + max_regression):
+                regressions.append(
+                    f"{row['function']} on {row['payload']}: {metric} {before[metric]:.2f} -> {row[metric]:.2f}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction micro-benchmarks over a run-step corpus")
+    parser.add_argument('--sizes', nargs='*', choices=list(step_corpus.SIZES), default=None,
+                        help='Synthetic payload sizes to include (default: all)')
+    parser.add_argument('--corpus-dir', default='benchmarks/corpus', help='Directory of recorded, anonymized payloads')
+    parser.add_argument('--functions', nargs='*', default=None, help='Only benchmark these functions')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Minimum seconds spent timing each function/payload')
+    parser.add_argument('--max-repeats', type=int, default=200)
+    parser.add_argument('--json-out', default=None, help='Write results to this file (use as a future baseline)')
+    parser.add_argument('--baseline', default=None, help='Results file from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25, help='Allowed slowdown/memory growth as a fraction')
+    args = parser.parse_args()
+
+    entries = step_corpus.synthetic_corpus(args.sizes) + step_corpus.load_recorded(args.corpus_dir)
+    print(f"Benchmarking {len(entries)} payloads: {', '.join(entry['name'] for entry in entries)}")
+    results = run_benchmarks(entries, args.functions, args.min_time, args.max_repeats)
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json_out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.max_regression:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
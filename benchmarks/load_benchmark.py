@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark for the Flask app and FabricDataAgentClient
+
+Drives /ask, /run-details or FabricDataAgentClient at a fixed concurrency and
+reports throughput and p50/p95/p99 latency. Intended to run against
+mock_fabric_server.py so no Fabric capacity is used.
+
+Usage (from the repository root):
+
+    # Everything in-process: mock Fabric server + Flask app + load
+    PYTHONPATH=app python benchmarks/load_benchmark.py --spawn --target run-details --concurrency 8 --requests 64
+
+    # Against an already running Flask app
+    PYTHONPATH=app python benchmarks/load_benchmark.py --target ask --base-url http://localhost:5000 --concurrency 4 --duration 60
+
+    # FabricDataAgentClient directly against a running mock
+    PYTHONPATH=app FABRIC_STATIC_TOKEN=mock-token \\
+        DATA_AGENT_URL=http://localhost:8089/v1/workspaces/mock-workspace/dataagents/mock-agent/aiassistant/openai \\
+        python benchmarks/load_benchmark.py --target client --client-method get_run_details --concurrency 4 --requests 16
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+import contextlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_QUESTIONS = [
+    "Show all contact opportunities created between August 1, 2024 and today that were converted to transactions, grouped by contact lead sources.",
+    "What tables are available?",
+    "Which lead sources converted the most opportunities last quarter?",
+    "Show the top 10 clients by number of transactions.",
+]
+
+
+def percentile(sorted_values, pct):
+    """Percentile with linear interpolation over an already sorted list."""
+    if not sorted_values:
+        return None
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def free_port():
+    """Return a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_background(flask_app, port):
+    """Serve a Flask app on a daemon thread with a threaded WSGI server."""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def spawn_stack(mock_overrides):
+    """
+    Start the mock Fabric server and the Flask app in this process.
+
+    Returns:
+        tuple: (flask base URL, data agent URL)
+    """
+    import mock_fabric_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    mock_fabric_server.config.update(mock_overrides)
+    mock_port = free_port()
+    serve_in_background(mock_fabric_server.app, mock_port)
+    data_agent_url = f"http://127.0.0.1:{mock_port}/v1/workspaces/mock-workspace/dataagents/mock-agent/aiassistant/openai"
+
+    os.environ.setdefault('TENANT_ID', 'mock-tenant')
+    os.environ['DATA_AGENT_URL'] = data_agent_url
+    os.environ.setdefault('FABRIC_STATIC_TOKEN', 'mock-token')
+
+    # Imported after the environment is set: flask_app reads FABRIC_STATIC_TOKEN at import
+    with contextlib.redirect_stdout(io.StringIO()):
+        import flask_app
+    flask_port = free_port()
+    serve_in_background(flask_app.app, flask_port)
+    return f"http://127.0.0.1:{flask_port}", data_agent_url
+
+
+def make_http_call(base_url, endpoint, thread_name, timeout):
+    """Return a callable that posts one question to a Flask endpoint."""
+    session_local = threading.local()
+
+    def call(question):
+        if not hasattr(session_local, 'session'):
+            session_local.session = requests.Session()
+        body = {'question': question}
+        if thread_name:
+            body['thread_name'] = thread_name
+        response = session_local.session.post(f"{base_url}{endpoint}", json=body, timeout=timeout)
+        if response.status_code != 200:
+            return f"http_{response.status_code}"
+        return None if response.json().get('success') else "unsuccessful"
+
+    return call
+
+
+def make_client_call(method, thread_name):
+    """Return a callable that asks one question through FabricDataAgentClient."""
+    from fabric_data_agent_client import FabricDataAgentClient
+    from mock_fabric_server import StaticTokenCredential
+
+    credential = None
+    if os.getenv('FABRIC_STATIC_TOKEN'):
+        credential = StaticTokenCredential(os.getenv('FABRIC_STATIC_TOKEN'))
+    client = FabricDataAgentClient(
+        tenant_id=os.getenv('TENANT_ID', 'mock-tenant'),
+        data_agent_url=os.environ['DATA_AGENT_URL'],
+        credential=credential
+    )
+    client_method = getattr(client, method)
+
+    def call(question):
+        result = client_method(question, thread_name=thread_name)
+        if isinstance(result, dict) and result.get('error'):
+            return "client_error"
+        if isinstance(result, str) and result.startswith("Error:"):
+            return "client_error"
+        return None
+
+    return call
+
+
+def run_load(call, questions, concurrency, total_requests, duration):
+    """
+    Run calls at a fixed concurrency until total_requests are done or duration expires.
+
+    Returns:
+        tuple: (latencies of successful calls, Counter of error kinds, wall time)
+    """
+    latencies = []
+    errors = Counter()
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_index():
+        with lock:
+            if total_requests is not None and issued[0] >= total_requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            issued[0] += 1
+            return issued[0] - 1
+
+    def worker():
+        while True:
+            index = next_index()
+            if index is None:
+                return
+            question = questions[index % len(questions)]
+            start = time.perf_counter()
+            try:
+                error = call(question)
+            except Exception as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if error:
+                    errors[error] += 1
+                else:
+                    latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(label, concurrency, latencies, errors, wall_time):
+    """Build the report dictionary."""
+    ordered = sorted(latencies)
+    completed = len(latencies) + sum(errors.values())
+    return {
+        'target': label,
+        'concurrency': concurrency,
+        'requests': completed,
+        'successes': len(latencies),
+        'errors': dict(errors),
+        'wall_time_s': round(wall_time, 3),
+        'throughput_rps': round(len(latencies) / wall_time, 3) if wall_time else 0.0,
+        'latency_s': {
+            'min': ordered[0] if ordered else None,
+            'mean': sum(ordered) / len(ordered) if ordered else None,
+            'p50': percentile(ordered, 50),
+            'p95': percentile(ordered, 95),
+            'p99': percentile(ordered, 99),
+            'max': ordered[-1] if ordered else None,
+        }
+    }
+
+
+def print_report(report):
+    """Print the report as a small table."""
+    print(f"\nTarget: {report['target']}   concurrency: {report['concurrency']}")
+    print(f"Requests: {report['requests']}   ok: {report['successes']}   errors: {report['errors'] or 0}")
+    print(f"Wall time: {report['wall_time_s']:.2f}s   throughput: {report['throughput_rps']:.2f} req/s")
+    print("Latency (s):")
+    for key, value in report['latency_s'].items():
+        print(f"  {key:>4}: {value:.3f}" if value is not None else f"  {key:>4}: -")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for /ask, /run-details and FabricDataAgentClient")
+    parser.add_argument('--target', choices=['ask', 'run-details', 'client'], default='run-details')
+    parser.add_argument('--base-url', default='http://localhost:5000', help='Flask app URL (ignored with --spawn)')
+    parser.add_argument('--client-method', choices=['ask', 'get_run_details', 'get_raw_run_response'], default='get_run_details')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=None, help='Total requests (default: 8 x concurrency)')
+    parser.add_argument('--duration', type=float, default=None, help='Run for this many seconds instead of a fixed count')
+    parser.add_argument('--thread-name', default=None, help='Send every question to this named thread')
+    parser.add_argument('--questions-file', default=None, help='JSON list of questions')
+    parser.add_argument('--timeout', type=float, default=300, help='Per-request HTTP timeout in seconds')
+    parser.add_argument('--spawn', action='store_true', help='Start the mock Fabric server and Flask app in-process')
+    parser.add_argument('--mock-config', default='{}', help='JSON overrides for the spawned mock, e.g. \'{"run_latency": 2}\'')
+    parser.add_argument('--json-out', default=None, help='Also write the report to this file')
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions_file:
+        with open(args.questions_file) as f:
+            questions = json.load(f)
+
+    total_requests = args.requests
+    if total_requests is None and args.duration is None:
+        total_requests = args.concurrency * 8
+
+    base_url = args.base_url
+    if args.spawn:
+        base_url, _ = spawn_stack(json.loads(args.mock_config))
+        print(f"Spawned mock Fabric server and Flask app at {base_url}")
+
+    if args.target == 'client':
+        # The client prints progress for every poll; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            call = make_client_call(args.client_method, args.thread_name)
+            latencies, errors, wall_time = run_load(call, questions, args.concurrency, total_requests, args.duration)
+        label = f"FabricDataAgentClient.{args.client_method}"
+    else:
+        endpoint = f"/{args.target}"
+        call = make_http_call(base_url, endpoint, args.thread_name, args.timeout)
+        latencies, errors, wall_time = run_load(call, questions, args.concurrency, total_requests, args.duration)
+        label = f"POST {endpoint}"
+
+    report = summarize(label, args.concurrency, latencies, errors, wall_time)
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['successes'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
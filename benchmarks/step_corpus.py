@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Run-step corpus for the extraction benchmarks
+
+Builds synthetic run-step payloads in the shape returned by
+runs.steps.list(...).model_dump() (small, typical, and a 10 MB semantic
+model output), loads recorded payloads from a directory, and anonymizes
+recorded payloads before they are added to the corpus.
+
+A corpus entry is a dict:
+    {"name": str, "steps": {"data": [...]}, "assistant_text": str}
+
+Usage:
+    python benchmarks/step_corpus.py anonymize recorded_steps.json benchmarks/corpus/recorded_case.json
+"""
+
+import os
+import re
+import sys
+import json
+import random
+import hashlib
+
+SIZES = {
+    'small': 2_000,
+    'typical': 50_000,
+    'semantic_model_10mb': 10_000_000,
+}
+
+LEAD_SOURCES = ['Zillow', 'Referral', 'Open House', 'Website', 'Past Client', 'Sign Call', 'Facebook', 'Realtor.com']
+
+SAMPLE_SQL = (
+    ";WITH CTE_Opportunity AS (SELECT crm_contact_user_key, crm_contact_key, crm_contact_opportunity_key "
+    "FROM [dbo].[FactCRMContactOpportunity] WHERE crm_contact_opportunity_created_at >= '08/01/2024' "
+    "AND crm_contact_opportunity_created_at < GETDATE()) "
+    "SELECT t_dcc.crm_contact_lead_source, COUNT(*) AS count FROM CTE_Opportunity t_co "
+    "JOIN [dbo].[FactCRMOpportunityTransaction] t_ot ON t_ot.crm_contact_opportunity_key = t_co.crm_contact_opportunity_key "
+    "JOIN dbo.DimCRMContact t_dcc ON t_co.crm_contact_key = t_dcc.crm_contact_key "
+    "GROUP BY t_dcc.crm_contact_lead_source ORDER BY COUNT(*) DESC"
+)
+
+
+def markdown_table(target_bytes, rng):
+    """Build a semantic-model style markdown table (bracketed headers) of roughly target_bytes."""
+    lines = [
+        '| [crm_contact_first_name] | [crm_contact_last_name] | [client_name] | [crm_contact_lead_source] | [count] |',
+        '|---|---|---|---|---|'
+    ]
+    size = sum(len(line) + 1 for line in lines)
+    row = 0
+    while size < target_bytes:
+        line = (
+            f'| First{row} | Last{row % 997} | Client {row % 311} | '
+            f'{LEAD_SOURCES[row % len(LEAD_SOURCES)]} | {rng.randint(1, 900)} |'
+        )
+        lines.append(line)
+        size += len(line) + 1
+        row += 1
+    return '\n'.join(lines)
+
+
+def tool_call(name, arguments, output, index):
+    """Build a function tool call in the Fabric run-step shape."""
+    return {
+        'id': f'call_{index:06d}',
+        'type': 'function',
+        'function': {'name': name, 'arguments': json.dumps(arguments), 'output': output}
+    }
+
+
+def run_step(index, tool_calls):
+    """Build a completed tool_calls run step."""
+    return {
+        'id': f'step_{index:06d}',
+        'object': 'thread.run.step',
+        'created_at': 1760000000 + index,
+        'completed_at': 1760000001 + index,
+        'run_id': 'run_benchmark',
+        'assistant_id': 'asst_benchmark',
+        'thread_id': 'thread_benchmark',
+        'type': 'tool_calls',
+        'status': 'completed',
+        'step_details': {'type': 'tool_calls', 'tool_calls': tool_calls}
+    }
+
+
+def synthetic_entry(name, target_bytes, seed=42):
+    """
+    Build one synthetic corpus entry whose final semantic-model output is roughly target_bytes.
+
+    The steps mirror a typical Fabric run: schema lookup, SQL generation with a
+    JSON output, a JSON record list, and the semantic model markdown output.
+    """
+    rng = random.Random(seed)
+    records = [
+        {'crm_contact_lead_source': source, 'count': rng.randint(1, 900)}
+        for source in LEAD_SOURCES
+    ]
+    table = markdown_table(target_bytes, rng)
+    steps = [
+        run_step(0, [tool_call('trace.get_schema', {'tables': ['FactCRMContactOpportunity']},
+                               'FactCRMContactOpportunity: crm_contact_key, crm_contact_opportunity_key', 0)]),
+        run_step(1, [tool_call('trace.generate_sql', {'question': 'converted opportunities by lead source'},
+                               json.dumps({'generated_code': SAMPLE_SQL}), 1)]),
+        run_step(2, [tool_call('trace.execute_sql', {'query': SAMPLE_SQL}, json.dumps(records), 2)]),
+        run_step(3, [tool_call('trace.analyze_semantic_model', {'query': SAMPLE_SQL}, table, 3)]),
+    ]
+    preview = '\n'.join(table.split('\n')[:12])
+    assistant_text = (
+        "Here are the contact opportunities converted to transactions, grouped by lead source:\n\n"
+        f"{preview}\n\n"
+        "1. Lead Source: Zillow, Count: 412\n"
+        "2. Lead Source: Referral, Count: 388\n\n"
+        "Let me know if you would like a breakdown by month."
+    )
+    return {'name': name, 'steps': {'object': 'list', 'data': steps, 'has_more': False}, 'assistant_text': assistant_text}
+
+
+def synthetic_corpus(sizes=None):
+    """Build the synthetic corpus for the given size names (all sizes by default)."""
+    names = sizes or list(SIZES)
+    return [synthetic_entry(name, SIZES[name]) for name in names]
+
+
+def load_recorded(directory):
+    """Load recorded (and anonymized) corpus entries from *.json files in a directory."""
+    entries = []
+    if not directory or not os.path.isdir(directory):
+        return entries
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, file_name)) as f:
+            payload = json.load(f)
+        # Accept either a corpus entry or a raw steps.model_dump()
+        if 'steps' not in payload:
+            payload = {'steps': payload, 'assistant_text': ''}
+        payload.setdefault('name', os.path.splitext(file_name)[0])
+        payload.setdefault('assistant_text', '')
+        entries.append(payload)
+    return entries
+
+
+def _pseudonym(value, prefix):
+    """Stable placeholder for a sensitive value."""
+    return f"{prefix}_{hashlib.sha256(value.encode('utf-8')).hexdigest()[:8]}"
+
+
+def anonymize_text(text):
+    """
+    Replace data values while keeping the structure the extractors parse.
+
+    SQL string literals and markdown/pipe table cells become stable pseudonyms;
+    numbers, SQL keywords, identifiers and table separators are kept so payload
+    size and parsing cost stay representative.
+    """
+    text = re.sub(r"'([^'\n]{1,200})'", lambda m: "'" + _pseudonym(m.group(1), 'lit') + "'", text)
+
+    def scrub_row(line):
+        cells = line.split('|')
+        scrubbed = []
+        for cell in cells:
+            stripped = cell.strip()
+            if not stripped or set(stripped) <= set('-:') or stripped.startswith('[') or re.fullmatch(r'[\d.,$%-]+', stripped):
+                scrubbed.append(cell)
+            else:
+                scrubbed.append(' ' + _pseudonym(stripped, 'val') + ' ')
+        return '|'.join(scrubbed)
+
+    lines = text.split('\n')
+    for index, line in enumerate(lines):
+        # Keep header rows (first row of each table) so column names survive
+        previous = lines[index - 1] if index > 0 else ''
+        if line.count('|') >= 2 and previous.count('|') >= 2:
+            lines[index] = scrub_row(line)
+    return '\n'.join(lines)
+
+
+def anonymize_entry(entry):
+    """Anonymize every tool output and argument, and the assistant text, of a corpus entry."""
+    anonymized = json.loads(json.dumps(entry))
+    for step in anonymized['steps'].get('data', []):
+        for call in (step.get('step_details') or {}).get('tool_calls') or []:
+            function = call.get('function') or {}
+            for key in ('arguments', 'output'):
+                if isinstance(function.get(key), str):
+                    function[key] = anonymize_text(function[key])
+            if isinstance(call.get('output'), str):
+                call['output'] = anonymize_text(call['output'])
+    anonymized['assistant_text'] = anonymize_text(anonymized.get('assistant_text', ''))
+    return anonymized
+
+
+def main():
+    if len(sys.argv) != 4 or sys.argv[1] != 'anonymize':
+        print(__doc__)
+        return 1
+    with open(sys.argv[2]) as f:
+        payload = json.load(f)
+    if 'steps' not in payload:
+        payload = {'steps': payload, 'assistant_text': ''}
+    payload.setdefault('name', os.path.splitext(os.path.basename(sys.argv[3]))[0])
+    with open(sys.argv[3], 'w') as f:
+        json.dump(anonymize_entry(payload), f, indent=1)
+    print(f"Anonymized corpus entry written to {sys.argv[3]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
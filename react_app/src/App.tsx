@@ -203,7 +203,7 @@ function App() {
   React.useEffect(() => {
     pdfMake.vfs = pdfFonts.vfs;
   }, []);
-  const { setPrompt, responses, isLoading, setResponses } = useAI();
+  const { setPrompt, responses, isLoading, setResponses, progress } = useAI();
   const [showHistory, setShowHistory] = React.useState(false);
   const [previousPageContext, setPreviousPageContext] = React.useState<
     "default" | "results"
@@ -227,6 +227,24 @@ function App() {
     "Compiling results...",
   ];
 
+  // Live run progress replaces the cycling messages when VITE_WS_API_URL is set
+  const progressMessage = React.useMemo(() => {
+    if (!progress) return null;
+    if (progress.tableRows.length > 0)
+      return `Received ${progress.tableRows.length} rows...`;
+    if (progress.sqlQueries.length > 0)
+      return `Querying database (${progress.sqlQueries.length} ${
+        progress.sqlQueries.length === 1 ? "query" : "queries"
+      })...`;
+    if (progress.steps > 0)
+      return `Completed ${progress.steps} ${
+        progress.steps === 1 ? "step" : "steps"
+      }...`;
+    if (progress.status === "queued") return "Waiting for the data agent...";
+    if (progress.status === "in_progress") return "Analyzing your request...";
+    return null;
+  }, [progress]);
+
   // Cycle through loading messages
   React.useEffect(() => {
     if (isLoading) {
@@ -536,7 +554,7 @@ function App() {
                           <div
                             className={`helix-mb-3 helix-text-gray-600 helix-small ${styles.shimmerText}`}
                           >
-                            {loadingMessages[loadingMessageIndex]}
+                            {progressMessage ?? loadingMessages[loadingMessageIndex]}
                           </div>
                           <SkeletonBox
                             className='helix-mb-2'
@@ -565,7 +583,7 @@ function App() {
                           <div
                             className={`helix-mb-3 helix-text-gray-600 helix-small ${styles.shimmerText}`}
                           >
-                            {loadingMessages[loadingMessageIndex]}
+                            {progressMessage ?? loadingMessages[loadingMessageIndex]}
                           </div>
                           <SkeletonBox
                             className='helix-mb-2'
@@ -1,7 +1,8 @@
 /* eslint-disable @typescript-eslint/no-explicit-any */
 import { useState } from "react";
 import { AIContext } from "./context";
-import type { AIContextData, AIProviderProps } from "./types";
+import type { AIContextData, AIProviderProps, RunProgress } from "./types";
+import { askOverWebSocket } from "./runSocket";
 import {
   clientTransactions,
   transactionSigningCountResults,
@@ -15,6 +16,7 @@ export const AIProvider = ({ children }: AIProviderProps) => {
     Array<{ prompt: string; response: any; timestamp: Date }>
   >([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [progress, setProgress] = useState<RunProgress | null>(null);
   const [error, setError] = useState<string | null>(null);
   // History now tracks conversations as arrays of prompt/response pairs
   const [history, setHistory] = useState<
@@ -32,6 +34,7 @@ export const AIProvider = ({ children }: AIProviderProps) => {
     setResponse("");
     setResponses([]);
     setIsLoading(false);
+    setProgress(null);
     setError(null);
     // Do NOT clear history, so previous conversations are preserved
   };
@@ -40,28 +43,63 @@ export const AIProvider = ({ children }: AIProviderProps) => {
     setHistory((prev) => prev.filter((_, i) => i !== index));
   };
 
+  // Fold a run event from the WebSocket into the progress shown while loading
+  const handleRunEvent = (event: any) => {
+    setProgress((prev) => {
+      const current = prev ?? {
+        status: null,
+        steps: 0,
+        sqlQueries: [],
+        tableRows: [],
+      };
+      switch (event.type) {
+        case "status":
+          return { ...current, status: event.status };
+        case "step":
+          return { ...current, steps: current.steps + 1 };
+        case "sql":
+          return {
+            ...current,
+            sqlQueries: [...current.sqlQueries, ...event.queries],
+          };
+        case "table":
+          return { ...current, tableRows: [...current.tableRows, ...event.rows] };
+        default:
+          return current;
+      }
+    });
+  };
+
   // Function to fetch data from the API endpoint
   const fetchDataFromAPI = async (inputPrompt: string): Promise<any> => {
     try {
-      const apiUrl = import.meta.env.VITE_DETAILS_API_URL;
-      console.log("API URL:", apiUrl);
-      if (!apiUrl) {
-        throw new Error("API URL not configured");
-      }
+      let data: any;
+      const wsUrl = import.meta.env.VITE_WS_API_URL;
+      if (wsUrl) {
+        // Stream run progress over the WebSocket instead of one blocking request
+        console.log("WebSocket URL:", wsUrl);
+        data = await askOverWebSocket(wsUrl, inputPrompt, handleRunEvent);
+      } else {
+        const apiUrl = import.meta.env.VITE_DETAILS_API_URL;
+        console.log("API URL:", apiUrl);
+        if (!apiUrl) {
+          throw new Error("API URL not configured");
+        }
 
-      const response = await fetch(apiUrl, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ question: inputPrompt }),
-      });
+        const response = await fetch(apiUrl, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+          },
+          body: JSON.stringify({ question: inputPrompt }),
+        });
 
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
 
-      const data = await response.json();
+        data = await response.json();
+      }
       console.log("Raw API response:", data);
       
       // Try to parse the response and return the full JSON object
@@ -200,6 +238,7 @@ Please try one of the sample prompts for demo data, or this would connect to you
   const submitPrompt = async (inputPrompt: string) => {
     try {
       setIsLoading(true);
+      setProgress(null);
       setError(null);
       setPrompt(inputPrompt);
 
@@ -251,6 +290,7 @@ Please try one of the sample prompts for demo data, or this would connect to you
       setError(errorMessage);
     } finally {
       setIsLoading(false);
+      setProgress(null);
     }
   };
 
@@ -263,6 +303,7 @@ Please try one of the sample prompts for demo data, or this would connect to you
     setResponses,
     isLoading,
     setIsLoading,
+    progress,
     error,
     setError,
     history,
@@ -11,6 +11,7 @@ export const AIContext = createContext<AIContextData>({
   setResponses: () => null,
   isLoading: false,
   setIsLoading: () => null,
+  progress: null,
   error: null,
   setError: () => null,
   history: [],
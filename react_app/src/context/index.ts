@@ -1,4 +1,4 @@
 export { AIContext, AIConsumer } from "./context";
 export { AIProvider } from "./AIProvider";
 export { useAI } from "./useAI";
-export type { AIContextData, AIProviderProps } from "./types";
\ No newline at end of file
+export type { AIContextData, AIProviderProps, RunProgress } from "./types";
\ No newline at end of file
@@ -0,0 +1,59 @@
+/* eslint-disable @typescript-eslint/no-explicit-any */
+// One WebSocket to the Flask /ws endpoint is shared by every question; the
+// server tags each progress event with the id of the question it belongs to.
+type Listener = (message: any) => void;
+
+let socket: Promise<WebSocket> | null = null;
+const listeners = new Map<string, Listener>();
+let nextId = 0;
+
+const connect = (url: string): Promise<WebSocket> => {
+  if (!socket) {
+    socket = new Promise((resolve, reject) => {
+      const ws = new WebSocket(url);
+      ws.onopen = () => resolve(ws);
+      ws.onerror = () => reject(new Error("WebSocket connection failed"));
+      ws.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        listeners.get(message.id)?.(message);
+      };
+      ws.onclose = () => {
+        socket = null;
+        listeners.forEach((listener) =>
+          listener({ type: "error", error: "WebSocket connection closed" })
+        );
+        listeners.clear();
+      };
+    });
+    socket.catch(() => {
+      socket = null;
+    });
+  }
+  return socket;
+};
+
+// Ask a question over the shared WebSocket. onEvent receives the status, step,
+// sql and table events of the run; the promise resolves with the same body
+// /run-details returns.
+export const askOverWebSocket = async (
+  url: string,
+  question: string,
+  onEvent: Listener
+): Promise<any> => {
+  const ws = await connect(url);
+  const id = `q${++nextId}`;
+  return new Promise((resolve, reject) => {
+    listeners.set(id, (message) => {
+      if (message.type === "result") {
+        listeners.delete(id);
+        resolve(message.result);
+      } else if (message.type === "error" || message.type === "cancelled") {
+        listeners.delete(id);
+        reject(new Error(message.error));
+      } else {
+        onEvent(message);
+      }
+    });
+    ws.send(JSON.stringify({ type: "ask", id, question }));
+  });
+};
@@ -1,6 +1,14 @@
 /* eslint-disable @typescript-eslint/no-explicit-any */
 import type { Dispatch, SetStateAction, ReactNode } from "react";
 
+// Live progress of the current run, streamed over the WebSocket
+export interface RunProgress {
+  status: string | null;
+  steps: number;
+  sqlQueries: string[];
+  tableRows: Array<Record<string, string>>;
+}
+
 export interface AIContextData {
   prompt: string;
   setPrompt: Dispatch<SetStateAction<string>>;
@@ -12,6 +20,7 @@ export interface AIContextData {
   >;
   isLoading: boolean;
   setIsLoading: Dispatch<SetStateAction<boolean>>;
+  progress: RunProgress | null;
   error: string | null;
   setError: Dispatch<SetStateAction<string | null>>;
     history: Array<{ conversation: Array<{ prompt: string; response: string; timestamp: Date }> }>;
@@ -1,5 +1,5 @@
 import { PageWrapper } from "@components/page-wrapper";
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { AGGridHelix } from "@helix/ag-grid";
 import { HelixIcon } from "@helix/helix-icon";
 import { arrow_left } from "@helix/helix-icon/outlined";
@@ -25,7 +25,84 @@ function Queries() {
   const [currentQueryLabel, setCurrentQueryLabel] =
     useState<string>("Queries Page"); // Track the current title
 
+  // Results fetched ahead of time by prefetchQueries, keyed by alias
+  // eslint-disable-next-line @typescript-eslint/no-explicit-any
+  const prefetched = useRef<Record<string, any>>({});
+
+  // eslint-disable-next-line @typescript-eslint/no-explicit-any
+  const showQueryResult = (data: any, queryLabel: string) => {
+    setQueryDetails(data);
+
+    if (data.success) {
+      // Transform the data into AGGridHelix-compatible format
+      const columnDefs = data.columns.map((col: string) => ({
+        headerName: col
+          .replace(/_/g, " ")
+          .replace(/\b\w/g, (char: string) => char.toUpperCase()),
+        field: col,
+        sortable: true,
+        resizable: true,
+        flex: 1,
+      }));
+
+      setGridData({
+        columnDefs,
+        rowData: data.data_table,
+      });
+      setShowGrid(true); // Show the grid
+      setCurrentQueryLabel(queryLabel); // Update the title to the query label
+    }
+  };
+
+  // Run every alias in one /execute-queries request; each result is kept as
+  // soon as its line of the NDJSON stream arrives
+  const prefetchQueries = async (aliases: string[]) => {
+    try {
+      const response = await fetch(
+        `http://localhost:${API_PORT}/execute-queries?stream=1`,
+        {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+          },
+          body: JSON.stringify({ queries: aliases }),
+        }
+      );
+      if (!response.ok || !response.body) {
+        return;
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop() || "";
+        lines
+          .filter((line) => line.trim())
+          .forEach((line) => {
+            const result = JSON.parse(line);
+            if (result.success) {
+              prefetched.current[result.query_alias] = result;
+            }
+          });
+      }
+    } catch {
+      // Prefetching is best effort; Load Query fetches the alias on its own
+    }
+  };
+
   const fetchQueryDetails = async (queryAlias: string, queryLabel: string) => {
+    if (prefetched.current[queryAlias]) {
+      showQueryResult(prefetched.current[queryAlias], queryLabel);
+      return;
+    }
+
     setLoading(true); // Set loading to true when fetching starts
     try {
       const response = await fetch(
@@ -44,27 +121,7 @@ function Queries() {
       }
 
       const data = await response.json();
-      setQueryDetails(data);
-
-      if (data.success) {
-        // Transform the data into AGGridHelix-compatible format
-        const columnDefs = data.columns.map((col: string) => ({
-          headerName: col
-            .replace(/_/g, " ")
-            .replace(/\b\w/g, (char: string) => char.toUpperCase()),
-          field: col,
-          sortable: true,
-          resizable: true,
-          flex: 1,
-        }));
-
-        setGridData({
-          columnDefs,
-          rowData: data.data_table,
-        });
-        setShowGrid(true); // Show the grid
-        setCurrentQueryLabel(queryLabel); // Update the title to the query label
-      }
+      showQueryResult(data, queryLabel);
     } catch (err) {
       if (err instanceof Error) {
         setError(err.message);
@@ -94,6 +151,7 @@ function Queries() {
 
       const data = await response.json();
       setQueries(data.available_queries);
+      prefetchQueries(Object.keys(data.available_queries));
     } catch (err) {
       if (err instanceof Error) {
         setError(err.message);